@@ -2,12 +2,39 @@
 Módulo de Análise de Hipóteses de Escrita com Inteligência Artificial
 Este módulo usa o Google Gemini para analisar a escrita de crianças
 e classificar a hipótese de escrita segundo a psicogênese da língua escrita.
+
+Uso com várias threads (perfil gthread do gunicorn): o estado de módulo é só
+leitura depois da importação (chave, modelos, prompt e limites); cada chamada
+cria o seu próprio pool de threads. Os GenerativeModel ficam num registro por
+processo, criado sob lock, e o cliente gRPC que eles usam é seguro entre
+threads. O estado compartilhado dos módulos auxiliares também é protegido:
+cache_analises e dedup_imagens usam locks e uma conexão SQLite por thread, e
+silabas usa lru_cache, que é seguro entre threads.
 """
 
 import os
+import re
+import unicodedata
 import google.generativeai as genai
-from PIL import Image
+from google.generativeai import caching
 import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import backends
+import cache_analises
+import metricas
+import registro
+import resiliencia
+import triagem
+import silabas
+from hipoteses import HIPOTESES
+from preprocessamento import preprocessar_imagem
+
+logger = registro.obter_logger(__name__)
 
 # Configura o Gemini com a chave da API
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
@@ -17,12 +44,98 @@ if GEMINI_API_KEY:
     try:
         genai.configure(api_key=GEMINI_API_KEY)
         GEMINI_DISPONIVEL = True
-        print("[INFO] Gemini configurado com sucesso")
+        logger.info("Gemini configurado com sucesso")
     except Exception as e:
-        print(f"[WARN] Erro ao configurar Gemini: {str(e)}")
+        logger.warning("Erro ao configurar Gemini", extra={'erro': str(e)})
         GEMINI_DISPONIVEL = False
 else:
-    print("[WARN] GEMINI_API_KEY não configurada. Sistema usará modo de simulação.")
+    logger.warning("GEMINI_API_KEY não configurada. Sistema usará modo de simulação.")
+
+# Modelo do Gemini usado nas análises
+MODELO_GEMINI = os.environ.get('GEMINI_MODELO', 'gemini-2.5-flash')
+
+# Modelos de cada tipo de chamada: leitura da imagem e classificação do texto
+MODELO_GEMINI_VISAO = os.environ.get('GEMINI_MODELO_VISAO', MODELO_GEMINI)
+MODELO_GEMINI_TEXTO = os.environ.get('GEMINI_MODELO_TEXTO', MODELO_GEMINI)
+
+# Faz uma chamada leve ao Gemini ao iniciar o worker, para abrir a conexão antes do primeiro pedido
+GEMINI_AQUECER = os.environ.get('GEMINI_AQUECER', '1') == '1'
+
+# Guarda as instruções de sistema como contexto em cache no Gemini (CachedContent).
+# O Gemini só aceita cache acima de um tamanho mínimo de contexto (cerca de 1024 tokens
+# no gemini-2.5-flash); se a criação falhar, as instruções vão como system_instruction.
+GEMINI_CONTEXTO_CACHE = os.environ.get('GEMINI_CONTEXTO_CACHE', '0') == '1'
+GEMINI_CONTEXTO_TTL = int(os.environ.get('GEMINI_CONTEXTO_TTL', '3600'))
+
+# Registro de modelos deste processo ((nome, instruções) -> (GenerativeModel, expira_em))
+_modelos = {}
+_modelos_lock = threading.Lock()
+_modelos_pid = {"pid": None}
+
+# Número máximo de palavras analisadas em paralelo (chamadas simultâneas ao Gemini)
+MAX_CONCORRENCIA = int(os.environ.get('ANALISE_MAX_CONCORRENCIA', '4'))
+
+# Limite de chamadas à IA (Gemini ou outro backend) em andamento ao mesmo tempo neste processo,
+# somando todas as requisições (inclusive as análises de turma inteira)
+GEMINI_MAX_CHAMADAS = int(os.environ.get('GEMINI_MAX_CHAMADAS', '16'))
+_chamadas_gemini = threading.BoundedSemaphore(GEMINI_MAX_CHAMADAS)
+
+# Tempo limite de cada tentativa de chamada ao Gemini (as novas tentativas ficam em resiliencia.py)
+GEMINI_TEMPO_LIMITE = float(os.environ.get('GEMINI_TEMPO_LIMITE', '45'))
+
+# Registro de tokens da análise em andamento (lista de chamadas, ou None)
+_uso_de_tokens = contextvars.ContextVar('uso_de_tokens', default=None)
+
+# Modo em lote: todas as palavras de um ditado são classificadas em uma única chamada
+MODO_LOTE = os.environ.get('ANALISE_MODO_LOTE', '0') == '1'
+
+# Número máximo de pares (palavra, escrita) enviados em cada chamada do modo em lote
+LOTE_MAX_PARES = int(os.environ.get('ANALISE_LOTE_MAX_PARES', '20'))
+
+# Pede ao Gemini a resposta em JSON seguindo um esquema (hipótese restrita às cinco válidas)
+GEMINI_SAIDA_ESTRUTURADA = os.environ.get('GEMINI_SAIDA_ESTRUTURADA', '1') == '1'
+
+_HIPOTESE_ESQUEMA = {"type": "string", "format": "enum", "enum": HIPOTESES}
+
+ESQUEMA_CLASSIFICACAO = {
+    "type": "object",
+    "properties": {
+        "hipotese": _HIPOTESE_ESQUEMA,
+        "justificativa": {"type": "string"},
+    },
+    "required": ["hipotese", "justificativa"],
+}
+
+ESQUEMA_VISAO = {
+    "type": "object",
+    "properties": {
+        "transcricao": {"type": "string"},
+        "hipotese": _HIPOTESE_ESQUEMA,
+        "justificativa": {"type": "string"},
+    },
+    "required": ["transcricao", "hipotese", "justificativa"],
+}
+
+ESQUEMA_LOTE = {
+    "type": "object",
+    "properties": {
+        "analises_individuais": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "item": {"type": "integer"},
+                    "hipotese": _HIPOTESE_ESQUEMA,
+                    "justificativa": {"type": "string"},
+                },
+                "required": ["item", "hipotese", "justificativa"],
+            },
+        },
+        "hipotese": _HIPOTESE_ESQUEMA,
+        "justificativa": {"type": "string"},
+    },
+    "required": ["analises_individuais", "hipotese", "justificativa"],
+}
 
 # Prompt de sistema que ensina a IA sobre as hipóteses de escrita
 SYSTEM_PROMPT = """Você é um especialista em alfabetização e psicogênese da língua escrita, baseado nos estudos de Emilia Ferreiro e Ana Teberosky. Sua função é analisar a escrita de crianças em processo de alfabetização e classificá-las nas seguintes hipóteses de escrita:
@@ -62,7 +175,8 @@ SYSTEM_PROMPT = """Você é um especialista em alfabetização e psicogênese da
 Quando receber uma palavra ditada e o que a criança escreveu, você deve:
 1. Analisar a relação entre a escrita e a palavra ditada
 2. Identificar padrões (letras por sílaba, correspondência sonora, etc.)
-3. Classificar na hipótese ma4. Justifique pedagogicamente sua classificação. **A justificativa deve ser sucinta, clara e fácil de entender, mesmo para pessoas leigas no assunto.**
+3. Classificar na hipótese mais adequada
+4. Justificar pedagogicamente sua classificação. **A justificativa deve ser sucinta, clara e fácil de entender, mesmo para pessoas leigas no assunto.**
 
 Responda SEMPRE no formato JSON:
 {
@@ -71,80 +185,400 @@ Responda SEMPRE no formato JSON:
 }
 """
 
+# Versão curta das instruções, para a classificação de uma única palavra já transcrita
+SYSTEM_PROMPT_COMPACTO = """Classifique a escrita de uma criança em alfabetização segundo a psicogênese da língua escrita (Emilia Ferreiro e Ana Teberosky), em uma destas hipóteses:
+- Pré-Silábico: letras sem relação com os sons da palavra (CAVALO → XPTO, AAAA)
+- Silábico sem valor sonoro: uma letra por sílaba, sem relação com os sons (CAVALO → XPT)
+- Silábico com valor sonoro: uma letra por sílaba, com relação com os sons (CAVALO → AO, CAO, CVO)
+- Silábico-Alfabético: ora uma letra por sílaba, ora a sílaba completa (CAVALO → CVLO, CAVLO)
+- Alfabético: todos os sons representados, mesmo com erros ortográficos (CAVALO → CAVALO, KAVALU)
+A justificativa deve ser sucinta e fácil de entender, mesmo para leigos.
+Responda SEMPRE em JSON: {"hipotese": "Nome da Hipótese", "justificativa": "Explicação sucinta"}
+"""
+
+# Usa a versão curta das instruções na classificação de cada palavra (menos tokens por chamada)
+PROMPT_COMPACTO = os.environ.get('ANALISE_PROMPT_COMPACTO', '0') == '1'
+
+
+def _criar_modelo(nome: str, instrucoes: str) -> tuple:
+    """
+    Cria o GenerativeModel com as instruções de sistema, em cache no Gemini se
+    GEMINI_CONTEXTO_CACHE estiver ativo.
+    
+    Returns:
+        tuple: (modelo, expira_em), com expira_em None quando não há contexto em cache
+    """
+    if GEMINI_CONTEXTO_CACHE and instrucoes:
+        try:
+            contexto = caching.CachedContent.create(
+                model=nome if nome.startswith('models/') else f'models/{nome}',
+                system_instruction=instrucoes,
+                ttl=timedelta(seconds=GEMINI_CONTEXTO_TTL),
+            )
+            logger.info("Instruções do modelo guardadas em cache no Gemini", extra={'modelo': nome})
+            return genai.GenerativeModel.from_cached_content(contexto), time.time() + GEMINI_CONTEXTO_TTL
+        except Exception as e:
+            logger.warning("Contexto em cache indisponível, usando system_instruction", extra={'modelo': nome, 'erro': str(e)})
+    
+    return genai.GenerativeModel(nome, system_instruction=instrucoes), None
+
+
+def obter_modelo(nome: str, instrucoes: str = None):
+    """
+    Retorna o GenerativeModel do nome e das instruções de sistema informados,
+    criado uma única vez por processo. As instruções vão em system_instruction,
+    fora do texto de cada chamada.
+    
+    Após um fork, o registro herdado do processo pai é descartado: conexões gRPC
+    não podem ser compartilhadas entre processos. Modelos com contexto em cache
+    são recriados pouco antes de o cache expirar.
+    """
+    chave = (nome, instrucoes)
+    with _modelos_lock:
+        if _modelos_pid["pid"] != os.getpid():
+            _modelos.clear()
+            _modelos_pid["pid"] = os.getpid()
+        registrado = _modelos.get(chave)
+        if registrado is None or (registrado[1] is not None and registrado[1] - time.time() < 60):
+            registrado = _criar_modelo(nome, instrucoes)
+            _modelos[chave] = registrado
+        return registrado[0]
+
+
+def iniciar_modelos(aquecer: bool = None):
+    """
+    Cria os modelos deste processo e, opcionalmente, abre a conexão com o Gemini.
+    Chamada pelo gunicorn logo após o fork de cada worker (post_fork), para que
+    o primeiro pedido não pague a criação do canal e a autenticação.
+    
+    O aquecimento usa count_tokens, que não gera conteúdo nem consome a cota de geração.
+    """
+    if not GEMINI_DISPONIVEL:
+        return
+    
+    modelos = {
+        (MODELO_GEMINI_VISAO, SYSTEM_PROMPT),
+        (MODELO_GEMINI_TEXTO, SYSTEM_PROMPT),
+        (MODELO_GEMINI_TEXTO, _instrucoes_classificacao()),
+    }
+    for nome, instrucoes in modelos:
+        modelo = obter_modelo(nome, instrucoes)
+        if GEMINI_AQUECER if aquecer is None else aquecer:
+            try:
+                modelo.count_tokens("ok")
+                logger.info("Conexão com o modelo aquecida", extra={'modelo': nome, 'pid': os.getpid()})
+            except Exception as e:
+                logger.warning("Não foi possível aquecer o modelo", extra={'modelo': nome, 'erro': str(e)})
+
+
+def _instrucoes_classificacao() -> str:
+    """Instruções de sistema usadas na classificação de cada palavra."""
+    return SYSTEM_PROMPT_COMPACTO if PROMPT_COMPACTO else SYSTEM_PROMPT
+
+
+@contextmanager
+def registrar_uso_de_tokens():
+    """
+    Registra os tokens de cada chamada ao Gemini feita dentro do bloco, inclusive
+    nas threads das análises em paralelo.
+    
+    Uso:
+        with registrar_uso_de_tokens() as chamadas:
+            ...
+        resumo = resumir_uso_de_tokens(chamadas)
+    """
+    chamadas = []
+    token = _uso_de_tokens.set(chamadas)
+    try:
+        yield chamadas
+    finally:
+        _uso_de_tokens.reset(token)
+
+
+def resumir_uso_de_tokens(chamadas: list) -> dict:
+    """Soma os tokens de entrada, saída e em cache das chamadas registradas."""
+    return {
+        'chamadas': chamadas,
+        'total_chamadas': len(chamadas),
+        'tokens_entrada': sum(c['tokens_entrada'] for c in chamadas),
+        'tokens_saida': sum(c['tokens_saida'] for c in chamadas),
+        'tokens_em_cache': sum(c['tokens_em_cache'] for c in chamadas),
+    }
+
+
+def _no_contexto_atual(funcao):
+    """Executa a função em outra thread levando o registro de tokens desta."""
+    contexto = contextvars.copy_context()
+    return lambda *args: contexto.run(funcao, *args)
+
+
+# Backends de IA que o roteador pode usar (os ativos vêm de ANALISE_BACKENDS)
+backends.registrar(backends.BackendGemini(
+    obter_modelo=obter_modelo,
+    modelo_texto=MODELO_GEMINI_TEXTO,
+    modelo_visao=MODELO_GEMINI_VISAO,
+    chamadas_simultaneas=_chamadas_gemini,
+    tempo_limite=GEMINI_TEMPO_LIMITE,
+    saida_estruturada=GEMINI_SAIDA_ESTRUTURADA,
+    configurado=lambda: GEMINI_DISPONIVEL,
+    disjuntor=resiliencia.disjuntor_gemini,
+))
+backends.registrar(backends.BackendOpenAI(chamadas_simultaneas=_chamadas_gemini, tempo_limite=GEMINI_TEMPO_LIMITE))
+backends.registrar(backends.BackendLocal(HIPOTESES))
+
+
+def _gerar_conteudo(instrucoes: str, conteudo, etapa: str, esquema: dict = None):
+    """
+    Envia a chamada ao backend de IA escolhido pelo roteador (ver backends.py)
+    e registra os tokens usados, se houver um registro ativo.
+    
+    Com um esquema, a resposta vem em JSON seguindo o esquema, sem texto ou
+    blocos de código em volta (no Gemini, com GEMINI_SAIDA_ESTRUTURADA ativo).
+    
+    Erros passageiros são tentados de novo ou levam ao próximo backend (ver
+    resiliencia.py); se nenhum responder, lança resiliencia.GeminiIndisponivel.
+    
+    Returns:
+        tuple: (nome do backend que respondeu, backends.RespostaBackend com texto, modelo e tokens)
+    """
+    inicio = time.perf_counter()
+    backend, resposta = backends.gerar(instrucoes, conteudo, etapa, esquema)
+    
+    chamada = {
+        'etapa': etapa,
+        'backend': backend,
+        'modelo': resposta.modelo,
+        'tokens_entrada': resposta.tokens_entrada,
+        'tokens_saida': resposta.tokens_saida,
+        'tokens_em_cache': resposta.tokens_em_cache,
+        'duracao_ms': round((time.perf_counter() - inicio) * 1000),
+    }
+    for tipo in ('entrada', 'saida', 'em_cache'):
+        metricas.contar('tokens_ia', chamada[f'tokens_{tipo}'], backend=backend, etapa=etapa, tipo=tipo)
+    
+    chamadas = _uso_de_tokens.get()
+    if chamadas is not None:
+        chamadas.append(chamada)
+    return backend, resposta
+
+
+_CERCAS_CODIGO = re.compile(r'```(?:json)?', re.IGNORECASE)
+_VIRGULA_ANTES_DE_FECHAR = re.compile(r',\s*([}\]])')
+_ASPAS_TIPOGRAFICAS = str.maketrans({'“': '"', '”': '"', '„': '"'})
 
-def analisar_escrita_com_imagem(palavras_ditadas: str, imagem_path: str) -> dict:
+# Contadores da leitura das respostas do Gemini neste processo
+_estatisticas_respostas = {"json_valido": 0, "json_reparado": 0, "falhas": 0}
+_estatisticas_respostas_lock = threading.Lock()
+
+
+def _contar_resposta(tipo: str):
+    with _estatisticas_respostas_lock:
+        _estatisticas_respostas[tipo] += 1
+    metricas.contar('respostas_gemini', tipo=tipo)
+
+
+def estatisticas_respostas() -> dict:
+    """Retorna quantas respostas do Gemini vieram em JSON válido, foram reparadas ou falharam."""
+    with _estatisticas_respostas_lock:
+        contadores = dict(_estatisticas_respostas)
+    total = sum(contadores.values())
+    contadores["total"] = total
+    contadores["taxa_falha"] = round(contadores["falhas"] / total, 4) if total else 0.0
+    return contadores
+
+
+def _sem_acentos(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+_HIPOTESES_NORMALIZADAS = {
+    re.sub(r'[^a-z]', '', _sem_acentos(h).lower()): h for h in HIPOTESES
+}
+
+
+def _normalizar_hipotese(hipotese):
+    """Corrige variações de grafia da hipótese ('silabico alfabetico' -> 'Silábico-Alfabético')."""
+    if not isinstance(hipotese, str):
+        return hipotese
+    chave = re.sub(r'[^a-z]', '', _sem_acentos(hipotese).lower())
+    return _HIPOTESES_NORMALIZADAS.get(chave, hipotese.strip())
+
+
+def _fechar_estruturas(texto: str) -> str:
+    """Completa uma resposta cortada: fecha a string aberta e as chaves e colchetes pendentes."""
+    pendentes = []
+    em_string = False
+    escape = False
+    for c in texto:
+        if em_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                em_string = False
+        elif c == '"':
+            em_string = True
+        elif c in '{[':
+            pendentes.append('}' if c == '{' else ']')
+        elif c in '}]' and pendentes:
+            pendentes.pop()
+    if em_string:
+        texto += '"'
+    return texto.rstrip().rstrip(',') + ''.join(reversed(pendentes))
+
+
+def _extrair_campos(texto: str) -> dict:
+    """Último recurso: lê os campos conhecidos direto do texto, mesmo fora de um JSON válido."""
+    campos = {}
+    for campo in ('transcricao', 'hipotese', 'justificativa'):
+        encontrado = re.search(r'["\']?%s["\']?\s*:\s*(["\'])((?:(?!\1)[^\\]|\\.)*)' % campo, texto)
+        if encontrado:
+            campos[campo] = encontrado.group(2).strip()
+    return campos
+
+
+@metricas.medir_funcao
+def _extrair_json(response_text: str) -> dict:
+    """
+    Extrai o objeto JSON da resposta do Gemini.
+    
+    Com a saída estruturada, a resposta já é JSON puro. Respostas com defeito
+    são reparadas localmente, sem nova chamada ao Gemini: blocos de código
+    markdown, texto fora das chaves, aspas tipográficas, vírgulas sobrando,
+    quebras de linha dentro de strings e respostas cortadas no meio.
+    
+    Raises:
+        ValueError: Se não for possível recuperar nem a hipótese
+    """
+    texto = (response_text or '').strip()
+    
+    try:
+        resultado = json.loads(texto)
+    except ValueError:
+        resultado = None
+    tipo = "json_valido"
+    
+    if not isinstance(resultado, dict):
+        tipo = "json_reparado"
+        # Remove os blocos de código e tudo que estiver antes da primeira chave
+        texto = _CERCAS_CODIGO.sub('', texto).translate(_ASPAS_TIPOGRAFICAS).strip()
+        inicio = texto.find('{')
+        if inicio >= 0:
+            texto = texto[inicio:]
+        
+        # Só corta o texto depois do último '}' se as chaves estiverem equilibradas até ali.
+        # Numa resposta cortada, o último '}' fecha um objeto interno (ex.: um item do lote)
+        # e o que vem depois ainda tem campos da resposta, que _fechar_estruturas completa.
+        fim = texto.rfind('}')
+        if fim >= 0 and _fechar_estruturas(texto[:fim + 1]) == texto[:fim + 1]:
+            texto = texto[:fim + 1]
+        
+        # Entre as leituras possíveis, vale a primeira que traz a hipótese
+        lidos = []
+        for candidato in (texto, _VIRGULA_ANTES_DE_FECHAR.sub(r'\1', texto)):
+            for reparo in (candidato, _fechar_estruturas(candidato)):
+                try:
+                    lido = json.loads(reparo, strict=False)
+                except ValueError:
+                    continue
+                if isinstance(lido, dict):
+                    lidos.append(lido)
+        resultado = next((lido for lido in lidos if lido.get("hipotese")), None)
+        if resultado is None:
+            resultado = lidos[0] if lidos else _extrair_campos(texto)
+    
+    if not isinstance(resultado, dict) or not resultado.get("hipotese"):
+        _contar_resposta("falhas")
+        logger.warning("Resposta do Gemini ilegível", extra={'resposta': response_text})
+        raise ValueError("Invalid JSON: não foi possível ler a resposta do Gemini")
+    
+    _contar_resposta(tipo)
+    resultado["hipotese"] = _normalizar_hipotese(resultado["hipotese"])
+    for item in resultado.get("analises_individuais") or []:
+        if isinstance(item, dict):
+            item["hipotese"] = _normalizar_hipotese(item.get("hipotese"))
+    return resultado
+
+
+@metricas.medir_funcao
+def analisar_escrita_com_imagem(palavras_ditadas: str, imagem) -> dict:
     """
     Analisa a escrita da criança diretamente da imagem usando Gemini Vision.
     
     Args:
         palavras_ditadas: As palavras/frase que foram ditadas para a criança
-        imagem_path: Caminho para a imagem da escrita
+        imagem: A imagem da escrita, em bytes (ou caminho/objeto com read())
     
     Returns:
-        dict: Dicionário com 'transcricao', 'hipotese' e 'justificativa'
+        dict: Dicionário com 'transcricao', 'hipotese', 'justificativa' e o
+              relatório do pré-processamento da imagem ('preprocessamento')
     """
     
-    # Verifica se o Gemini está disponível
-    if not GEMINI_DISPONIVEL:
+    # Verifica se há um backend de IA que leia imagens (o Gemini, por padrão)
+    if not backends.ativos(com_imagem=True):
         return {
             "transcricao": "",
             "hipotese": "Erro na Análise",
             "justificativa": "Gemini não está configurado. Configure a variável GEMINI_API_KEY no Render.com."
         }
     
+    # Reduz e recodifica a foto antes do envio
     try:
-        # Carrega a imagem
-        img = Image.open(imagem_path)
-        
-        # Cria o modelo Gemini com visão
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        with metricas.medir_etapa('preprocessamento_imagem'):
+            dados_imagem, mime_type, relatorio = preprocessar_imagem(imagem)
+    except ValueError as e:
+        logger.warning("Imagem recusada no pré-processamento", extra={'erro': str(e)})
+        return {
+            "transcricao": "",
+            "hipotese": "Erro na Análise",
+            "justificativa": f"Não foi possível processar a imagem enviada. {str(e)}"
+        }
+    
+    logger.info("Imagem pré-processada", extra={
+        'bytes_originais': relatorio['bytes_originais'],
+        'bytes_finais': relatorio['bytes_finais'],
+        'bytes_economizados': relatorio['bytes_economizados'],
+    })
+    
+    try:
+        img = {"mime_type": mime_type, "data": dados_imagem}
         
-        # Prepara o prompt completo
-        prompt = f"""{SYSTEM_PROMPT}
-
-Analise a imagem da escrita da criança e faça o seguinte:
+        # Prepara o prompt da tarefa
+        prompt = f"""Analise a imagem da escrita da criança e faça o seguinte:
 
 1. **Transcreva** exatamente o que a criança escreveu na imagem
 2. **Compare** com as palavras ditadas: {palavras_ditadas}
-3. **Classifique** a hipótese de escrita
-4. **4. Justifique pedagogicamente sua classificação. **A justificativa deve ser sucinta, clara e fácil de entender, mesmo para pessoas leigas no assunto.**
+   (divisão silábica: {silabas.descrever_ditado(palavras_ditadas.replace(',', ' '))})
+3. **Classifique** a hipótese de escrita e justifique
 
-Responda no formato JSON:
-{{
-  "transcricao": "O que você leu na imagem",
-  "hipotese": "Nome da Hipótese",
-  "justificativa": "Explicação pedagógica sucinta e acessível"
-}}"""
+Responda no formato JSON, incluindo a transcrição:
+{{"transcricao": "O que você leu na imagem", "hipotese": "Nome da Hipótese", "justificativa": "Explicação"}}"""
         
         # Envia para o Gemini
-        response = model.generate_content([prompt, img])
+        _, response = _gerar_conteudo(SYSTEM_PROMPT, [prompt, img], 'visao', ESQUEMA_VISAO)
         
         # Extrai o JSON da resposta
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks se existirem e limpa o texto antes de decodificar JSON
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
-            
-        # Tenta encontrar o primeiro e último { } para garantir que só o JSON seja decodificado
-        try:
-            json_start = response_text.index('{')
-            json_end = response_text.rindex('}') + 1
-            response_text = response_text[json_start:json_end]
-        except ValueError:
-            # Se não encontrar chaves, tenta decodificar o texto inteiro e lança erro se falhar
-            pass
-            
-        resultado = json.loads(response_text)
+        resultado = _extrair_json(response.texto)
+        resultado["preprocessamento"] = relatorio
         
         return resultado
     
+    except resiliencia.GeminiIndisponivel as e:
+        logger.error("Gemini Vision indisponível", extra={'erro': str(e)})
+        return {
+            "transcricao": "",
+            "hipotese": "Erro na Análise",
+            "justificativa": "O serviço de IA está temporariamente indisponível. Tente novamente em instantes.",
+            "indisponivel": True
+        }
+    
     except Exception as e:
         # Em caso de erro, retorna uma resposta padrão
         error_msg = str(e)
-        print(f"[ERROR] Erro no Gemini Vision: {error_msg}")
+        logger.error("Erro no Gemini Vision", extra={'erro': error_msg})
+        metricas.contar('fallbacks', tipo='erro_visao')
         
         # Se for erro de autenticação, retorna mensagem clara
         if "API key" in error_msg or "authentication" in error_msg.lower():
@@ -161,6 +595,56 @@ Responda no formato JSON:
         }
 
 
+def _chave_cache(palavra_ditada: str, escrita_crianca: str, backend) -> str:
+    modelo = f'{backend.nome}/{backend.modelo_texto}'
+    return cache_analises.gerar_chave(palavra_ditada, escrita_crianca, _instrucoes_classificacao(), modelo)
+
+
+def _classificar_sem_modelo(palavra_ditada: str, escrita_crianca: str):
+    """
+    Classifica o par sem chamar o Gemini, quando possível: escrita vazia,
+    triagem local (casos evidentes) ou resultado já guardado no cache.
+    
+    Returns:
+        dict ou None: 'hipotese' e 'justificativa', ou None se o par precisar do modelo
+    """
+    # Se não houver escrita, retorna pré-silábico por padrão
+    if not escrita_crianca or escrita_crianca.strip() == "":
+        return {
+            "hipotese": "Pré-Silábico",
+            "justificativa": "Não foi possível identificar escrita na imagem."
+        }
+    
+    # Casos evidentes são classificados localmente
+    resultado_local = triagem.triar(palavra_ditada, escrita_crianca)
+    if resultado_local is not None:
+        return resultado_local
+    
+    # Pares já classificados por um dos backends principais ativos voltam direto do cache
+    for backend in backends.ativos():
+        if not backend.reserva:
+            em_cache = cache_analises.obter(_chave_cache(palavra_ditada, escrita_crianca, backend))
+            if em_cache is not None:
+                return em_cache
+    return None
+
+
+def _guardar_no_cache(palavra_ditada: str, escrita_crianca: str, resultado: dict, nome_backend: str):
+    """
+    Guarda a classificação do par no cache, sob o modelo que respondeu. Só entram
+    classificações válidas; respostas de backends de reserva (o stub local) não entram.
+    """
+    backend = backends.obter(nome_backend)
+    if backend is None or backend.reserva:
+        return
+    if resultado.get("hipotese") in HIPOTESES:
+        cache_analises.guardar(_chave_cache(palavra_ditada, escrita_crianca, backend), {
+            "hipotese": resultado["hipotese"],
+            "justificativa": resultado.get("justificativa", ""),
+        })
+
+
+@metricas.medir_funcao
 def analisar_escrita(palavra_ditada: str, escrita_crianca: str) -> dict:
     """
     Analisa a escrita da criança (quando já temos a transcrição).
@@ -173,81 +657,83 @@ def analisar_escrita(palavra_ditada: str, escrita_crianca: str) -> dict:
         dict: Dicionário com 'hipotese' e 'justificativa'
     """
     
-    # Se não houver escrita, retorna pré-silábico por padrão
-    if not escrita_crianca or escrita_crianca.strip() == "":
-        return {
-            "hipotese": "Pré-Silábico",
-            "justificativa": "Não foi possível identificar escrita na imagem."
-        }
+    # Escrita vazia, casos evidentes e pares já classificados dispensam o Gemini
+    resultado_sem_modelo = _classificar_sem_modelo(palavra_ditada, escrita_crianca)
+    if resultado_sem_modelo is not None:
+        return resultado_sem_modelo
     
-    # Verifica se o Gemini está disponível
-    if not GEMINI_DISPONIVEL:
+    # Verifica se há um backend de IA disponível (o Gemini, por padrão)
+    if not backends.ativos():
         return {
             "hipotese": "Erro na Análise",
             "justificativa": "Gemini não está configurado. Configure a variável GEMINI_API_KEY."
         }
     
     try:
-        # Cria o modelo Gemini
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Prepara o prompt
-        prompt = f"""{SYSTEM_PROMPT}
-
-Analise a seguinte escrita:
-
-Palavra ditada: {palavra_ditada.upper()}
-Escrita da criança: {escrita_crianca.upper()}
-
-Classifique a hipótese de escrita e justifique. **A justificativa deve ser sucinta, clara e fácil de entender, mesmo para pessoas leigas no assunto.**
-
-Responda no formato JSON:
-{{
-  "hipotese": "Nome da Hipótese",
-  "justificativa": "Explicação pedagógica sucinta e acessível"
-}}
-"""
+        # Prepara o prompt: só os dados desta escrita
+        prompt = f"""Palavra ditada: {palavra_ditada.upper()}
+Divisão silábica da palavra ditada: {silabas.descrever_ditado(palavra_ditada)}
+Escrita da criança: {escrita_crianca.upper()}"""
         
         # Envia para o Gemini
-        response = model.generate_content(prompt)
+        backend, response = _gerar_conteudo(_instrucoes_classificacao(), prompt, 'classificacao', ESQUEMA_CLASSIFICACAO)
         
         # Extrai o JSON da resposta
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks se existirem e limpa o texto antes de decodificar JSON
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
-            
-        # Tenta encontrar o primeiro e último { } para garantir que só o JSON seja decodificado
-        try:
-            json_start = response_text.index('{')
-            json_end = response_text.rindex('}') + 1
-            response_text = response_text[json_start:json_end]
-        except ValueError:
-            # Se não encontrar chaves, tenta decodificar o texto inteiro e lança erro se falhar
-            pass
-            
-        resultado = json.loads(response_text)
+        resultado = _extrair_json(response.texto)
+        _guardar_no_cache(palavra_ditada, escrita_crianca, resultado, backend)
         
         return resultado
     
     except Exception as e:
         # Em caso de erro, retorna uma resposta padrão
+        metricas.contar('fallbacks', tipo='erro_classificacao')
         return {
             "hipotese": "Erro na Análise",
             "justificativa": f"Ocorreu um erro ao processar a análise: {str(e)}"
         }
 
 
-def analisar_multiplas_palavras(palavras_ditadas: list, escritas: list) -> dict:
+def _analisar_par(palavra: str, escrita: str) -> dict:
+    """
+    Analisa um par (palavra ditada, escrita) isolando falhas.
+    
+    Uma exceção em uma palavra não deve cancelar a análise das demais,
+    então qualquer erro vira um resultado "Erro na Análise" para esse par.
+    """
+    try:
+        resultado = analisar_escrita(palavra, escrita)
+        hipotese = resultado["hipotese"]
+        # A resposta reparada pode vir sem a justificativa (ex.: cortada logo depois da hipótese)
+        justificativa = resultado.get("justificativa", "")
+    except Exception as e:
+        logger.error("Erro ao analisar a palavra", extra={'palavra': palavra, 'erro': str(e)})
+        hipotese = "Erro na Análise"
+        justificativa = f"Ocorreu um erro ao processar a análise: {str(e)[:200]}"
+    
+    return {
+        "palavra": palavra,
+        "escrita": escrita,
+        "hipotese": hipotese,
+        "justificativa": justificativa
+    }
+
+
+@metricas.medir_funcao
+def analisar_multiplas_palavras(palavras_ditadas: list, escritas: list, max_concorrencia: int = None,
+                                ao_concluir=None) -> dict:
     """
     Analisa múltiplas palavras e retorna uma classificação geral.
     
+    As análises individuais são feitas em paralelo, limitadas por
+    max_concorrencia (padrão: ANALISE_MAX_CONCORRENCIA), de modo que o tempo
+    total acompanha a chamada mais lenta e não a soma de todas.
+    
     Args:
         palavras_ditadas: Lista de palavras ditadas
         escritas: Lista das escritas correspondentes
+        max_concorrencia: Número máximo de análises simultâneas
+        ao_concluir: Função opcional (índice, análise) chamada assim que cada palavra
+                     fica pronta, na thread de quem chamou, antes da síntese geral
     
     Returns:
         dict: Dicionário com 'hipotese' geral, 'justificativa' e 'analises_individuais'
@@ -259,19 +745,29 @@ def analisar_multiplas_palavras(palavras_ditadas: list, escritas: list) -> dict:
             "justificativa": "Número de palavras ditadas e escritas não correspondem."
         }
     
-    # Analisa cada palavra individualmente
-    analises = []
-    for palavra, escrita in zip(palavras_ditadas, escritas):
-        resultado = analisar_escrita(palavra, escrita)
-        analises.append({
-            "palavra": palavra,
-            "escrita": escrita,
-            "hipotese": resultado["hipotese"],
-            "justificativa": resultado["justificativa"]
-        })
+    # Analisa cada palavra individualmente, em paralelo.
+    # Cada análise volta para a posição original da palavra na lista.
+    pares = list(zip(palavras_ditadas, escritas))
+    limite = max(1, min(max_concorrencia or MAX_CONCORRENCIA, len(pares) or 1))
+    analises = [None] * len(pares)
+    
+    if limite == 1:
+        for indice, (palavra, escrita) in enumerate(pares):
+            analises[indice] = _analisar_par(palavra, escrita)
+            if ao_concluir:
+                ao_concluir(indice, analises[indice])
+    else:
+        with ThreadPoolExecutor(max_workers=limite) as executor:
+            futuros = {executor.submit(_no_contexto_atual(_analisar_par), palavra, escrita): indice
+                       for indice, (palavra, escrita) in enumerate(pares)}
+            for futuro in as_completed(futuros):
+                indice = futuros[futuro]
+                analises[indice] = futuro.result()
+                if ao_concluir:
+                    ao_concluir(indice, analises[indice])
     
     # Prepara um prompt para síntese geral
-    if not GEMINI_DISPONIVEL:
+    if not backends.ativos():
         return {
             "hipotese": "Erro na Análise",
             "justificativa": "Gemini não está configurado. Configure a variável GEMINI_API_KEY.",
@@ -279,13 +775,9 @@ def analisar_multiplas_palavras(palavras_ditadas: list, escritas: list) -> dict:
         }
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         analises_texto = "\n".join([f"- {a['palavra']}: escreveu '{a['escrita']}' → {a['hipotese']}" for a in analises])
         
-        sintese_prompt = f"""{SYSTEM_PROMPT}
-
-Com base nas seguintes análises individuais, determine a hipótese de escrita GERAL da criança:
+        sintese_prompt = f"""Com base nas seguintes análises individuais, determine a hipótese de escrita GERAL da criança:
 
 {analises_texto}
 
@@ -294,43 +786,21 @@ Considerando que:
 - Se há variação, escolha a hipótese que melhor representa o nível de compreensão predominante
 - Em caso de transição, prefira a hipótese mais avançada que aparece consistentemente
 
-Responda no formato JSON com a hipótese geral e justificativa. **A justificativa deve ser sucinta, clara e fácil de entender, mesmo para pessoas leigas no assunto.**
-
-Responda no formato JSON:
-{{
-  "hipotese": "Nome da Hipótese Geral",
-  "justificativa": "Explicação pedagógica sucinta e acessível"
-}}
+Responda no formato JSON com a hipótese geral e a justificativa.
 """
         
-        response = model.generate_content(sintese_prompt)
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks se existirem e limpa o texto antes de decodificar JSON
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
-            
-        # Tenta encontrar o primeiro e último { } para garantir que só o JSON seja decodificado
-        try:
-            json_start = response_text.index('{')
-            json_end = response_text.rindex('}') + 1
-            response_text = response_text[json_start:json_end]
-        except ValueError:
-            # Se não encontrar chaves, tenta decodificar o texto inteiro e lança erro se falhar
-            pass
-        
-        resultado_geral = json.loads(response_text)      
+        _, response = _gerar_conteudo(SYSTEM_PROMPT, sintese_prompt, 'sintese', ESQUEMA_CLASSIFICACAO)
+        resultado_geral = _extrair_json(response.texto)
         return {
             "hipotese": resultado_geral["hipotese"],
-            "justificativa": resultado_geral["justificativa"],
+            "justificativa": resultado_geral.get("justificativa", ""),
             "analises_individuais": analises
         }
     
     except Exception as e:
         error_msg = str(e)
-        print(f"[ERROR] Erro ao processar análise geral (Gemini): {error_msg}")
+        logger.error("Erro ao processar análise geral (Gemini)", extra={'erro': error_msg})
+        metricas.contar('fallbacks', tipo='erro_sintese')
         
         # Se for erro de autenticação, retorna mensagem clara
         if "API key" in error_msg or "authentication" in error_msg.lower():
@@ -346,3 +816,218 @@ Responda no formato JSON:
             "analises_individuais": analises
         }
 
+
+
+def _hipotese_predominante(analises: list) -> str:
+    """
+    Determina a hipótese geral a partir das análises individuais.
+    
+    Segue o mesmo critério do prompt de síntese: a hipótese mais frequente
+    vence e, em caso de empate, prefere-se a mais avançada.
+    Retorna None se nenhuma análise tiver uma hipótese válida.
+    """
+    contagem = {}
+    for analise in analises:
+        if analise["hipotese"] in HIPOTESES:
+            contagem[analise["hipotese"]] = contagem.get(analise["hipotese"], 0) + 1
+    
+    if not contagem:
+        return None
+    
+    return max(contagem, key=lambda h: (contagem[h], HIPOTESES.index(h)))
+
+
+@metricas.medir_funcao
+def _analisar_lote(pares: list) -> dict:
+    """
+    Classifica um lote de pares (palavra, escrita) em uma única chamada ao Gemini.
+    
+    Args:
+        pares: Lista de tuplas (palavra_ditada, escrita_crianca)
+    
+    Returns:
+        tuple: (nome do backend que respondeu, dicionário com 'hipotese',
+               'justificativa' e 'analises_individuais')
+    """
+    # Estruturas silábicas de todo o lote de uma vez (memorizadas por palavra)
+    estruturas = silabas.analisar_palavras([palavra for palavra, _ in pares])
+    
+    pares_texto = "\n".join([
+        f"{i}. Palavra ditada: {palavra.upper()} ({' / '.join(e.descrever() for e in estrutura)}) | Escrita da criança: {escrita.upper()}"
+        for i, ((palavra, escrita), estrutura) in enumerate(zip(pares, estruturas), start=1)
+    ])
+    
+    prompt = f"""Analise TODAS as escritas abaixo, feitas pela mesma criança em um único ditado:
+
+{pares_texto}
+
+Para cada item, classifique a hipótese de escrita e justifique. Depois, determine a hipótese de escrita GERAL da criança, considerando que:
+- Se todas as análises apontam para a mesma hipótese, essa é a hipótese geral
+- Se há variação, escolha a hipótese que melhor representa o nível de compreensão predominante
+- Em caso de transição, prefira a hipótese mais avançada que aparece consistentemente
+
+Responda no formato JSON, com um item em "analises_individuais" para cada escrita, na mesma ordem e com o mesmo número do item:
+{{
+  "analises_individuais": [
+    {{"item": 1, "hipotese": "Nome da Hipótese", "justificativa": "Explicação pedagógica sucinta e acessível"}}
+  ],
+  "hipotese": "Nome da Hipótese Geral",
+  "justificativa": "Explicação pedagógica sucinta e acessível"
+}}
+"""
+    
+    backend, response = _gerar_conteudo(SYSTEM_PROMPT, prompt, 'lote', ESQUEMA_LOTE)
+    resultado = _extrair_json(response.texto)
+    
+    # Indexa as respostas pelo número do item; sem número, vale a posição na lista
+    respostas = {}
+    for posicao, item in enumerate(resultado.get("analises_individuais", []), start=1):
+        try:
+            numero = int(item.get("item", posicao))
+        except (TypeError, ValueError):
+            numero = posicao
+        respostas.setdefault(numero, item)
+    
+    analises = []
+    for i, (palavra, escrita) in enumerate(pares, start=1):
+        item = respostas.get(i)
+        if item and item.get("hipotese"):
+            hipotese = item["hipotese"]
+            justificativa = item.get("justificativa", "")
+        else:
+            hipotese = "Erro na Análise"
+            justificativa = "O Gemini não retornou a análise desta palavra. Tente novamente."
+        analises.append({
+            "palavra": palavra,
+            "escrita": escrita,
+            "hipotese": hipotese,
+            "justificativa": justificativa
+        })
+    
+    return backend, {
+        "hipotese": resultado.get("hipotese", ""),
+        "justificativa": resultado.get("justificativa", ""),
+        "analises_individuais": analises
+    }
+
+
+@metricas.medir_funcao
+def analisar_multiplas_palavras_em_lote(palavras_ditadas: list, escritas: list, max_pares: int = None,
+                                        ao_concluir=None) -> dict:
+    """
+    Analisa múltiplas palavras enviando todos os pares em uma única chamada.
+    
+    O SYSTEM_PROMPT é enviado uma vez por lote em vez de uma vez por palavra,
+    e a hipótese geral vem na mesma resposta, sem chamada extra de síntese.
+    Escritas vazias, casos evidentes (triagem local) e pares já em cache são
+    resolvidos antes e só os demais vão ao modelo. Listas maiores que max_pares
+    (padrão: ANALISE_LOTE_MAX_PARES) são divididas em lotes; quando há mais de
+    um lote, ou parte das palavras foi resolvida sem o modelo, a hipótese geral
+    é a predominante entre todas as palavras.
+    
+    Args:
+        palavras_ditadas: Lista de palavras ditadas
+        escritas: Lista das escritas correspondentes
+        max_pares: Número máximo de pares por chamada
+        ao_concluir: Função opcional (índice, análise) chamada para cada palavra
+                     assim que o seu lote fica pronto
+    
+    Returns:
+        dict: Dicionário com 'hipotese' geral, 'justificativa' e 'analises_individuais'
+    """
+    
+    if len(palavras_ditadas) != len(escritas):
+        return {
+            "hipotese": "Erro",
+            "justificativa": "Número de palavras ditadas e escritas não correspondem."
+        }
+    
+    pares = list(zip(palavras_ditadas, escritas))
+    analises = [None] * len(pares)
+    
+    # Escritas vazias, casos evidentes e pares já em cache não vão para o lote
+    for indice, (palavra, escrita) in enumerate(pares):
+        resultado = _classificar_sem_modelo(palavra, escrita)
+        if resultado is not None:
+            analises[indice] = {
+                "palavra": palavra,
+                "escrita": escrita,
+                "hipotese": resultado["hipotese"],
+                "justificativa": resultado.get("justificativa", "")
+            }
+            if ao_concluir:
+                ao_concluir(indice, analises[indice])
+    pendentes = [indice for indice, analise in enumerate(analises) if analise is None]
+    
+    if pendentes and not backends.ativos():
+        for indice in pendentes:
+            palavra, escrita = pares[indice]
+            analises[indice] = {"palavra": palavra, "escrita": escrita, "hipotese": "Erro na Análise", "justificativa": ""}
+        return {
+            "hipotese": "Erro na Análise",
+            "justificativa": "Gemini não está configurado. Configure a variável GEMINI_API_KEY.",
+            "analises_individuais": analises
+        }
+    
+    tamanho = max(1, max_pares or LOTE_MAX_PARES)
+    lotes = [pendentes[i:i + tamanho] for i in range(0, len(pendentes), tamanho)]
+    
+    def processar(lote):
+        pares_lote = [pares[indice] for indice in lote]
+        try:
+            backend, resultado = _analisar_lote(pares_lote)
+        except Exception as e:
+            error_msg = str(e)
+            logger.error("Erro ao processar lote de palavras (Gemini)", extra={'erro': error_msg})
+            metricas.contar('fallbacks', tipo='erro_lote')
+            return {
+                "hipotese": "Erro na Análise",
+                "justificativa": f"Erro ao processar análise em lote: {error_msg[:200]}",
+                "analises_individuais": [
+                    {"palavra": p, "escrita": e, "hipotese": "Erro na Análise", "justificativa": ""}
+                    for p, e in pares_lote
+                ]
+            }
+        for analise in resultado["analises_individuais"]:
+            _guardar_no_cache(analise["palavra"], analise["escrita"], analise, backend)
+        return resultado
+    
+    def notificar(lote, resultado):
+        for indice, analise in zip(lote, resultado["analises_individuais"]):
+            analises[indice] = analise
+            if ao_concluir:
+                ao_concluir(indice, analise)
+    
+    limite = max(1, min(MAX_CONCORRENCIA, len(lotes)))
+    resultados = [None] * len(lotes)
+    if limite == 1:
+        for numero_lote, lote in enumerate(lotes):
+            resultados[numero_lote] = processar(lote)
+            notificar(lote, resultados[numero_lote])
+    else:
+        with ThreadPoolExecutor(max_workers=limite) as executor:
+            futuros = {executor.submit(_no_contexto_atual(processar), lote): numero_lote for numero_lote, lote in enumerate(lotes)}
+            for futuro in as_completed(futuros):
+                numero_lote = futuros[futuro]
+                resultados[numero_lote] = futuro.result()
+                notificar(lotes[numero_lote], resultados[numero_lote])
+    
+    # Com todas as palavras em um único lote, a síntese do próprio Gemini é usada diretamente
+    if len(resultados) == 1 and len(pendentes) == len(pares):
+        return resultados[0]
+    
+    hipotese = _hipotese_predominante(analises)
+    if hipotese is None:
+        return {
+            "hipotese": "Erro na Análise",
+            "justificativa": resultados[0]["justificativa"] if resultados else "Nenhuma escrita pôde ser analisada.",
+            "analises_individuais": analises
+        }
+    
+    total = sum(1 for a in analises if a["hipotese"] in HIPOTESES)
+    ocorrencias = sum(1 for a in analises if a["hipotese"] == hipotese)
+    return {
+        "hipotese": hipotese,
+        "justificativa": f"Hipótese predominante no ditado: {ocorrencias} de {total} escritas analisadas foram classificadas como {hipotese}.",
+        "analises_individuais": analises
+    }
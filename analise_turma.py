@@ -0,0 +1,274 @@
+"""
+Análise da turma inteira em uma única requisição (rota /analyze/batch).
+No fim do bimestre o professor tem 25 a 35 fotos por turma; em vez de enviar
+uma por uma, ele envia todas de uma vez:
+
+1. Um ZIP com as fotos e um manifesto CSV (aluno, arquivo, palavras ditadas), ou
+2. Várias fotos no mesmo formulário (campo "files"), com um manifesto CSV
+   opcional no campo "manifesto".
+
+Sem manifesto, todos os alunos usam as palavras ditadas do campo
+"palavras_ditadas" e o nome do aluno vem do nome do arquivo.
+
+Os alunos são processados em paralelo (TURMA_WORKERS) e cada resultado é
+devolvido como uma linha NDJSON assim que fica pronto. Um aluno com erro gera
+uma linha de erro, sem interromper os demais.
+"""
+
+import io
+import os
+import csv
+import time
+import zipfile
+import contextvars
+import unicodedata
+from typing import NamedTuple, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import registro
+
+logger = registro.obter_logger(__name__)
+
+# Configurações da análise de turma
+TURMA_MAX_ALUNOS = int(os.environ.get('TURMA_MAX_ALUNOS', '60'))
+TURMA_WORKERS = int(os.environ.get('TURMA_WORKERS', '4'))
+TURMA_MAX_BYTES_DESCOMPACTADOS = int(os.environ.get('TURMA_MAX_BYTES_DESCOMPACTADOS', str(300 * 1024 * 1024)))
+
+_EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+# Nomes aceitos para cada coluna do manifesto (sem acentos e em minúsculas)
+_COLUNAS = {
+    'aluno': ('aluno', 'nome', 'estudante', 'crianca'),
+    'arquivo': ('arquivo', 'imagem', 'foto'),
+    'palavras_ditadas': ('palavras_ditadas', 'palavras ditadas', 'palavras', 'ditado'),
+}
+
+
+class _DialetoPontoEVirgula(csv.excel):
+    delimiter = ';'
+
+
+class ItemTurma(NamedTuple):
+    """Um aluno a ser analisado: de onde vem a foto e quais palavras foram ditadas."""
+    indice: int
+    aluno: str
+    arquivo: str
+    palavras_ditadas: str
+    ler: Callable
+
+
+def _normalizar_coluna(nome: str) -> str:
+    nome = unicodedata.normalize('NFKD', (nome or '').strip().lower())
+    return ''.join(c for c in nome if not unicodedata.combining(c))
+
+
+def ler_manifesto(conteudo: bytes) -> list:
+    """
+    Lê o manifesto CSV da turma. Aceita separador ponto e vírgula (padrão do
+    Excel em português) ou vírgula, com as palavras entre aspas.
+
+    Returns:
+        list: Dicionários com 'aluno', 'arquivo' e 'palavras_ditadas'
+
+    Raises:
+        ValueError: Se o manifesto não tiver as colunas necessárias
+    """
+    try:
+        texto = conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = conteudo.decode('latin-1')
+
+    try:
+        dialeto = csv.Sniffer().sniff(texto.split('\n', 1)[0], delimiters=';,\t')
+    except csv.Error:
+        dialeto = _DialetoPontoEVirgula
+
+    leitor = csv.reader(io.StringIO(texto), dialeto)
+    cabecalho = [_normalizar_coluna(c) for c in next(leitor, [])]
+
+    posicoes = {}
+    for campo, nomes in _COLUNAS.items():
+        for nome in nomes:
+            if nome in cabecalho:
+                posicoes[campo] = cabecalho.index(nome)
+                break
+    if 'arquivo' not in posicoes or 'palavras_ditadas' not in posicoes:
+        raise ValueError("O manifesto precisa das colunas 'arquivo' e 'palavras_ditadas' (e, opcionalmente, 'aluno').")
+
+    linhas = []
+    for linha in leitor:
+        if not any(c.strip() for c in linha):
+            continue
+        linhas.append({
+            campo: linha[posicao].strip() if posicao < len(linha) else ''
+            for campo, posicao in posicoes.items()
+        })
+        linhas[-1].setdefault('aluno', '')
+    return linhas
+
+
+def _nome_base(caminho: str) -> str:
+    return caminho.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def _eh_imagem(nome: str) -> bool:
+    return nome.lower().endswith(_EXTENSOES_IMAGEM)
+
+
+def _ler_ausente(arquivo: str):
+    def ler():
+        raise ValueError(f"Arquivo '{arquivo}' citado no manifesto não foi enviado")
+    return ler
+
+
+def _montar_itens(arquivos: dict, manifesto: list, palavras_padrao: str) -> list:
+    """
+    Cruza as fotos recebidas com o manifesto.
+
+    Args:
+        arquivos: Nome do arquivo (sem pastas, em minúsculas) -> (nome original, função de leitura)
+        manifesto: Linhas do manifesto, ou None
+        palavras_padrao: Palavras ditadas usadas quando não há manifesto
+    """
+    if manifesto is None:
+        if not palavras_padrao:
+            raise ValueError("Envie um manifesto CSV ou informe as palavras ditadas para toda a turma.")
+        manifesto = [
+            {'aluno': os.path.splitext(nome)[0], 'arquivo': nome, 'palavras_ditadas': palavras_padrao}
+            for nome, _ in sorted(arquivos.values())
+        ]
+
+    if not manifesto:
+        raise ValueError("Nenhuma foto de aluno foi encontrada no envio.")
+    if len(manifesto) > TURMA_MAX_ALUNOS:
+        raise ValueError(f"A turma tem {len(manifesto)} alunos; o limite por envio é {TURMA_MAX_ALUNOS}.")
+
+    itens = []
+    for indice, linha in enumerate(manifesto):
+        arquivo = linha['arquivo']
+        encontrado = arquivos.get(_nome_base(arquivo).lower())
+        itens.append(ItemTurma(
+            indice=indice,
+            aluno=linha['aluno'] or os.path.splitext(_nome_base(arquivo))[0],
+            arquivo=arquivo,
+            palavras_ditadas=linha['palavras_ditadas'] or palavras_padrao,
+            ler=encontrado[1] if encontrado else _ler_ausente(arquivo),
+        ))
+    return itens
+
+
+def itens_do_zip(stream, palavras_padrao: str = '', max_bytes_por_imagem: int = None) -> list:
+    """
+    Lê um ZIP com as fotos da turma e, opcionalmente, um manifesto CSV.
+    As fotos só são descompactadas quando o aluno é processado.
+
+    Raises:
+        ValueError: Se o ZIP for inválido ou passar dos limites
+    """
+    try:
+        arquivo_zip = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError("O arquivo enviado não é um ZIP válido.")
+
+    membros = [
+        m for m in arquivo_zip.infolist()
+        if not m.is_dir() and not m.filename.startswith('__MACOSX/') and not _nome_base(m.filename).startswith('.')
+    ]
+    if sum(m.file_size for m in membros) > TURMA_MAX_BYTES_DESCOMPACTADOS:
+        raise ValueError("O ZIP descompactado é grande demais.")
+
+    manifesto = None
+    arquivos = {}
+    for membro in membros:
+        nome = _nome_base(membro.filename)
+        if nome.lower().endswith('.csv') and manifesto is None:
+            manifesto = ler_manifesto(arquivo_zip.read(membro))
+        elif _eh_imagem(nome):
+            arquivos[nome.lower()] = (nome, _leitor_zip(arquivo_zip, membro, max_bytes_por_imagem))
+
+    return _montar_itens(arquivos, manifesto, palavras_padrao)
+
+
+def _leitor_zip(arquivo_zip, membro, max_bytes):
+    def ler():
+        if max_bytes and membro.file_size > max_bytes:
+            raise ValueError(f"A foto '{membro.filename}' é grande demais.")
+        return arquivo_zip.read(membro)
+    return ler
+
+
+def itens_dos_arquivos(arquivos: list, manifesto_bytes: bytes = None, palavras_padrao: str = '') -> list:
+    """
+    Monta os itens a partir de várias fotos enviadas no mesmo formulário.
+
+    Args:
+        arquivos: Lista de tuplas (nome do arquivo, stream) do campo "files"
+        manifesto_bytes: Conteúdo do manifesto CSV, se enviado
+        palavras_padrao: Palavras ditadas para toda a turma (sem manifesto)
+    """
+    por_nome = {}
+    for nome_arquivo, stream in arquivos:
+        if not nome_arquivo:
+            continue
+        nome = _nome_base(nome_arquivo)
+        por_nome[nome.lower()] = (nome, stream.read)
+
+    manifesto = ler_manifesto(manifesto_bytes) if manifesto_bytes else None
+    return _montar_itens(por_nome, manifesto, palavras_padrao)
+
+
+def _processar_item(item: ItemTurma, processador) -> dict:
+    linha = {'indice': item.indice, 'aluno': item.aluno, 'arquivo': item.arquivo}
+    try:
+        if not item.palavras_ditadas:
+            raise ValueError("Nenhuma palavra ditada informada para este aluno")
+        resultado, status_http = processador(item.palavras_ditadas, item.ler(), item.aluno)
+    except Exception as e:
+        logger.warning("Erro ao analisar o aluno", extra={'aluno': item.aluno, 'erro': str(e)})
+        linha.update({'status': 'erro', 'error': str(e)})
+        return linha
+
+    if status_http != 200:
+        linha.update({'status': 'erro', 'error': resultado.get('error', 'Erro na análise'), 'status_http': status_http})
+    else:
+        linha.update({'status': 'ok', 'resultado': resultado})
+    return linha
+
+
+def processar_turma(itens: list, processador, workers: int = None):
+    """
+    Processa os alunos em paralelo, entregando cada resultado assim que fica pronto.
+
+    Args:
+        itens: Lista de ItemTurma
+        processador: Função (palavras_ditadas, imagem_bytes, aluno) -> (resultado, status HTTP)
+        workers: Número de alunos processados ao mesmo tempo (padrão: TURMA_WORKERS)
+
+    Yields:
+        dict: Uma linha por aluno e, no final, uma linha com o resumo
+    """
+    inicio = time.time()
+    concluidas = erros = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers or TURMA_WORKERS, len(itens))))
+    try:
+        # Cada aluno roda com o contexto desta thread, para levar o id da requisição aos logs
+        futuros = [
+            executor.submit(contextvars.copy_context().run, _processar_item, item, processador)
+            for item in itens
+        ]
+        for futuro in as_completed(futuros):
+            linha = futuro.result()
+            if linha['status'] == 'ok':
+                concluidas += 1
+            else:
+                erros += 1
+            yield linha
+    finally:
+        # Se o cliente desconectar no meio, os alunos que nem começaram são descartados
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield {'resumo': {
+        'total': len(itens),
+        'concluidas': concluidas,
+        'erros': erros,
+        'duracao_segundos': round(time.time() - inicio, 2),
+    }}
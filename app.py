@@ -4,16 +4,138 @@ Versão de produção com OCR simulado (não requer Google Cloud)
 """
 
 import os
-from flask import Flask, request, jsonify, render_template
-from ai_analyzer import analisar_escrita, analisar_multiplas_palavras, analisar_escrita_com_imagem
+from flask import Flask, Request, Response, request, jsonify, render_template, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from ai_analyzer import (
+    analisar_escrita,
+    analisar_multiplas_palavras,
+    analisar_multiplas_palavras_em_lote,
+    analisar_escrita_com_imagem,
+    registrar_uso_de_tokens,
+    resumir_uso_de_tokens,
+    estatisticas_respostas,
+    MODO_LOTE,
+)
+from hipoteses import HIPOTESES
+import armazenamento
+import backends
+import cache_analises
+import dedup_imagens
+import limitador
+import metricas
+import preprocessamento
+import registro
+import relatorios
+import resiliencia
+import tarefas
+import analise_turma
+import contextvars
+import hmac
 import io
+import json
+import queue
+import threading
+from urllib.parse import quote
+
+logger = registro.obter_logger(__name__)
+
+# Tamanho máximo aceito para o corpo da requisição (imagem + campos do formulário)
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Tamanho máximo do envio da turma inteira (/analyze/batch: ZIP ou várias fotos)
+TURMA_UPLOAD_MAX_BYTES = int(os.environ.get('TURMA_UPLOAD_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Campos do formulário que identificam a sondagem (gravados com o resultado)
+CAMPOS_IDENTIFICACAO = ('aluno', 'escola', 'serie', 'turma', 'rodada', 'professor', 'data')
+
+# Tipos de arquivo aceitos, além de imagens, no envio da turma inteira
+_TIPOS_TURMA = (
+    'application/zip', 'application/x-zip-compressed', 'multipart/x-zip',
+    'text/csv', 'text/plain', 'application/vnd.ms-excel',
+)
+
+# Assinaturas (magic bytes) dos formatos de imagem aceitos
+_ASSINATURAS_IMAGEM = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+class RequisicaoEmMemoria(Request):
+    """
+    Requisição que mantém os arquivos enviados em memória.
+    
+    O padrão do Werkzeug é gravar uploads grandes em arquivo temporário; aqui o
+    corpo vai direto para um buffer, cujo tamanho é limitado por MAX_CONTENT_LENGTH.
+    Arquivos declarados com tipo que não seja imagem são recusados antes da leitura
+    (na rota da turma inteira também são aceitos o ZIP e o manifesto CSV).
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == 'analyze_batch' and content_type in _TIPOS_TURMA:
+            return io.BytesIO()
+        if content_type and not content_type.startswith('image/') and content_type != 'application/octet-stream':
+            raise UnsupportedMediaType('O arquivo enviado não é uma imagem')
+        return io.BytesIO()
+
+
+def detectar_tipo_imagem(cabecalho: bytes):
+    """Identifica o formato da imagem pelos primeiros bytes. Retorna o mime type ou None."""
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+        return 'image/webp'
+    for assinatura, mime_type in _ASSINATURAS_IMAGEM:
+        if cabecalho.startswith(assinatura):
+            return mime_type
+    return None
+
+
+def ler_imagem_enviada(file):
+    """
+    Lê o arquivo enviado para a memória, conferindo antes a assinatura do formato.
+    
+    Returns:
+        bytes: Conteúdo da imagem, ou None se não for um formato suportado
+    """
+    cabecalho = file.stream.read(16)
+    if detectar_tipo_imagem(cabecalho) is None:
+        return None
+    return cabecalho + file.stream.read()
+
+
+def _separar_itens(texto: str) -> list:
+    """Separa palavras (ou escritas) por vírgula ou quebra de linha."""
+    if not texto:
+        return []
+    # Substitui quebras de linha por vírgulas e depois separa
+    return [item.strip() for item in texto.replace('\n', ',').split(',') if item.strip()]
+
 
 # Configuração do Flask
 app = Flask(__name__, template_folder='templates')
+app.request_class = RequisicaoEmMemoria
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
 
 # Modo de produção sem Google Vision (OCR simulado)
 OCR_DISPONIVEL = False
 
+# Token exigido nas rotas administrativas (sem token configurado, elas ficam desativadas)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+
+@app.before_request
+def identificar_requisicao():
+    """Dá um identificador à requisição, que acompanha todas as linhas de log da análise."""
+    registro.novo_id_requisicao(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def devolver_id_requisicao(response):
+    response.headers['X-Request-ID'] = registro.id_requisicao_atual()
+    return response
+
 
 @app.route('/')
 def index():
@@ -21,6 +143,26 @@ def index():
     return render_template('sondagem.html')
 
 
+@app.route('/limites', methods=['GET'])
+def limites():
+    """
+    Rota com os limites de upload aceitos pelo servidor. A página usa esses
+    valores para reduzir e recomprimir a foto no navegador antes do envio.
+    """
+    resposta = jsonify({
+        'upload_max_bytes': UPLOAD_MAX_BYTES,
+        'turma_upload_max_bytes': TURMA_UPLOAD_MAX_BYTES,
+        'tipos_imagem': sorted({mime_type for _, mime_type in _ASSINATURAS_IMAGEM} | {'image/webp'}),
+        'imagem': {
+            'aresta_maxima': preprocessamento.IMAGEM_ARESTA_MAXIMA,
+            'qualidade': preprocessamento.IMAGEM_QUALIDADE,
+            'max_pixels': preprocessamento.IMAGEM_MAX_PIXELS,
+        },
+    })
+    resposta.headers['Cache-Control'] = 'public, max-age=300'
+    return resposta
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
     """
@@ -31,6 +173,41 @@ def analyze_image():
     2. Usa OCR para extrair o texto da imagem (ou usa a transcrição prévia)
     3. Usa IA para classificar a hipótese de escrita
     4. Retorna a transcrição, hipótese e justificativa
+    
+    A imagem fica apenas em memória: não há arquivo temporário em disco.
+    
+    Com ?async=1, a análise é enfileirada e a rota responde imediatamente com o
+    identificador da tarefa, que deve ser consultado em /jobs/<id>.
+    """
+    
+    with metricas.medir_etapa('leitura_upload'):
+        dados, imagem_bytes, erro = _ler_requisicao_analise()
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    
+    if request.args.get('async') == '1':
+        iniciar_tarefas_em_segundo_plano()
+        tarefa_id = tarefas.criar_tarefa(dados, imagem_bytes)
+        return jsonify({
+            'job_id': tarefa_id,
+            'status': tarefas.STATUS_PENDENTE,
+            'url': f'/jobs/{tarefa_id}'
+        }), 202
+    
+    resposta, status = processar_analise(
+        dados['palavras_ditadas'], dados['transcricao_previa'], imagem_bytes, debug=dados['debug'],
+        identificacao=dados['identificacao']
+    )
+    return jsonify(resposta), status
+
+
+def _ler_requisicao_analise():
+    """
+    Lê e valida o formulário enviado para /analyze.
+    
+    Returns:
+        tuple: (dados do formulário, bytes da imagem ou None, erro)
+               O erro é uma tupla (resposta, status HTTP) ou None
     """
     
     # Validação dos dados recebidos
@@ -40,85 +217,166 @@ def analyze_image():
     if transcricao_previa:
         file = None
     elif 'file' not in request.files:
-        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        return None, None, ({'error': 'Nenhum arquivo enviado'}, 400)
     else:
         file = request.files['file']
     
     # Recebe os campos simplificados
     palavras_ditadas = request.form.get('palavras_ditadas', '').strip()
-    transcricao_previa = request.form.get('transcricao_previa', '').strip()
     
-    # Log dos dados recebidos (para debugging)
-    print(f"[DEBUG] Dados recebidos:")
-    print(f"  Palavras ditadas: '{palavras_ditadas}'")
-    print(f"  Transcrição prévia: '{transcricao_previa}'")
+    # Log dos dados recebidos (para debugging; os dados da criança saem redigidos)
+    logger.debug("Dados recebidos", extra={'palavras_ditadas': palavras_ditadas, 'transcricao_previa': transcricao_previa})
     
     if file and file.filename == '':
-        return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+        return None, None, ({'error': 'Nenhum arquivo selecionado'}, 400)
+    
+    if not _separar_itens(palavras_ditadas):
+        return None, None, ({'error': 'Nenhuma palavra ou frase ditada foi informada'}, 400)
+    
+    # ===== LÊ A IMAGEM EM MEMÓRIA =====
+    imagem_bytes = None
+    if file:
+        imagem_bytes = ler_imagem_enviada(file)
+        if imagem_bytes is None:
+            return None, None, ({'error': 'O arquivo enviado não é uma imagem suportada (JPEG, PNG, WEBP, GIF ou BMP)'}, 415)
+    
+    dados = {
+        'palavras_ditadas': palavras_ditadas,
+        'transcricao_previa': transcricao_previa,
+        'debug': request.values.get('debug') == '1',
+        'id_requisicao': registro.id_requisicao_atual(),
+        'identificacao': _ler_identificacao()
+    }
+    return dados, imagem_bytes, None
+
+
+def _ler_identificacao() -> dict:
+    """Lê do formulário os campos que identificam a sondagem (aluno, escola, turma, ...)."""
+    return {campo: request.form.get(campo, '').strip() for campo in CAMPOS_IDENTIFICACAO}
 
+
+def processar_analise(palavras_ditadas: str, transcricao_previa: str, imagem_bytes, progresso=None,
+                      debug: bool = False, identificacao: dict = None) -> tuple:
+    """
+    Executa a análise completa: transcrição (prévia, repetida ou via Gemini Vision)
+    e classificação da hipótese de escrita.
+    
+    Usada tanto pela rota síncrona quanto pelas tarefas em segundo plano.
+    
+    Args:
+        palavras_ditadas: As palavras/frase ditadas, separadas por vírgula ou quebra de linha
+        transcricao_previa: Transcrição informada pelo professor (ou vazio)
+        imagem_bytes: A imagem da escrita (ou None no modo de reanálise)
+        progresso: Função opcional chamada com resultados parciais (ex.: a transcrição)
+        debug: Inclui na resposta o campo 'debug' com os tokens de cada chamada ao Gemini
+        identificacao: Aluno, escola, turma, professor e data, gravados com o resultado
+    
+    Returns:
+        tuple: (resposta, status HTTP)
+    """
+    
+    with registrar_uso_de_tokens() as chamadas, metricas.medir_etapa('analise_completa'):
+        # O hash da foto serve à detecção de fotos repetidas e é gravado com o resultado
+        hash_imagem = assinatura = None
+        if imagem_bytes is not None and not transcricao_previa:
+            hash_imagem = dedup_imagens.calcular_hash(imagem_bytes)
+            assinatura = dedup_imagens.calcular_assinatura(imagem_bytes)
+        resposta, status = _executar_analise(
+            palavras_ditadas, transcricao_previa, imagem_bytes, hash_imagem, assinatura, progresso
+        )
+    
+    # A gravação fica para a thread do armazenamento; o identificador já vai na resposta.
+    # Só classificações válidas são gravadas ("Erro na Análise" não é uma sondagem).
+    if status == 200 and resposta.get('hipotese') in HIPOTESES:
+        miniatura = None
+        if armazenamento.precisa_miniatura(hash_imagem):
+            with metricas.medir_etapa('miniatura'):
+                miniatura = preprocessamento.gerar_miniatura(imagem_bytes)
+        sondagem_id = armazenamento.registrar(
+            identificacao or {}, _separar_itens(palavras_ditadas), resposta, hash_imagem, miniatura
+        )
+        if sondagem_id:
+            resposta['sondagem_id'] = sondagem_id
+    
+    uso = resumir_uso_de_tokens(chamadas)
+    metricas.observar('chamadas_por_analise', uso['total_chamadas'])
+    if uso['total_chamadas']:
+        logger.info("Tokens da análise", extra={
+            'tokens_entrada': uso['tokens_entrada'],
+            'tokens_saida': uso['tokens_saida'],
+            'tokens_em_cache': uso['tokens_em_cache'],
+            'total_chamadas': uso['total_chamadas'],
+        })
+    if debug:
+        resposta['debug'] = {'uso_de_tokens': uso}
+    return resposta, status
+
+
+def _executar_analise(palavras_ditadas: str, transcricao_previa: str, imagem_bytes, hash_imagem,
+                      assinatura, progresso) -> tuple:
+    """Etapas da análise (ver processar_analise)."""
+    
     try:
         # ===== PROCESSA AS PALAVRAS DITADAS =====
         # Separa as palavras por vírgula ou quebra de linha
-        palavras_lista = []
-        if palavras_ditadas:
-            # Substitui quebras de linha por vírgulas e depois separa
-            palavras_texto = palavras_ditadas.replace('\n', ',')
-            palavras_lista = [p.strip() for p in palavras_texto.split(',') if p.strip()]
+        palavras_lista = _separar_itens(palavras_ditadas)
         
-        print(f"[DEBUG] Total de palavras ditadas: {len(palavras_lista)}")
-        print(f"[DEBUG] Palavras: {palavras_lista}")
+        logger.debug("Palavras ditadas separadas", extra={'total_palavras': len(palavras_lista), 'palavras': palavras_lista})
         
         if len(palavras_lista) == 0:
-            return jsonify({'error': 'Nenhuma palavra ou frase ditada foi informada'}), 400
+            return {'error': 'Nenhuma palavra ou frase ditada foi informada'}, 400
         
-        # ===== SALVA A IMAGEM TEMPORARIAMENTE =====
-    # Salva a imagem para o Gemini processar
-    temp_image_path = None
-    if file:
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-            file.save(tmp_file.name)
-            temp_image_path = tmp_file.name
-        
-        print(f"[DEBUG] Imagem salva em: {temp_image_path}")
+        # ===== FOTO REPETIDA =====
+        # Uma foto igual ou quase igual a outra recente reaproveita a transcrição já lida
+        transcricao_repetida = None
+        if not transcricao_previa:
+            with metricas.medir_etapa('foto_repetida'):
+                transcricao_repetida = dedup_imagens.buscar(hash_imagem, assinatura)
+            if transcricao_repetida and len(_separar_itens(transcricao_repetida)) != len(palavras_lista):
+                # A transcrição não casa com as palavras ditadas atuais: lê a imagem de novo
+                transcricao_repetida = None
         
         # ===== PRIORIDADE: TRANSCRIÇÃO PRÉVIA =====
-    # Se o professor forneceu uma transcrição prévia, usa ela ao invés do Gemini Vision
-    if transcricao_previa:
-        texto_extraido = transcricao_previa
-        print(f"[DEBUG] Usando transcrição prévia (modo reanálise): '{texto_extraido}'")
-    elif file:
-        # ===== ANÁLISE COM GEMINI VISION =====
-        # Usa o Gemini para ler a imagem diretamente
-        print(f"[DEBUG] Usando Gemini Vision para analisar a imagem...")
+        # Se o professor forneceu uma transcrição prévia, usa ela ao invés do Gemini Vision
+        if transcricao_previa:
+            texto_extraido = transcricao_previa
+            modo_texto = 'transcricao_previa'
+            logger.debug("Usando transcrição prévia (modo reanálise)", extra={'transcricao': texto_extraido})
+        elif transcricao_repetida:
+            texto_extraido = transcricao_repetida
+            modo_texto = 'imagem_repetida'
+            logger.debug("Foto repetida, reaproveitando a transcrição", extra={'transcricao': texto_extraido})
+        else:
+            # ===== ANÁLISE COM GEMINI VISION =====
+            # Usa o Gemini para ler a imagem diretamente
+            logger.debug("Usando Gemini Vision para analisar a imagem")
             
             try:
-                resultado_gemini = analisar_escrita_com_imagem(palavras_ditadas, temp_image_path)
+                resultado_gemini = analisar_escrita_com_imagem(palavras_ditadas, imagem_bytes)
                 texto_extraido = resultado_gemini.get('transcricao', '')
-                print(f"[DEBUG] Gemini extraiu: '{texto_extraido}'")
+                logger.debug("Transcrição do Gemini Vision recebida", extra={'transcricao': texto_extraido})
+                
+                # Gemini fora do ar: avisa o professor em vez de inventar uma transcrição
+                if resultado_gemini.get('indisponivel'):
+                    return {'error': resultado_gemini['justificativa']}, 503
                 
                 # Se o Gemini retornou uma análise completa, usa ela diretamente
                 if resultado_gemini.get('hipotese') and resultado_gemini.get('hipotese') != 'Erro na Análise':
-    # Limpa o arquivo temporário
-    if temp_image_path:
-        import os as os_module
-        try:
-            os_module.unlink(temp_image_path)
-        except:
-            pass
-                    
-                    return jsonify({
+                    dedup_imagens.registrar(hash_imagem, assinatura, texto_extraido)
+                    if progresso:
+                        progresso({'etapa': 'transcricao', 'transcricao': texto_extraido})
+                    return {
                         'transcricao': resultado_gemini.get('transcricao', ''),
                         'hipotese': resultado_gemini.get('hipotese', ''),
                         'justificativa': resultado_gemini.get('justificativa', ''),
                         'modo': 'gemini_vision'
-                    })
+                    }, 200
             
             except Exception as e:
-                print(f"[DEBUG] Erro ao usar Gemini Vision: {str(e)}")
-                print(f"[DEBUG] Voltando para simulação de OCR...")
+                logger.warning("Erro ao usar Gemini Vision; voltando para simulação de OCR", extra={'erro': str(e)})
             
             # Se o Gemini falhou, usa simulação de OCR como fallback
+            metricas.contar('fallbacks', tipo='simulacao_ocr')
             if len(palavras_lista) == 1:
                 palavra = palavras_lista[0].upper()
                 
@@ -149,78 +407,322 @@ def analyze_image():
                 
                 texto_extraido = ', '.join(escritas_simuladas)
             
-            print(f"[DEBUG] Texto simulado (fallback): '{texto_extraido}'")
+            modo_texto = None
+            logger.debug("Texto simulado (fallback)", extra={'transcricao': texto_extraido})
         
-        # Limpa o arquivo temporário
-        import os as os_module
-        try:
-            os_module.unlink(temp_image_path)
-        except:
-            pass
+        if progresso:
+            progresso({'etapa': 'transcricao', 'transcricao': texto_extraido})
         
         # ===== ANÁLISE COM IA =====
         # Processa as escritas extraídas (do OCR ou da transcrição prévia)
-        escritas_lista = []
-        if texto_extraido:
-            # Substitui quebras de linha por vírgulas e depois separa
-            escritas_texto = texto_extraido.replace('\n', ',')
-            escritas_lista = [e.strip() for e in escritas_texto.split(',') if e.strip()]
+        escritas_lista = _separar_itens(texto_extraido)
         
-        print(f"[DEBUG] Total de escritas: {len(escritas_lista)}")
-        print(f"[DEBUG] Escritas: {escritas_lista}")
+        logger.debug("Escritas separadas", extra={'total_escritas': len(escritas_lista), 'escritas': escritas_lista})
         
         if len(escritas_lista) == 0:
-            return jsonify({'error': 'Não foi possível extrair texto da imagem ou da transcrição'}), 400
+            return {'error': 'Não foi possível extrair texto da imagem ou da transcrição'}, 400
         
         # ===== ANÁLISE INTELIGENTE =====
         
-    # ⚠️ VERIFICAÇÃO DE CONTROLE: Palavras Ditadas vs. Transcrição Prévia
-    if transcricao_previa and len(palavras_lista) != len(escritas_lista):
-        # Limpa o arquivo temporário
-        if temp_image_path:
-            import os as os_module
-            try:
-                os_module.unlink(temp_image_path)
-            except:
-                pass
-                
-        return jsonify({
-            'error': f'Erro de Contagem: O número de palavras ditadas ({len(palavras_lista)}) não corresponde ao número de escritas na transcrição prévia ({len(escritas_lista)}). Verifique se usou vírgulas para separar as palavras/frases em ambos os campos.'
-        }), 400
-            
+        # ⚠️ VERIFICAÇÃO DE CONTROLE: Palavras Ditadas vs. Transcrição Prévia
+        if transcricao_previa and len(palavras_lista) != len(escritas_lista):
+            return {
+                'error': f'Erro de Contagem: O número de palavras ditadas ({len(palavras_lista)}) não corresponde ao número de escritas na transcrição prévia ({len(escritas_lista)}). Verifique se usou vírgulas para separar as palavras/frases em ambos os campos.'
+            }, 400
+        
+        # Cada palavra classificada é enviada ao progresso assim que fica pronta
+        def palavra_concluida(indice, analise):
+            if progresso:
+                progresso({'etapa': 'palavra', 'indice': indice, 'total': len(escritas_lista), 'analise': analise})
+        
         # Se houver apenas uma palavra/escrita
         if len(palavras_lista) == 1 and len(escritas_lista) == 1:
-            print(f"[DEBUG] Analisando palavra única: '{palavras_lista[0]}' → '{escritas_lista[0]}'")
+            logger.debug("Analisando palavra única", extra={'palavra': palavras_lista[0], 'escrita': escritas_lista[0]})
             resultado_ia = analisar_escrita(palavras_lista[0], escritas_lista[0])
+            palavra_concluida(0, {
+                'palavra': palavras_lista[0],
+                'escrita': escritas_lista[0],
+                'hipotese': resultado_ia['hipotese'],
+                'justificativa': resultado_ia.get('justificativa', '')
+            })
             
-            return jsonify({
+            return {
                 'transcricao': escritas_lista[0],
                 'hipotese': resultado_ia['hipotese'],
-                'justificativa': resultado_ia['justificativa'],
-                'modo': 'transcricao_previa' if transcricao_previa else 'simulacao_ocr'
-            })
+                'justificativa': resultado_ia.get('justificativa', ''),
+                'modo': modo_texto or 'simulacao_ocr'
+            }, 200
         
         # Se houver múltiplas palavras/escritas
         else:
-            print(f"[DEBUG] Analisando múltiplas palavras...")
-            resultado_ia = analisar_multiplas_palavras(palavras_lista, escritas_lista)
+            if MODO_LOTE:
+                # Uma única chamada classifica todas as palavras e a hipótese geral
+                logger.debug("Analisando múltiplas palavras (modo em lote)")
+                resultado_ia = analisar_multiplas_palavras_em_lote(
+                    palavras_lista, escritas_lista, ao_concluir=palavra_concluida
+                )
+            else:
+                logger.debug("Analisando múltiplas palavras")
+                resultado_ia = analisar_multiplas_palavras(
+                    palavras_lista, escritas_lista, ao_concluir=palavra_concluida
+                )
             
-            return jsonify({
+            return {
                 'transcricao': ', '.join(escritas_lista),
                 'hipotese': resultado_ia['hipotese'],
                 'justificativa': resultado_ia['justificativa'],
                 'analises_individuais': resultado_ia.get('analises_individuais', []),
-                'modo': 'transcricao_previa' if transcricao_previa else 'simulacao_ocr_multiplas'
-            })
+                'modo': modo_texto or 'simulacao_ocr_multiplas'
+            }, 200
 
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"[ERROR] Erro ao processar análise:")
-        print(error_details)
-        return jsonify({
+        logger.exception("Erro ao processar análise")
+        return {
             'error': f'Ocorreu um erro ao processar: {str(e)}'
-        }), 500
+        }, 500
+
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Rota que analisa a turma inteira de uma vez.
+    
+    Aceita:
+    - "arquivo_zip": ZIP com as fotos e um manifesto CSV (aluno; arquivo; palavras_ditadas)
+    - "files": várias fotos, com o manifesto CSV opcional no campo "manifesto"
+    Sem manifesto, "palavras_ditadas" vale para todos os alunos. Os campos
+    escola, turma, professor e data valem para todos os alunos do envio.
+    
+    A resposta é NDJSON: uma linha por aluno, na ordem em que terminam, e uma
+    linha final com o resumo. Um aluno com erro não interrompe os demais.
+    """
+    request.max_content_length = TURMA_UPLOAD_MAX_BYTES
+    palavras_padrao = request.form.get('palavras_ditadas', '').strip()
+    identificacao = _ler_identificacao()
+    
+    try:
+        if 'arquivo_zip' in request.files:
+            itens = analise_turma.itens_do_zip(
+                _desanexar_stream(request.files['arquivo_zip']), palavras_padrao, UPLOAD_MAX_BYTES
+            )
+        elif request.files.getlist('files'):
+            manifesto = request.files.get('manifesto')
+            itens = analise_turma.itens_dos_arquivos(
+                [(f.filename, _desanexar_stream(f)) for f in request.files.getlist('files')],
+                manifesto.stream.read() if manifesto else None,
+                palavras_padrao
+            )
+        else:
+            return jsonify({'error': 'Envie um ZIP (campo arquivo_zip) ou as fotos (campo files)'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info("Análise da turma iniciada", extra={'total_alunos': len(itens)})
+    
+    def analisar_aluno(palavras_ditadas, imagem_bytes, aluno):
+        return _analisar_aluno(palavras_ditadas, imagem_bytes, dict(identificacao, aluno=aluno))
+    
+    def gerar_linhas():
+        for linha in analise_turma.processar_turma(itens, analisar_aluno):
+            yield json.dumps(linha, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(gerar_linhas()), mimetype='application/x-ndjson')
+
+
+def _desanexar_stream(file):
+    """
+    Tira o buffer do arquivo da requisição. O Flask fecha os arquivos enviados
+    quando a view retorna, mas a resposta em streaming continua lendo as fotos
+    depois disso; o buffer em memória é liberado quando a análise termina.
+    """
+    stream = file.stream
+    file.stream = io.BytesIO()
+    return stream
+
+
+def _analisar_aluno(palavras_ditadas: str, imagem_bytes: bytes, identificacao: dict) -> tuple:
+    """Analisa a foto de um aluno do envio da turma, como na rota /analyze."""
+    if detectar_tipo_imagem(imagem_bytes[:16]) is None:
+        return {'error': 'O arquivo não é uma imagem suportada (JPEG, PNG, WEBP, GIF ou BMP)'}, 415
+    if not _separar_itens(palavras_ditadas):
+        return {'error': 'Nenhuma palavra ou frase ditada foi informada'}, 400
+    return processar_analise(palavras_ditadas, '', imagem_bytes, identificacao=identificacao)
+
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Variante de /analyze que entrega o resultado aos poucos, via Server-Sent Events.
+    
+    Recebe o mesmo formulário de /analyze e emite, nesta ordem:
+    - "transcricao": o texto lido da imagem (ou a transcrição prévia)
+    - "palavra": a classificação de cada palavra, assim que fica pronta
+    - "sintese": a resposta completa, igual à de /analyze, com a hipótese geral
+    Em caso de falha, o último evento é "erro".
+    """
+    
+    with metricas.medir_etapa('leitura_upload'):
+        dados, imagem_bytes, erro = _ler_requisicao_analise()
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    
+    eventos = queue.Queue()
+    
+    def analisar():
+        try:
+            resposta, status = processar_analise(
+                dados['palavras_ditadas'], dados['transcricao_previa'], imagem_bytes, eventos.put, dados['debug'],
+                dados['identificacao']
+            )
+        except Exception as e:
+            resposta, status = {'error': f'Ocorreu um erro ao processar: {str(e)}'}, 500
+        eventos.put({'etapa': 'sintese' if status == 200 else 'erro', 'status_http': status, **resposta})
+        eventos.put(None)
+    
+    # A análise roda em outra thread para que esta possa enviar cada evento assim que chega
+    # (com o contexto desta, para levar o id da requisição)
+    contexto = contextvars.copy_context()
+    threading.Thread(target=contexto.run, args=(analisar,), name='analise-stream', daemon=True).start()
+    
+    def gerar_eventos():
+        while True:
+            try:
+                evento = eventos.get(timeout=15)
+            except queue.Empty:
+                # Comentário SSE: mantém a conexão aberta em proxies com tempo limite ocioso
+                yield ': aguardando\n\n'
+                continue
+            if evento is None:
+                return
+            nome = evento.pop('etapa')
+            yield f"event: {nome}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+    
+    return Response(gerar_eventos(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def iniciar_tarefas_em_segundo_plano():
+    """Inicia (uma vez por processo) os workers que executam as tarefas assíncronas."""
+    
+    def processar(dados, imagem_bytes, progresso):
+        # As linhas de log da tarefa levam o id da requisição que a criou
+        registro.definir_id_requisicao(dados.get('id_requisicao'))
+        
+        # O resultado parcial da tarefa acumula a transcrição e as palavras já classificadas
+        parcial = {}
+        
+        def acumular(evento):
+            if evento['etapa'] == 'palavra':
+                parcial.setdefault('analises_individuais', []).append(evento['analise'])
+            elif 'transcricao' in evento:
+                parcial['transcricao'] = evento['transcricao']
+            progresso(dict(parcial, etapa=evento['etapa']))
+        
+        return processar_analise(
+            dados['palavras_ditadas'], dados['transcricao_previa'], imagem_bytes, acumular, dados.get('debug', False),
+            dados.get('identificacao')
+        )
+    
+    tarefas.iniciar_workers(processar)
+
+
+@app.route('/jobs/<tarefa_id>', methods=['GET'])
+def consultar_job(tarefa_id):
+    """Rota que informa o status e o resultado (parcial ou final) de uma tarefa assíncrona."""
+    tarefa = tarefas.consultar_tarefa(tarefa_id)
+    if tarefa is None:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    
+    return jsonify(tarefa)
+
+
+@app.route('/sondagens/<sondagem_id>/hipotese', methods=['POST'])
+def corrigir_hipotese(sondagem_id):
+    """
+    Rota em que o professor corrige a hipótese de uma sondagem gravada.
+    Recebe JSON {"hipotese": "..."}; os agregados do /stats são ajustados na hora.
+    """
+    hipotese = (request.get_json(silent=True) or {}).get('hipotese')
+    if hipotese not in HIPOTESES:
+        return jsonify({'error': 'Hipótese inválida', 'hipoteses_validas': HIPOTESES}), 400
+    
+    if not armazenamento.corrigir_hipotese(sondagem_id, hipotese):
+        return jsonify({'error': 'Sondagem não encontrada'}), 404
+    
+    return jsonify({'status': 'ok', 'sondagem_id': sondagem_id, 'hipotese': hipotese})
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """
+    Rota com a distribuição das hipóteses de escrita por rodada de sondagem.
+    
+    Parâmetros: escola, turma e serie (opcionais). Sem turma, mostra a escola e
+    cada turma dela; sem escola, a rede toda; sem turma, também cada série.
+    Cada aluno conta uma vez por rodada, com a sondagem mais recente. Lê apenas
+    os agregados, sem percorrer os resultados gravados.
+    """
+    escola = request.args.get('escola')
+    turma = request.args.get('turma')
+    serie = request.args.get('serie')
+    if turma is not None and escola is None:
+        return jsonify({'error': 'Informe a escola da turma'}), 400
+    
+    return jsonify({
+        'escola': escola, 'turma': turma, 'serie': serie, **armazenamento.distribuicao(escola, turma, serie)
+    })
+
+
+@app.route('/relatorios', methods=['GET'])
+def relatorios_turma():
+    """
+    Rota que gera os relatórios em PDF da turma a partir das sondagens gravadas.
+    
+    Parâmetros: escola, turma (obrigatória) e rodada (opcional); formato
+    "zip" (padrão, um PDF por aluno, enviado aos poucos) ou "caderno" (um
+    único PDF com a turma toda). Cada aluno entra com a sondagem mais recente.
+    """
+    if not relatorios.PDF_DISPONIVEL:
+        return jsonify({'error': 'Relatórios em PDF desativados: instale o pacote reportlab'}), 503
+    
+    escola = request.args.get('escola', '')
+    turma = request.args.get('turma')
+    formato = request.args.get('formato', 'zip')
+    if not turma:
+        return jsonify({'error': 'Informe a turma'}), 400
+    if formato not in ('zip', 'caderno'):
+        return jsonify({'error': 'Formato inválido: use "zip" ou "caderno"'}), 400
+    
+    sondagens = relatorios.mais_recentes(armazenamento.listar(
+        escola=escola, turma=turma, rodada=request.args.get('rodada', type=int), limite=10000
+    ))
+    if not sondagens:
+        return jsonify({'error': 'Nenhuma sondagem gravada para esta turma'}), 404
+    
+    nome = relatorios.nome_arquivo(f'sondagem {escola} {turma}')
+    if formato == 'caderno':
+        if len(sondagens) > relatorios.RELATORIOS_CADERNO_MAX_ALUNOS:
+            return jsonify({
+                'error': f'Turma grande demais para o caderno ({len(sondagens)} alunos; limite de '
+                         f'{relatorios.RELATORIOS_CADERNO_MAX_ALUNOS}). Use o formato zip.'
+            }), 400
+        pdf = relatorios.gerar_caderno(sondagens, armazenamento.obter_miniatura)
+        return Response(pdf, mimetype='application/pdf', headers={
+            'Content-Disposition': _anexo(f'{nome}.pdf')
+        })
+    
+    return Response(
+        stream_with_context(relatorios.gerar_zip(sondagens, armazenamento.obter_miniatura)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': _anexo(f'{nome}.zip')}
+    )
+
+
+def _anexo(nome: str) -> str:
+    """Cabeçalho Content-Disposition com o nome do arquivo (acentos via RFC 5987)."""
+    return f"attachment; filename=\"{nome.encode('ascii', 'replace').decode()}\"; filename*=UTF-8''{quote(nome)}"
 
 
 @app.route('/health', methods=['GET'])
@@ -230,10 +732,51 @@ def health_check():
         'status': 'online',
         'modo': 'producao_simulado',
         'ocr_disponivel': False,
-        'ia_disponivel': True
+        'ia_disponivel': True,
+        'cache': cache_analises.estatisticas(),
+        'imagens_repetidas': dedup_imagens.estatisticas(),
+        'respostas_gemini': estatisticas_respostas(),
+        'resiliencia': resiliencia.estatisticas(),
+        'limite_gemini': limitador.estado(),
+        'backends_ia': backends.estado(),
+        'armazenamento': armazenamento.estatisticas()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Rota com as métricas de desempenho no formato do Prometheus (somadas entre os workers)."""
+    if not metricas.PROMETHEUS_DISPONIVEL:
+        return jsonify({'error': 'Métricas desativadas: instale o pacote prometheus-client'}), 503
+    
+    conteudo, tipo = metricas.exportar()
+    return Response(conteudo, content_type=tipo)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_grande_demais(e):
+    """Responde em JSON quando o upload passa de UPLOAD_MAX_BYTES."""
+    return jsonify({
+        'error': f'O arquivo enviado é grande demais. O limite é de {request.max_content_length / (1024 * 1024):.1f} MB.'
+    }), 413
+
+
+@app.errorhandler(UnsupportedMediaType)
+def upload_tipo_invalido(e):
+    """Responde em JSON quando o arquivo enviado não é uma imagem."""
+    return jsonify({'error': 'O arquivo enviado não é uma imagem suportada (JPEG, PNG, WEBP, GIF ou BMP)'}), 415
+
+
+@app.route('/admin/cache/limpar', methods=['POST'])
+def limpar_cache():
+    """Rota administrativa que esvazia o cache de análises."""
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    removidas = cache_analises.limpar()
+    return jsonify({'status': 'ok', 'entradas_removidas': removidas})
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,563 @@
+"""
+Armazenamento dos resultados das sondagens.
+Até aqui cada resultado existia só na página do professor: o relatório era
+montado a partir do DOM e, fechada a aba, nada podia ser consultado,
+comparado com a sondagem anterior ou reaproveitado.
+
+Cada análise concluída no /analyze (e nas rotas de streaming, tarefas e
+turma) é gravada num banco SQLite em modo WAL, com:
+- aluno, escola, turma, professor e data da sondagem
+- palavras ditadas, transcrição, hipótese de cada palavra e hipótese geral
+- o hash da foto (o SHA-256 da detecção de fotos repetidas) e uma
+  miniatura da foto, guardada uma vez por SHA-256 (fotos idênticas), para
+  os relatórios em PDF
+
+As consultas por turma (escola, turma, data) e por aluno (aluno, data) usam
+índices próprios.
+
+A distribuição das hipóteses por (escola, turma, série, rodada, hipótese) fica
+numa tabela de agregados, mantida por gatilhos do SQLite a cada resultado
+gravado e a cada correção do professor. A rota /stats lê só essa tabela, sem
+percorrer os resultados. Cada aluno conta uma vez por rodada, com a sondagem
+mais recente; a hipótese que conta é a do professor, se houver, senão a da
+análise, e só entram as hipóteses de HIPOTESES.
+
+A gravação não acontece na thread da requisição: o resultado vai para uma
+fila e uma thread de cada processo grava em lotes (até ARMAZENAMENTO_LOTE
+resultados por transação, a cada ARMAZENAMENTO_INTERVALO segundos). O
+identificador da sondagem é gerado pelo servidor e devolvido na resposta
+antes da gravação.
+
+O caminho padrão fica no diretório temporário, como o cache e a fila de
+tarefas; em produção, ARMAZENAMENTO_DB deve apontar para um disco persistente.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import re
+import atexit
+import sqlite3
+import tempfile
+import threading
+from datetime import date
+import metricas
+import registro
+from hipoteses import HIPOTESES
+
+logger = registro.obter_logger(__name__)
+
+# Configurações do armazenamento
+ARMAZENAMENTO_HABILITADO = os.environ.get('ARMAZENAMENTO_HABILITADO', '1') == '1'
+ARMAZENAMENTO_DB_PATH = os.environ.get(
+    'ARMAZENAMENTO_DB',
+    os.path.join(tempfile.gettempdir(), 'sondagem_resultados.sqlite3')
+)
+ARMAZENAMENTO_LOTE = int(os.environ.get('ARMAZENAMENTO_LOTE', '100'))
+ARMAZENAMENTO_INTERVALO = float(os.environ.get('ARMAZENAMENTO_INTERVALO', '0.5'))
+ARMAZENAMENTO_FILA_MAX = int(os.environ.get('ARMAZENAMENTO_FILA_MAX', '10000'))
+# Por quanto tempo a correção do professor espera a sondagem chegar ao banco
+ARMAZENAMENTO_CORRECAO_ESPERA = float(
+    os.environ.get('ARMAZENAMENTO_CORRECAO_ESPERA', str(4 * ARMAZENAMENTO_INTERVALO))
+)
+
+_COLUNAS = (
+    'id', 'criado_em', 'data', 'escola', 'serie', 'turma', 'rodada', 'professor', 'aluno', 'palavras_ditadas',
+    'transcricao', 'hipotese', 'justificativa', 'analises_individuais', 'modo', 'hash_imagem',
+)
+_COLUNAS_JSON = ('palavras_ditadas', 'analises_individuais')
+
+# Resultados aguardando a gravação
+_fila = queue.Queue(ARMAZENAMENTO_FILA_MAX)
+_gravador = {"thread": None, "pid": None}
+_gravador_lock = threading.Lock()
+
+# Uma conexão SQLite por thread
+_local = threading.local()
+
+_estatisticas = {"gravadas": 0, "descartadas": 0, "erros": 0}
+_estatisticas_lock = threading.Lock()
+
+# Hipótese que conta nos agregados: a corrigida pelo professor ou, sem correção, a da análise
+_HIPOTESE_EFETIVA = "COALESCE({0}.hipotese_professor, {0}.hipotese)"
+
+# Só as hipóteses de escrita entram nos agregados (nunca "Erro na Análise" ou valores antigos)
+_HIPOTESE_VALIDA = "{0} IN (" + ", ".join("'" + h.replace("'", "''") + "'" for h in HIPOTESES) + ")"
+
+# Série no nome da turma: "1º Ano B", "1 ano", "2ª série", "2a serie"
+_SERIE = re.compile(r'(\d+)\s*[º°ªoa]?\.?\s*(ano|s[ée]rie)\b', re.IGNORECASE)
+
+# Colunas que identificam o aluno numa rodada: reanálises com a mesma chave substituem a anterior
+_CHAVE_ALUNO = ('aluno', 'escola', 'serie', 'turma', 'rodada')
+
+
+def _mesmo_aluno(linha: str, tabela: str = 'sondagens') -> str:
+    """Condição SQL: a sondagem da tabela é do mesmo aluno, turma e rodada que a linha (OLD ou NEW)."""
+    return " AND ".join(f"{tabela}.{coluna} = {linha}.{coluna}" for coluna in _CHAVE_ALUNO)
+
+
+def _contar_na_distribuicao(linha: str) -> str:
+    """Soma 1 na distribuição para a sondagem (OLD ou NEW), se ela for a atual do aluno e tiver hipótese válida."""
+    hipotese = _HIPOTESE_EFETIVA.format(linha)
+    return f"""
+        INSERT INTO distribuicao (escola, turma, serie, rodada, hipotese, quantidade)
+        SELECT {linha}.escola, {linha}.turma, {linha}.serie, {linha}.rodada, {hipotese}, 1
+        WHERE {linha}.atual = 1 AND {_HIPOTESE_VALIDA.format(hipotese)}
+        ON CONFLICT (escola, turma, serie, rodada, hipotese) DO UPDATE SET quantidade = quantidade + 1;
+    """
+
+
+def _descontar_da_distribuicao(linha: str) -> str:
+    """Subtrai 1 da distribuição para a sondagem, se ela contava (ver _contar_na_distribuicao)."""
+    return f"""
+        UPDATE distribuicao SET quantidade = quantidade - 1
+        WHERE {linha}.atual = 1 AND escola = {linha}.escola AND turma = {linha}.turma
+          AND serie = {linha}.serie AND rodada = {linha}.rodada AND hipotese = {_HIPOTESE_EFETIVA.format(linha)};
+    """
+
+
+# Cada aluno conta uma vez por rodada, com a sondagem mais recente (coluna atual).
+# Reanálises do mesmo aluno tiram a anterior da contagem; sondagens sem o nome
+# do aluno contam uma a uma.
+_GATILHOS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sondagens_inserir AFTER INSERT ON sondagens
+    BEGIN
+        {_contar_na_distribuicao('NEW')}
+        UPDATE sondagens SET atual = 0
+        WHERE NEW.aluno <> '' AND atual = 1 AND {_mesmo_aluno('NEW')} AND id <> NEW.id
+          AND (criado_em < NEW.criado_em OR (criado_em = NEW.criado_em AND id < NEW.id));
+        UPDATE sondagens SET atual = 0
+        WHERE id = NEW.id AND NEW.aluno <> '' AND EXISTS (
+            SELECT 1 FROM sondagens AS outra
+            WHERE outra.atual = 1 AND {_mesmo_aluno('NEW', 'outra')} AND outra.id <> NEW.id
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sondagens_atualizar
+    AFTER UPDATE OF hipotese, hipotese_professor, atual ON sondagens
+    WHEN OLD.atual IS NOT NEW.atual OR {_HIPOTESE_EFETIVA.format('OLD')} IS NOT {_HIPOTESE_EFETIVA.format('NEW')}
+    BEGIN
+        {_descontar_da_distribuicao('OLD')}
+        {_contar_na_distribuicao('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sondagens_excluir AFTER DELETE ON sondagens
+    BEGIN
+        {_descontar_da_distribuicao('OLD')}
+        UPDATE sondagens SET atual = 1
+        WHERE OLD.atual = 1 AND OLD.aluno <> '' AND id = (
+            SELECT id FROM sondagens WHERE {_mesmo_aluno('OLD')}
+            ORDER BY criado_em DESC, id DESC LIMIT 1
+        );
+    END
+    """,
+)
+
+
+def _criar_esquema(conn):
+    """
+    Cria as tabelas, os índices e os gatilhos. A transação exclusiva evita que
+    dois workers façam isso ao mesmo tempo.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sondagens (
+                id TEXT PRIMARY KEY,
+                criado_em REAL NOT NULL,
+                data TEXT NOT NULL,
+                escola TEXT NOT NULL DEFAULT '',
+                serie TEXT NOT NULL DEFAULT '',
+                turma TEXT NOT NULL DEFAULT '',
+                rodada INTEGER NOT NULL DEFAULT 0,
+                professor TEXT NOT NULL DEFAULT '',
+                aluno TEXT NOT NULL DEFAULT '',
+                palavras_ditadas TEXT NOT NULL,
+                transcricao TEXT,
+                hipotese TEXT,
+                hipotese_professor TEXT,
+                corrigido_em REAL,
+                justificativa TEXT,
+                analises_individuais TEXT,
+                modo TEXT,
+                hash_imagem TEXT,
+                atual INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sondagens_turma ON sondagens (escola, turma, data)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sondagens_aluno ON sondagens (aluno, data)")
+        # Sondagem atual de cada aluno por rodada, consultada pelos gatilhos a cada gravação
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sondagens_atual "
+            "ON sondagens (aluno, escola, serie, turma, rodada) WHERE atual = 1"
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS miniaturas (
+                hash_imagem TEXT PRIMARY KEY,
+                imagem BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS distribuicao (
+                escola TEXT NOT NULL,
+                turma TEXT NOT NULL,
+                serie TEXT NOT NULL,
+                rodada INTEGER NOT NULL,
+                hipotese TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (escola, turma, serie, rodada, hipotese)
+            ) WITHOUT ROWID
+        """)
+        for gatilho in _GATILHOS:
+            conn.execute(gatilho)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _conexao():
+    """Retorna a conexão SQLite da thread atual, criando as tabelas se necessário."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # timeout é o busy_timeout do SQLite: espera o lock de escrita de outro worker em vez de falhar
+        conn = sqlite3.connect(ARMAZENAMENTO_DB_PATH, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _criar_esquema(conn)
+        conn.isolation_level = ''
+        _local.conn = conn
+    return conn
+
+
+def _contar(campo: str, quantidade: int = 1):
+    with _estatisticas_lock:
+        _estatisticas[campo] += quantidade
+    metricas.contar('armazenamento', quantidade, resultado=campo)
+
+
+def _rodada_valida(texto) -> int:
+    """Retorna o número da rodada da sondagem (1, 2, ...), ou 0 se não foi informada."""
+    try:
+        return max(0, int(str(texto).strip()))
+    except ValueError:
+        return 0
+
+
+def _serie_da_turma(turma: str) -> str:
+    """Extrai a série do nome da turma ("1º Ano B" -> "1º ano", "2a série" -> "2ª série"), ou vazio."""
+    encontrado = _SERIE.search(turma or '')
+    if not encontrado:
+        return ''
+    if encontrado.group(2).lower() == 'ano':
+        return f"{encontrado.group(1)}º ano"
+    return f"{encontrado.group(1)}ª série"
+
+
+def _data_valida(texto: str) -> str:
+    """Retorna a data no formato AAAA-MM-DD, ou a data de hoje se ela não for válida."""
+    try:
+        return date.fromisoformat((texto or '').strip()).isoformat()
+    except ValueError:
+        return date.today().isoformat()
+
+
+def precisa_miniatura(hash_imagem) -> bool:
+    """Indica se vale gerar a miniatura desta foto (nenhuma gravada ainda com este SHA-256)."""
+    if not ARMAZENAMENTO_HABILITADO or hash_imagem is None:
+        return False
+    try:
+        return _conexao().execute(
+            "SELECT 1 FROM miniaturas WHERE hash_imagem = ?", (hash_imagem,)
+        ).fetchone() is None
+    except sqlite3.Error:
+        return True
+
+
+def registrar(identificacao: dict, palavras_ditadas: list, resultado: dict, hash_imagem=None,
+              miniatura: bytes = None):
+    """
+    Coloca o resultado de uma análise na fila de gravação.
+
+    Args:
+        identificacao: Campos do formulário (aluno, escola, serie, turma, rodada, professor, data);
+            sem a série, ela é lida do nome da turma ("1º Ano B" -> "1º ano")
+        palavras_ditadas: Lista das palavras ditadas
+        resultado: Resposta da análise (transcrição, hipótese, justificativa, ...)
+        hash_imagem: SHA-256 da foto (ver dedup_imagens.calcular_hash), se houver
+        miniatura: Miniatura JPEG da foto (ver precisa_miniatura), se houver
+
+    Returns:
+        str: Identificador da sondagem, ou None se o armazenamento estiver
+             desligado ou a fila estiver cheia
+    """
+    if not ARMAZENAMENTO_HABILITADO:
+        return None
+
+    sondagem_id = uuid.uuid4().hex
+    linha = (
+        sondagem_id,
+        time.time(),
+        _data_valida(identificacao.get('data')),
+        identificacao.get('escola', ''),
+        (identificacao.get('serie') or '').strip() or _serie_da_turma(identificacao.get('turma', '')),
+        identificacao.get('turma', ''),
+        _rodada_valida(identificacao.get('rodada')),
+        identificacao.get('professor', ''),
+        identificacao.get('aluno', ''),
+        json.dumps(palavras_ditadas, ensure_ascii=False),
+        resultado.get('transcricao'),
+        resultado.get('hipotese'),
+        resultado.get('justificativa'),
+        json.dumps(resultado.get('analises_individuais', []), ensure_ascii=False),
+        resultado.get('modo'),
+        hash_imagem,
+    )
+
+    _iniciar_gravador()
+    try:
+        _fila.put_nowait((linha, miniatura))
+    except queue.Full:
+        # Melhor perder o registro do que segurar a resposta ao professor
+        _contar("descartadas")
+        logger.warning("Fila do armazenamento cheia; resultado não gravado", extra={'pendentes': _fila.qsize()})
+        return None
+    return sondagem_id
+
+
+def _gravar(itens: list):
+    linhas = [linha for linha, _ in itens]
+    miniaturas = [(linha[_COLUNAS.index('hash_imagem')], miniatura) for linha, miniatura in itens if miniatura]
+    try:
+        conn = _conexao()
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO sondagens ({', '.join(_COLUNAS)}) VALUES ({', '.join('?' * len(_COLUNAS))})",
+                linhas
+            )
+            conn.executemany("INSERT OR IGNORE INTO miniaturas (hash_imagem, imagem) VALUES (?, ?)", miniaturas)
+        _contar("gravadas", len(linhas))
+    except sqlite3.Error as e:
+        _contar("erros", len(linhas))
+        logger.warning("Erro ao gravar resultados", extra={'erro': str(e), 'resultados': len(linhas)})
+
+
+def _executar_gravador():
+    """Junta os resultados da fila em lotes e grava cada lote numa única transação."""
+    while True:
+        item = _fila.get()
+        if item is None:
+            return
+        lote = [item]
+        limite = time.monotonic() + ARMAZENAMENTO_INTERVALO
+        while len(lote) < ARMAZENAMENTO_LOTE:
+            try:
+                item = _fila.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                _gravar(lote)
+                return
+            lote.append(item)
+        _gravar(lote)
+
+
+def _iniciar_gravador():
+    """Inicia a thread de gravação (uma por processo; a do pai não sobrevive ao fork)."""
+    if _gravador["pid"] == os.getpid():
+        return
+    with _gravador_lock:
+        if _gravador["pid"] == os.getpid():
+            return
+        thread = threading.Thread(target=_executar_gravador, name='armazenamento', daemon=True)
+        thread.start()
+        _gravador.update(thread=thread, pid=os.getpid())
+
+
+def _parar_gravador():
+    """Grava o que ainda estiver na fila antes de o processo terminar."""
+    if _gravador["pid"] == os.getpid():
+        _fila.put(None)
+        _gravador["thread"].join(timeout=10)
+
+
+atexit.register(_parar_gravador)
+
+
+def _converter(linha: sqlite3.Row) -> dict:
+    sondagem = dict(linha)
+    for coluna in _COLUNAS_JSON:
+        sondagem[coluna] = json.loads(sondagem[coluna]) if sondagem[coluna] else []
+    return sondagem
+
+
+def obter(sondagem_id: str):
+    """
+    Busca uma sondagem gravada pelo identificador.
+
+    Returns:
+        dict: A sondagem, ou None se ela não existir (ou ainda estiver na fila)
+    """
+    linha = _conexao().execute("SELECT * FROM sondagens WHERE id = ?", (sondagem_id,)).fetchone()
+    return _converter(linha) if linha else None
+
+
+def obter_miniatura(hash_imagem: str):
+    """Retorna a miniatura JPEG gravada para o SHA-256 da foto (hash_imagem da sondagem), ou None."""
+    if not hash_imagem:
+        return None
+    linha = _conexao().execute("SELECT imagem FROM miniaturas WHERE hash_imagem = ?", (hash_imagem,)).fetchone()
+    return linha[0] if linha else None
+
+
+def listar(escola: str = None, turma: str = None, aluno: str = None, rodada: int = None,
+           desde: str = None, ate: str = None, limite: int = 500, serie: str = None) -> list:
+    """
+    Lista as sondagens gravadas, das mais antigas para as mais recentes.
+
+    Para usar os índices, informe a escola e a turma, ou o aluno. Datas no
+    formato AAAA-MM-DD; desde e ate incluem o próprio dia.
+
+    Returns:
+        list: Sondagens (dicts com as colunas da tabela)
+    """
+    condicoes, parametros = [], []
+    for coluna, valor in (('escola', escola), ('serie', serie), ('turma', turma), ('aluno', aluno), ('rodada', rodada)):
+        if valor is not None:
+            condicoes.append(f"{coluna} = ?")
+            parametros.append(valor)
+    if desde:
+        condicoes.append("data >= ?")
+        parametros.append(desde)
+    if ate:
+        condicoes.append("data <= ?")
+        parametros.append(ate)
+
+    consulta = "SELECT * FROM sondagens"
+    if condicoes:
+        consulta += " WHERE " + " AND ".join(condicoes)
+    consulta += " ORDER BY data, criado_em LIMIT ?"
+    parametros.append(limite)
+    return [_converter(linha) for linha in _conexao().execute(consulta, parametros)]
+
+
+def corrigir_hipotese(sondagem_id: str, hipotese: str) -> bool:
+    """
+    Registra a hipótese escolhida pelo professor no lugar da hipótese da análise.
+    Os agregados da turma são ajustados na mesma transação (gatilho).
+
+    O identificador vai na resposta antes da gravação, então a correção pode
+    chegar (a qualquer worker) com a sondagem ainda na fila de outro processo.
+    Sem a sondagem no banco, o UPDATE é tentado de novo por até
+    ARMAZENAMENTO_CORRECAO_ESPERA segundos, o tempo de um lote ser gravado.
+    Se o lock de escrita estiver com outra conexão, o UPDATE espera por ele
+    (busy_timeout da conexão).
+
+    Returns:
+        bool: False se a sondagem não existir
+    """
+    limite = time.monotonic() + ARMAZENAMENTO_CORRECAO_ESPERA
+    pausa = 0.05
+    while True:
+        conn = _conexao()
+        with conn:
+            # BEGIN IMMEDIATE: pega o lock de escrita antes de ler, para ver o último lote gravado
+            conn.execute("BEGIN IMMEDIATE")
+            atualizadas = conn.execute(
+                "UPDATE sondagens SET hipotese_professor = ?, corrigido_em = ? WHERE id = ?",
+                (hipotese, time.time(), sondagem_id)
+            ).rowcount
+        restante = limite - time.monotonic()
+        if atualizadas or restante <= 0:
+            return bool(atualizadas)
+        time.sleep(min(pausa, restante))
+        pausa = min(pausa * 2, 0.5)
+
+
+def _resumir_rodadas(linhas) -> list:
+    """
+    Monta, para cada rodada, a quantidade e o percentual de cada hipótese e a
+    variação em pontos percentuais em relação à rodada anterior (a rodada 0,
+    de sondagens sem rodada informada, não entra na comparação).
+    """
+    por_rodada = {}
+    for rodada, hipotese, quantidade in linhas:
+        contagem = por_rodada.setdefault(rodada, {})
+        contagem[hipotese] = contagem.get(hipotese, 0) + quantidade
+
+    rodadas = []
+    anterior = None
+    for rodada in sorted(por_rodada):
+        contagem = por_rodada[rodada]
+        total = sum(contagem.values())
+        percentuais = {h: round(100 * q / total, 1) for h, q in contagem.items()}
+        resumo = {
+            'rodada': rodada,
+            'total': total,
+            'hipoteses': {h: {'quantidade': contagem[h], 'percentual': percentuais[h]} for h in contagem},
+        }
+        if anterior is not None:
+            resumo['variacao'] = {
+                h: round(percentuais.get(h, 0.0) - anterior.get(h, 0.0), 1)
+                for h in set(percentuais) | set(anterior)
+            }
+        rodadas.append(resumo)
+        if rodada > 0:
+            anterior = percentuais
+    return rodadas
+
+
+def distribuicao(escola: str = None, turma: str = None, serie: str = None) -> dict:
+    """
+    Distribuição das hipóteses de escrita por rodada, lida da tabela de agregados.
+
+    Cada aluno conta uma vez por rodada, com a sondagem mais recente (e a
+    correção do professor, se houver). Com escola e turma, lê só as linhas da
+    turma (prefixo da chave primária); só com a escola, soma as turmas da
+    escola e mostra cada turma; sem nenhum dos dois, soma a rede toda. Sem a
+    turma, mostra também cada série. A série, se informada, filtra qualquer um
+    dos casos. O custo depende
+    do número de turmas, séries, rodadas e hipóteses, não do número de
+    resultados gravados.
+
+    Returns:
+        dict: {'rodadas': [...]}; sem a turma, também {'series': {serie: [...]}}
+              e, para a escola, {'turmas': {turma: [...]}}
+    """
+    conn = _conexao()
+    condicoes, parametros = ["quantidade > 0"], []
+    for coluna, valor in (('escola', escola), ('turma', turma), ('serie', serie)):
+        if valor is not None:
+            condicoes.append(f"{coluna} = ?")
+            parametros.append(valor)
+    linhas = conn.execute(
+        f"SELECT turma, serie, rodada, hipotese, SUM(quantidade) FROM distribuicao "
+        f"WHERE {' AND '.join(condicoes)} GROUP BY turma, serie, rodada, hipotese",
+        parametros
+    ).fetchall()
+
+    resumo = {'rodadas': _resumir_rodadas(tuple(linha)[2:] for linha in linhas)}
+    if turma is None:
+        por_turma, por_serie = {}, {}
+        for linha in linhas:
+            por_turma.setdefault(linha[0], []).append(tuple(linha)[2:])
+            por_serie.setdefault(linha[1], []).append(tuple(linha)[2:])
+        resumo['series'] = {nome: _resumir_rodadas(itens) for nome, itens in sorted(por_serie.items())}
+        if escola is not None:
+            resumo['turmas'] = {nome: _resumir_rodadas(itens) for nome, itens in sorted(por_turma.items())}
+    return resumo
+
+
+def estatisticas() -> dict:
+    """Retorna os contadores de gravação deste processo."""
+    with _estatisticas_lock:
+        dados = dict(_estatisticas)
+    dados["pendentes"] = _fila.qsize()
+    dados["habilitado"] = ARMAZENAMENTO_HABILITADO
+    return dados
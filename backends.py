@@ -0,0 +1,432 @@
+"""
+Backends de IA plugáveis e roteamento por latência.
+Até aqui o app só sabia chamar o Gemini: uma região lenta ou uma queda do
+provedor definia o p99 de todas as análises. Este módulo separa "quem
+responde" de "o que perguntar":
+
+1. Backend: interface comum (gerar(instrucoes, conteudo, esquema) -> RespostaBackend)
+2. Registro: Gemini, endpoints compatíveis com a API da OpenAI e um stub local
+   determinístico (triagem por regras), registrados pelo ai_analyzer
+3. Roteador: acompanha a latência recente (média móvel) e a taxa de erro de
+   cada backend, manda cada chamada ao mais rápido que estiver saudável e,
+   se ele falhar, passa para o próximo na hora
+
+Os backends ativos e a ordem de preferência vêm de ANALISE_BACKENDS (padrão
+"gemini", o comportamento de antes). Backends de reserva (o stub local) só
+são usados quando todos os outros falham.
+
+O estado (latências, erros, disjuntores) é de cada processo do gunicorn.
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import random
+import threading
+from collections import deque
+from typing import NamedTuple
+import google.generativeai as genai
+import limitador
+import metricas
+import registro
+import resiliencia
+import triagem
+
+try:
+    import openai
+    OPENAI_DISPONIVEL = True
+except ImportError:
+    openai = None
+    OPENAI_DISPONIVEL = False
+
+logger = registro.obter_logger(__name__)
+
+# Backends usados, em ordem de preferência (ex.: "gemini,openai,local")
+ANALISE_BACKENDS = [
+    nome.strip() for nome in os.environ.get('ANALISE_BACKENDS', 'gemini').split(',') if nome.strip()
+]
+
+# Configurações do roteador
+ROTEADOR_MIN_AMOSTRAS = int(os.environ.get('ROTEADOR_MIN_AMOSTRAS', '5'))
+ROTEADOR_EXPLORACAO = float(os.environ.get('ROTEADOR_EXPLORACAO', '0.05'))
+ROTEADOR_JANELA = int(os.environ.get('ROTEADOR_JANELA', '50'))
+
+# Backend compatível com a API da OpenAI (OpenAI, Azure, vLLM, Ollama, etc.)
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+OPENAI_MODELO = os.environ.get('OPENAI_MODELO', 'gpt-4.1-mini')
+OPENAI_MODELO_VISAO = os.environ.get('OPENAI_MODELO_VISAO', OPENAI_MODELO)
+
+
+class RespostaBackend(NamedTuple):
+    """Resposta de qualquer backend, no formato que o ai_analyzer usa."""
+    texto: str
+    modelo: str
+    tokens_entrada: int = 0
+    tokens_saida: int = 0
+    tokens_em_cache: int = 0
+
+
+def tem_imagem(conteudo) -> bool:
+    return isinstance(conteudo, list) and any(not isinstance(parte, str) for parte in conteudo)
+
+
+class Backend:
+    """
+    Interface dos backends. Cada um tem seu próprio disjuntor e suas
+    estatísticas de latência e erro, usadas pelo roteador.
+    """
+
+    nome = ''
+    modelo_texto = ''  # Modelo das chamadas só de texto (entra na chave do cache de análises)
+    aceita_imagem = True
+    reserva = False  # Só usado quando todos os backends principais falham
+
+    def __init__(self, disjuntor: resiliencia.Disjuntor = None):
+        self.disjuntor = disjuntor or resiliencia.Disjuntor(
+            resiliencia.CIRCUITO_LIMITE_FALHAS, resiliencia.CIRCUITO_TEMPO_ABERTO
+        )
+        self._lock = threading.Lock()
+        self._latencia_media = None
+        self._amostras = 0
+        self._resultados = deque(maxlen=ROTEADOR_JANELA)
+
+    def disponivel(self) -> bool:
+        """Indica se o backend está configurado (chave, pacote instalado)."""
+        return True
+
+    def gerar(self, instrucoes: str, conteudo, esquema: dict = None) -> RespostaBackend:
+        """
+        Faz uma chamada ao modelo.
+
+        Args:
+            instrucoes: Instruções de sistema
+            conteudo: Texto da tarefa, ou lista [texto, {"mime_type", "data"}] com a imagem
+            esquema: Esquema JSON da resposta (no formato do Gemini), se houver
+        """
+        raise NotImplementedError
+
+    def registrar(self, segundos: float, sucesso: bool):
+        with self._lock:
+            self._resultados.append(sucesso)
+            if sucesso:
+                self._amostras += 1
+                # Média móvel exponencial: reage a uma região lenta em poucas chamadas
+                self._latencia_media = segundos if self._latencia_media is None else (
+                    0.8 * self._latencia_media + 0.2 * segundos
+                )
+
+    def taxa_erro(self) -> float:
+        with self._lock:
+            if not self._resultados:
+                return 0.0
+            return 1 - sum(self._resultados) / len(self._resultados)
+
+    def custo(self) -> float:
+        """Latência esperada por chamada bem-sucedida; 0 enquanto houver poucas amostras (explora)."""
+        with self._lock:
+            if self._amostras < ROTEADOR_MIN_AMOSTRAS:
+                return 0.0
+            latencia = self._latencia_media
+        return latencia / max(0.05, 1 - self.taxa_erro())
+
+    def estado(self) -> dict:
+        with self._lock:
+            latencia = self._latencia_media
+        return {
+            'disponivel': self.disponivel(),
+            'reserva': self.reserva,
+            'disjuntor': self.disjuntor.estado(),
+            'latencia_media_ms': round(latencia * 1000) if latencia is not None else None,
+            'taxa_erro': round(self.taxa_erro(), 3),
+        }
+
+
+class BackendGemini(Backend):
+    """
+    Google Gemini. Os modelos vêm do registro do ai_analyzer (um por processo)
+    e cada tentativa passa pelo limitador de cota compartilhado entre os workers.
+    """
+
+    nome = 'gemini'
+
+    def __init__(self, obter_modelo, modelo_texto: str, modelo_visao: str, chamadas_simultaneas,
+                 tempo_limite: float, saida_estruturada: bool, configurado, disjuntor=None):
+        super().__init__(disjuntor)
+        self.obter_modelo = obter_modelo
+        self.modelo_texto = modelo_texto
+        self.modelo_visao = modelo_visao
+        self.chamadas_simultaneas = chamadas_simultaneas
+        self.tempo_limite = tempo_limite
+        self.saida_estruturada = saida_estruturada
+        self.configurado = configurado
+
+    def disponivel(self) -> bool:
+        return self.configurado()
+
+    def gerar(self, instrucoes, conteudo, esquema=None):
+        model = self.obter_modelo(self.modelo_visao if tem_imagem(conteudo) else self.modelo_texto, instrucoes)
+        kwargs = {'request_options': {'timeout': self.tempo_limite}}
+        if esquema and self.saida_estruturada:
+            kwargs['generation_config'] = genai.GenerationConfig(
+                response_mime_type='application/json',
+                response_schema=esquema,
+            )
+
+        # A vaga de chamada simultânea só é ocupada durante a chamada, não durante a espera pela cota
+        tokens_estimados = _estimar_tokens(conteudo)
+        limitador.adquirir(tokens_estimados)
+        with self.chamadas_simultaneas:
+            resposta = model.generate_content(conteudo, **kwargs)
+        uso = getattr(resposta, 'usage_metadata', None)
+        limitador.acertar(tokens_estimados, getattr(uso, 'total_token_count', 0))
+
+        return RespostaBackend(
+            texto=resposta.text,
+            modelo=getattr(model, 'model_name', ''),
+            tokens_entrada=getattr(uso, 'prompt_token_count', 0) or 0,
+            tokens_saida=getattr(uso, 'candidates_token_count', 0) or 0,
+            tokens_em_cache=getattr(uso, 'cached_content_token_count', 0) or 0,
+        )
+
+
+class BackendOpenAI(Backend):
+    """
+    Endpoint compatível com a API de chat da OpenAI (OPENAI_BASE_URL aponta
+    para outro provedor ou um servidor próprio). Requer o pacote openai.
+    """
+
+    nome = 'openai'
+
+    def __init__(self, chamadas_simultaneas, tempo_limite: float, disjuntor=None):
+        super().__init__(disjuntor)
+        self.modelo_texto = OPENAI_MODELO
+        self.chamadas_simultaneas = chamadas_simultaneas
+        self.tempo_limite = tempo_limite
+        self._cliente = None
+        self._cliente_pid = None
+
+    def disponivel(self) -> bool:
+        return OPENAI_DISPONIVEL and bool(OPENAI_API_KEY)
+
+    def _obter_cliente(self):
+        # Como os modelos do Gemini, o cliente (e seu pool de conexões) é recriado após o fork
+        with self._lock:
+            if self._cliente_pid != os.getpid():
+                self._cliente = openai.OpenAI(
+                    api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, timeout=self.tempo_limite, max_retries=0
+                )
+                self._cliente_pid = os.getpid()
+            return self._cliente
+
+    def gerar(self, instrucoes, conteudo, esquema=None):
+        if tem_imagem(conteudo):
+            partes = []
+            for parte in conteudo:
+                if isinstance(parte, str):
+                    partes.append({"type": "text", "text": parte})
+                else:
+                    dados = base64.b64encode(parte["data"]).decode('ascii')
+                    partes.append({"type": "image_url", "image_url": {"url": f"data:{parte['mime_type']};base64,{dados}"}})
+            modelo, mensagem = OPENAI_MODELO_VISAO, partes
+        else:
+            modelo, mensagem = OPENAI_MODELO, conteudo
+
+        with self.chamadas_simultaneas:
+            resposta = self._obter_cliente().chat.completions.create(
+                model=modelo,
+                messages=[
+                    {"role": "system", "content": instrucoes or ''},
+                    {"role": "user", "content": mensagem},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.3,
+            )
+
+        uso = resposta.usage
+        detalhes = getattr(uso, 'prompt_tokens_details', None)
+        return RespostaBackend(
+            texto=resposta.choices[0].message.content,
+            modelo=modelo,
+            tokens_entrada=getattr(uso, 'prompt_tokens', 0) or 0,
+            tokens_saida=getattr(uso, 'completion_tokens', 0) or 0,
+            tokens_em_cache=getattr(detalhes, 'cached_tokens', 0) or 0,
+        )
+
+
+class BackendLocal(Backend):
+    """
+    Stub determinístico, sem rede: classifica com as regras da triagem local.
+    Não lê imagens. Serve de reserva quando nenhum provedor responde e para
+    testes de carga sem chamadas externas.
+    """
+
+    nome = 'local'
+    modelo_texto = 'regras-locais'
+    aceita_imagem = False
+    reserva = True
+
+    _CLASSIFICACAO = re.compile(r'Palavra ditada: (?P<palavra>.+?)\n.*?Escrita da criança: (?P<escrita>.+)', re.DOTALL)
+    _ITEM_LOTE = re.compile(
+        r'^(?P<item>\d+)\. Palavra ditada: (?P<palavra>.+?) \(.*\) \| Escrita da criança: (?P<escrita>.+)$', re.MULTILINE
+    )
+    _ITEM_SINTESE = re.compile(r"^- .+?: escreveu '.*' → (?P<hipotese>.+)$", re.MULTILINE)
+
+    def __init__(self, hipoteses: list, disjuntor=None):
+        super().__init__(disjuntor)
+        self.hipoteses = hipoteses
+
+    def _classificar(self, palavra: str, escrita: str) -> dict:
+        resultado = triagem.classificar_localmente(palavra.strip(), escrita.strip())
+        if resultado["hipotese"] is None:
+            raise ValueError("A classificação local não decide este caso")
+        return {"hipotese": resultado["hipotese"], "justificativa": resultado["justificativa"]}
+
+    def _predominante(self, hipoteses: list) -> str:
+        # Mesmo critério da síntese: a mais frequente; no empate, a mais avançada
+        validas = [h for h in hipoteses if h in self.hipoteses]
+        if not validas:
+            raise ValueError("Nenhuma hipótese válida para a síntese local")
+        return max(set(validas), key=lambda h: (validas.count(h), self.hipoteses.index(h)))
+
+    def gerar(self, instrucoes, conteudo, esquema=None):
+        if tem_imagem(conteudo):
+            raise ValueError("O backend local não lê imagens")
+
+        itens = list(self._ITEM_LOTE.finditer(conteudo))
+        if itens:
+            analises = [
+                dict(self._classificar(m['palavra'], m['escrita']), item=int(m['item'])) for m in itens
+            ]
+            hipotese = self._predominante([a["hipotese"] for a in analises])
+            resultado = {
+                "analises_individuais": analises,
+                "hipotese": hipotese,
+                "justificativa": "Hipótese predominante entre as escritas (classificação local por regras).",
+            }
+        elif self._ITEM_SINTESE.search(conteudo):
+            hipotese = self._predominante([m['hipotese'].strip() for m in self._ITEM_SINTESE.finditer(conteudo)])
+            resultado = {
+                "hipotese": hipotese,
+                "justificativa": "Hipótese predominante entre as palavras analisadas (classificação local por regras).",
+            }
+        else:
+            encontrado = self._CLASSIFICACAO.search(conteudo)
+            if not encontrado:
+                raise ValueError("Pedido não reconhecido pelo backend local")
+            resultado = self._classificar(encontrado['palavra'].splitlines()[0], encontrado['escrita'].splitlines()[0])
+
+        return RespostaBackend(texto=json.dumps(resultado, ensure_ascii=False), modelo=self.modelo_texto)
+
+
+def _estimar_tokens(conteudo) -> int:
+    """
+    Estimativa dos tokens de uma chamada, antes de fazê-la: cerca de 4 caracteres
+    por token no texto, 258 por imagem e uma margem para as instruções de sistema
+    e a resposta. O limitador acerta a diferença com o uso real depois.
+    """
+    partes = conteudo if isinstance(conteudo, list) else [conteudo]
+    total = 800
+    for parte in partes:
+        total += len(parte) // 4 if isinstance(parte, str) else 258
+    return total
+
+
+# Registro de backends (nome -> instância)
+_backends = {}
+
+
+def registrar(backend: Backend):
+    _backends[backend.nome] = backend
+
+
+def obter(nome: str) -> Backend:
+    return _backends.get(nome)
+
+
+def ativos(com_imagem: bool = False) -> list:
+    """Backends configurados em ANALISE_BACKENDS, disponíveis e capazes de atender a chamada."""
+    return [
+        _backends[nome] for nome in ANALISE_BACKENDS
+        if nome in _backends and _backends[nome].disponivel() and (_backends[nome].aceita_imagem or not com_imagem)
+    ]
+
+
+def _ordenar(candidatos: list) -> list:
+    """
+    Ordena os backends para uma chamada: principais com o disjuntor fechado,
+    do menor para o maior custo (empate: ordem de ANALISE_BACKENDS); depois os
+    de disjuntor aberto; por último os de reserva.
+    """
+    principais = [b for b in candidatos if not b.reserva]
+    reservas = [b for b in candidatos if b.reserva]
+    principais.sort(key=lambda b: (b.disjuntor.estado() == 'aberto', b.custo()))
+
+    # De vez em quando, um backend que não é o mais rápido vai à frente, para a
+    # média dele não ficar velha (uma região pode ter se recuperado)
+    saudaveis = [b for b in principais if b.disjuntor.estado() != 'aberto']
+    if len(saudaveis) > 1 and random.random() < ROTEADOR_EXPLORACAO:
+        escolhido = random.choice(saudaveis[1:])
+        principais.remove(escolhido)
+        principais.insert(0, escolhido)
+
+    return principais + reservas
+
+
+def gerar(instrucoes: str, conteudo, etapa: str, esquema: dict = None) -> tuple:
+    """
+    Envia a chamada ao melhor backend disponível, passando para o próximo se ele falhar.
+
+    Cada backend tem novas tentativas e disjuntor próprios (resiliencia.executar).
+    Quando há outro backend depois, a tentativa é uma só: trocar de provedor é
+    mais rápido do que esperar o mesmo se recuperar.
+
+    Returns:
+        tuple: (nome do backend, RespostaBackend)
+
+    Raises:
+        resiliencia.GeminiIndisponivel: Se nenhum backend puder atender
+        Exception: O erro do último backend tentado
+    """
+    candidatos = _ordenar(ativos(tem_imagem(conteudo)))
+    if not candidatos:
+        raise resiliencia.GeminiIndisponivel("Nenhum backend de IA configurado para esta chamada.")
+
+    ultimo_erro = None
+    for posicao, backend in enumerate(candidatos):
+        ultimo = posicao == len(candidatos) - 1
+        inicio = time.perf_counter()
+        try:
+            resposta = resiliencia.executar(
+                lambda: backend.gerar(instrucoes, conteudo, esquema),
+                f'{etapa}/{backend.nome}',
+                disjuntor=backend.disjuntor,
+                tentativas=None if ultimo else 1,
+            )
+        except Exception as e:
+            duracao = time.perf_counter() - inicio
+            backend.registrar(duracao, False)
+            metricas.observar('ia', duracao, backend=backend.nome, etapa=etapa, resultado='erro')
+            ultimo_erro = e
+            if not ultimo:
+                metricas.contar('fallbacks', tipo='troca_de_backend')
+                logger.warning("Backend de IA falhou; tentando o próximo", extra={
+                    'backend': backend.nome, 'etapa': etapa, 'erro': str(e)[:200],
+                })
+            continue
+        duracao = time.perf_counter() - inicio
+        backend.registrar(duracao, True)
+        metricas.observar('ia', duracao, backend=backend.nome, etapa=etapa, resultado='ok')
+        return backend.nome, resposta
+
+    raise ultimo_erro
+
+
+def estado() -> dict:
+    """Retorna o estado de cada backend registrado, para o /health."""
+    return {
+        'ordem': ANALISE_BACKENDS,
+        'backends': {nome: backend.estado() for nome, backend in _backends.items()},
+    }
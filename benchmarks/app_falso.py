@@ -0,0 +1,167 @@
+"""
+App da sondagem com um Gemini simulado, para medir o servidor sem chamar a API.
+
+Substitui genai.GenerativeModel por um modelo falso que espera uma latência
+(como se fosse a rede), pode falhar como o Gemini falha (503/429) e devolve
+respostas JSON prontas, de acordo com a etapa (visão, classificação, síntese
+ou lote). Desliga a triagem local, o cache e a detecção de fotos repetidas
+para que toda requisição chegue ao "Gemini".
+
+Uso: gunicorn --config gunicorn_config.py benchmarks.app_falso:app
+
+Variáveis de ambiente:
+    GEMINI_FALSO_LATENCIA_MS: latência mediana de cada chamada (padrão 300)
+    GEMINI_FALSO_DISTRIBUICAO: "fixa" (padrão), "lognormal" ou "exponencial"
+    GEMINI_FALSO_DISPERSAO: sigma da lognormal (padrão 0.5; 1.0 dá uma cauda longa)
+    GEMINI_FALSO_TAXA_ERRO: fração das chamadas que falham (padrão 0)
+    GEMINI_FALSO_ERRO: "503" (padrão) ou "429", o erro devolvido nas falhas
+    GEMINI_FALSO_RESPOSTAS: arquivo JSON com respostas prontas por etapa
+        ({"visao": [...], "classificacao": [...], "sintese": [...], "lote": [...]});
+        cada resposta é um objeto ou um texto (para simular JSON com defeito)
+    GEMINI_FALSO_SEMENTE: semente do sorteio de latências, erros e respostas
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+
+# Desliga os atalhos que evitariam as chamadas ao Gemini
+os.environ.setdefault('TRIAGEM_HABILITADA', '0')
+os.environ.setdefault('ANALISE_CACHE', '0')
+os.environ.setdefault('DEDUP_HABILITADO', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core import exceptions as google_exceptions  # noqa: E402
+import ai_analyzer  # noqa: E402
+import cache_analises  # noqa: E402
+import dedup_imagens  # noqa: E402
+import triagem  # noqa: E402
+
+# No gunicorn, o post_fork importa esses módulos antes deste arquivo, e eles já leram
+# as variáveis de ambiente; os atalhos são desligados aqui também
+cache_analises.CACHE_HABILITADO = os.environ['ANALISE_CACHE'] == '1'
+dedup_imagens.DEDUP_HABILITADO = os.environ['DEDUP_HABILITADO'] == '1'
+triagem.TRIAGEM_HABILITADA = os.environ['TRIAGEM_HABILITADA'] == '1'
+
+LATENCIA_MS = float(os.environ.get('GEMINI_FALSO_LATENCIA_MS', '300'))
+DISTRIBUICAO = os.environ.get('GEMINI_FALSO_DISTRIBUICAO', 'fixa')
+DISPERSAO = float(os.environ.get('GEMINI_FALSO_DISPERSAO', '0.5'))
+TAXA_ERRO = float(os.environ.get('GEMINI_FALSO_TAXA_ERRO', '0'))
+ERRO = os.environ.get('GEMINI_FALSO_ERRO', '503')
+ARQUIVO_RESPOSTAS = os.environ.get('GEMINI_FALSO_RESPOSTAS', '')
+SEMENTE = os.environ.get('GEMINI_FALSO_SEMENTE')
+
+RESPOSTAS_PADRAO = {
+    "visao": [
+        {"transcricao": "CVLO, BOA", "hipotese": "Silábico com valor sonoro",
+         "justificativa": "Resposta simulada para benchmark."},
+    ],
+    "classificacao": [
+        {"hipotese": "Silábico com valor sonoro", "justificativa": "Resposta simulada para benchmark."},
+        {"hipotese": "Silábico-Alfabético", "justificativa": "Resposta simulada para benchmark."},
+    ],
+    "sintese": [
+        {"hipotese": "Silábico com valor sonoro", "justificativa": "Resposta simulada para benchmark."},
+    ],
+    "lote": [
+        {"hipotese": "Silábico com valor sonoro", "justificativa": "Resposta simulada para benchmark."},
+    ],
+}
+
+_ITEM_DO_LOTE = re.compile(r'^\d+\. Palavra ditada:', re.MULTILINE)
+
+_sorteio = random.Random(int(SEMENTE) + os.getpid() if SEMENTE else None)
+
+
+def _carregar_respostas() -> dict:
+    respostas = dict(RESPOSTAS_PADRAO)
+    if ARQUIVO_RESPOSTAS:
+        with open(ARQUIVO_RESPOSTAS, encoding='utf-8') as arquivo:
+            respostas.update(json.load(arquivo))
+    return respostas
+
+
+RESPOSTAS = _carregar_respostas()
+
+
+def _latencia() -> float:
+    """Sorteia a latência de uma chamada, em segundos."""
+    mediana = LATENCIA_MS / 1000
+    if DISTRIBUICAO == 'lognormal':
+        return _sorteio.lognormvariate(math.log(mediana), DISPERSAO) if mediana > 0 else 0.0
+    if DISTRIBUICAO == 'exponencial':
+        # Mediana da exponencial = ln(2) / taxa
+        return _sorteio.expovariate(math.log(2) / mediana) if mediana > 0 else 0.0
+    return mediana
+
+
+def _etapa(conteudo) -> str:
+    if isinstance(conteudo, list):
+        return 'visao'
+    if 'analises_individuais' in conteudo:
+        return 'lote'
+    if conteudo.startswith('Palavra ditada:'):
+        return 'classificacao'
+    return 'sintese'
+
+
+class _Uso:
+    def __init__(self, entrada, saida):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = saida
+        self.cached_content_token_count = 0
+        self.total_token_count = entrada + saida
+
+
+class _RespostaFalsa:
+    def __init__(self, texto, entrada):
+        self.text = texto
+        self.usage_metadata = _Uso(entrada, len(texto) // 4)
+
+
+class ModeloFalso:
+    """Imita genai.GenerativeModel: espera a latência, às vezes falha e responde em JSON."""
+
+    def __init__(self, nome_modelo, **kwargs):
+        self.model_name = nome_modelo
+        self.instrucoes = kwargs.get('system_instruction') or ''
+
+    def count_tokens(self, conteudo, **kwargs):
+        return None
+
+    def generate_content(self, conteudo, **kwargs):
+        time.sleep(_latencia())
+        if TAXA_ERRO and _sorteio.random() < TAXA_ERRO:
+            if ERRO == '429':
+                raise google_exceptions.ResourceExhausted("Cota simulada esgotada")
+            raise google_exceptions.ServiceUnavailable("Gemini simulado indisponível")
+
+        etapa = _etapa(conteudo)
+        resposta = _sorteio.choice(RESPOSTAS[etapa])
+        if not isinstance(resposta, str):
+            resposta = dict(resposta)
+            if etapa == 'lote' and 'analises_individuais' not in resposta:
+                # Um item por escrita do lote, como o Gemini faria
+                resposta['analises_individuais'] = [
+                    {"item": i, "hipotese": resposta['hipotese'], "justificativa": resposta['justificativa']}
+                    for i in range(1, len(_ITEM_DO_LOTE.findall(conteudo)) + 1)
+                ]
+            resposta = json.dumps(resposta, ensure_ascii=False)
+
+        texto = conteudo[0] if isinstance(conteudo, list) else conteudo
+        entrada = (len(self.instrucoes) + len(texto)) // 4 + (258 if isinstance(conteudo, list) else 0)
+        return _RespostaFalsa(resposta, entrada)
+
+
+ai_analyzer.genai.GenerativeModel = ModeloFalso
+ai_analyzer.GEMINI_DISPONIVEL = True
+# Descarta modelos reais criados no post_fork, se houver GEMINI_API_KEY no ambiente
+with ai_analyzer._modelos_lock:
+    ai_analyzer._modelos.clear()
+
+from app import app  # noqa: E402,F401
@@ -0,0 +1,324 @@
+"""
+Teste de carga de ponta a ponta do /analyze, com o Gemini simulado.
+
+Sobe o gunicorn com gunicorn_config.py e o app real com o Gemini falso
+(benchmarks/app_falso.py) e dispara uma mistura realista de requisições:
+
+- palavra_unica: foto pequena com uma palavra ditada
+- ditado_6: foto de celular com um ditado de 6 palavras
+- imagem_grande: foto grande (~3 MB) com o mesmo ditado
+- reanalise: ditado de 6 palavras com transcrição prévia, sem foto
+
+No fim mostra, por cenário e no total: requisições/s, latências p50/p95/p99,
+chamadas ao Gemini por requisição (lidas de ?debug=1) e o pico de memória
+(RSS) de cada worker, lido de /proc. Rodar antes do deploy, com os mesmos
+parâmetros, mostra regressões de vazão, cauda de latência ou memória.
+
+Uso (na raiz do projeto):
+    python benchmarks/carga.py
+    python benchmarks/carga.py --clientes 24 --duracao 60 --distribuicao lognormal --taxa-erro 0.02
+    python benchmarks/carga.py --mistura reanalise=1,ditado_6=1 --saida carga.json
+
+Com --url, a carga vai para um servidor já em execução (o pico de memória só
+aparece se o PID do master do gunicorn for informado em --pid).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.parse
+
+from concorrencia import RAIZ, porta_livre, aguardar_servidor, percentil
+
+DITADO_6 = 'CAVALO, BOLA, SAPO, GATO, BORBOLETA, PÉ'
+
+# Cenário -> (palavras ditadas, transcrição prévia, tamanho da foto em pixels ou None)
+CENARIOS = {
+    'palavra_unica': ('CAVALO', '', (800, 600)),
+    'ditado_6': (DITADO_6, '', (1600, 1200)),
+    'imagem_grande': (DITADO_6, '', (3000, 2250)),
+    'reanalise': (DITADO_6, 'CVLO, BOA, SPO, GT, BBLT, PE', None),
+}
+
+MISTURA_PADRAO = 'palavra_unica=2,ditado_6=3,imagem_grande=1,reanalise=4'
+
+
+def _gerar_foto(tamanho: tuple) -> bytes:
+    """Foto JPEG com ruído, que comprime como uma foto real de caderno (não como uma imagem lisa)."""
+    from PIL import Image
+    saida = io.BytesIO()
+    Image.effect_noise(tamanho, 30).convert('RGB').save(saida, 'JPEG', quality=85)
+    return saida.getvalue()
+
+
+def _multipart(campos: dict, foto: bytes) -> tuple:
+    """Monta o corpo multipart/form-data do formulário do /analyze."""
+    separador = uuid.uuid4().hex
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(
+            f'--{separador}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode('utf-8')
+        )
+    if foto is not None:
+        partes.append(
+            f'--{separador}\r\nContent-Disposition: form-data; name="file"; filename="foto.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode('utf-8') + foto + b'\r\n'
+        )
+    partes.append(f'--{separador}--\r\n'.encode('utf-8'))
+    return b''.join(partes), f'multipart/form-data; boundary={separador}'
+
+
+def montar_requisicoes() -> dict:
+    """Prepara, uma vez, o corpo de cada cenário (as fotos são geradas aqui, fora da medição)."""
+    requisicoes = {}
+    for nome, (palavras, transcricao, tamanho) in CENARIOS.items():
+        campos = {'palavras_ditadas': palavras, 'debug': '1'}
+        if transcricao:
+            campos['transcricao_previa'] = transcricao
+        requisicoes[nome] = _multipart(campos, _gerar_foto(tamanho) if tamanho else None)
+    return requisicoes
+
+
+def _ler_mistura(texto: str) -> list:
+    """'a=2,b=1' -> [('a', 2.0), ('b', 1.0)]"""
+    mistura = []
+    for item in texto.split(','):
+        nome, _, peso = item.partition('=')
+        nome = nome.strip()
+        if nome not in CENARIOS:
+            raise SystemExit(f"Cenário desconhecido: {nome} (opções: {', '.join(CENARIOS)})")
+        mistura.append((nome, float(peso or 1)))
+    return mistura
+
+
+def _cliente(endereco: tuple, fim: float, requisicoes: dict, mistura: list, sorteio: random.Random,
+             resultados: list):
+    """Envia requisições em sequência até o fim do teste, sorteando o cenário de cada uma."""
+    nomes = [nome for nome, _ in mistura]
+    pesos = [peso for _, peso in mistura]
+    conexao = http.client.HTTPConnection(*endereco, timeout=180)
+    while time.time() < fim:
+        cenario = sorteio.choices(nomes, pesos)[0]
+        corpo, tipo = requisicoes[cenario]
+        inicio = time.perf_counter()
+        try:
+            conexao.request('POST', '/analyze', body=corpo, headers={'Content-Type': tipo})
+            resposta = conexao.getresponse()
+            dados = resposta.read()
+        except (OSError, http.client.HTTPException) as e:
+            resultados.append((cenario, None, type(e).__name__, 0))
+            conexao.close()
+            conexao = http.client.HTTPConnection(*endereco, timeout=180)
+            continue
+        duracao = time.perf_counter() - inicio
+        try:
+            chamadas = json.loads(dados)['debug']['uso_de_tokens']['total_chamadas']
+        except (ValueError, KeyError, TypeError):
+            chamadas = 0
+        resultados.append((cenario, duracao, resposta.status, chamadas))
+    conexao.close()
+
+
+def _workers_do_master(pid_master: int) -> list:
+    """PIDs dos processos filhos do master do gunicorn."""
+    filhos = []
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as arquivo:
+                # O nome do processo pode ter espaços: o PPID vem depois do último ')'
+                campos = arquivo.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(campos[1]) == pid_master:
+            filhos.append(int(entrada))
+    return filhos
+
+
+def _pico_rss_kb(pid: int):
+    """Pico de memória residente do processo (VmHWM), em KB, ou None se ele já terminou."""
+    try:
+        with open(f'/proc/{pid}/status') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class MonitorMemoria(threading.Thread):
+    """Acompanha o pico de RSS de cada worker durante o teste (inclusive workers reciclados)."""
+
+    def __init__(self, pid_master: int):
+        super().__init__(daemon=True)
+        self.pid_master = pid_master
+        self.picos = {}
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            self.coletar()
+            self._parar.wait(0.5)
+
+    def coletar(self):
+        for pid in _workers_do_master(self.pid_master):
+            pico = _pico_rss_kb(pid)
+            if pico is not None:
+                self.picos[pid] = max(pico, self.picos.get(pid, 0))
+
+    def parar(self) -> dict:
+        self._parar.set()
+        self.join()
+        self.coletar()
+        return self.picos
+
+
+def _subir_servidor(args) -> tuple:
+    porta = porta_livre()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(porta),
+        'GUNICORN_PERFIL': args.perfil,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GEMINI_FALSO_LATENCIA_MS': str(args.latencia_ms),
+        'GEMINI_FALSO_DISTRIBUICAO': args.distribuicao,
+        'GEMINI_FALSO_DISPERSAO': str(args.dispersao),
+        'GEMINI_FALSO_TAXA_ERRO': str(args.taxa_erro),
+        'GEMINI_FALSO_SEMENTE': str(args.semente),
+        'TAREFAS_WORKERS': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    if args.respostas:
+        env['GEMINI_FALSO_RESPOSTAS'] = os.path.abspath(args.respostas)
+    if args.threads:
+        env['GUNICORN_THREADS'] = str(args.threads)
+
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+         '--access-logfile', '/dev/null', '--log-level', 'warning', 'benchmarks.app_falso:app'],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    aguardar_servidor(porta)
+    return servidor, ('127.0.0.1', porta)
+
+
+def _resumir(resultados: list, decorrido: float) -> dict:
+    sucesso = [r for r in resultados if r[2] == 200]
+    latencias = [r[1] for r in sucesso]
+    return {
+        'requisicoes': len(resultados),
+        'erros': len(resultados) - len(sucesso),
+        'rps': len(sucesso) / decorrido if decorrido else 0.0,
+        'p50': percentil(latencias, 50),
+        'p95': percentil(latencias, 95),
+        'p99': percentil(latencias, 99),
+        'chamadas_por_requisicao': sum(r[3] for r in resultados) / len(resultados) if resultados else 0.0,
+    }
+
+
+def executar(args) -> dict:
+    """Aplica a carga e devolve as métricas por cenário, no total e de memória."""
+    mistura = _ler_mistura(args.mistura)
+    requisicoes = montar_requisicoes()
+
+    servidor = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        endereco = (url.hostname, url.port or 80)
+        pid_master = args.pid
+    else:
+        servidor, endereco = _subir_servidor(args)
+        pid_master = servidor.pid
+
+    monitor = MonitorMemoria(pid_master) if pid_master else None
+    try:
+        if monitor:
+            monitor.start()
+        resultados = []
+        fim = time.time() + args.duracao
+        clientes = [
+            threading.Thread(target=_cliente, args=(
+                endereco, fim, requisicoes, mistura, random.Random(args.semente + i), resultados
+            ))
+            for i in range(args.clientes)
+        ]
+        inicio = time.time()
+        for cliente in clientes:
+            cliente.start()
+        for cliente in clientes:
+            cliente.join()
+        decorrido = time.time() - inicio
+        picos = monitor.parar() if monitor else {}
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    erros = {}
+    for _, _, status, _ in resultados:
+        if status != 200:
+            erros[str(status)] = erros.get(str(status), 0) + 1
+
+    return {
+        'parametros': vars(args),
+        'cenarios': {
+            nome: _resumir([r for r in resultados if r[0] == nome], decorrido)
+            for nome, _ in mistura
+        },
+        'total': _resumir(resultados, decorrido),
+        'erros_por_tipo': erros,
+        'pico_rss_mb_por_worker': {str(pid): round(kb / 1024, 1) for pid, kb in sorted(picos.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clientes', type=int, default=16, help='Clientes simultâneos (padrão: 16)')
+    parser.add_argument('--duracao', type=float, default=20, help='Segundos de carga (padrão: 20)')
+    parser.add_argument('--mistura', default=MISTURA_PADRAO, help=f'Pesos dos cenários (padrão: {MISTURA_PADRAO})')
+    parser.add_argument('--latencia-ms', type=float, default=300, help='Latência mediana do Gemini simulado (padrão: 300)')
+    parser.add_argument('--distribuicao', default='lognormal', choices=('fixa', 'lognormal', 'exponencial'),
+                        help='Distribuição da latência simulada (padrão: lognormal)')
+    parser.add_argument('--dispersao', type=float, default=0.5, help='Sigma da lognormal (padrão: 0.5)')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração de chamadas que falham com 503 (padrão: 0)')
+    parser.add_argument('--respostas', default='', help='Arquivo JSON com respostas prontas por etapa')
+    parser.add_argument('--perfil', default='gthread', help='Perfil do gunicorn (padrão: gthread)')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn (padrão: 2)')
+    parser.add_argument('--threads', type=int, default=0, help='Threads por worker no gthread (padrão: regra do config)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente dos sorteios, para execuções comparáveis')
+    parser.add_argument('--url', default='', help='Servidor já em execução (ex.: http://127.0.0.1:5000)')
+    parser.add_argument('--pid', type=int, default=0, help='PID do master do gunicorn, com --url')
+    parser.add_argument('--saida', default='', help='Grava o resultado completo neste arquivo JSON')
+    args = parser.parse_args()
+
+    resultado = executar(args)
+
+    print(f"{args.clientes} clientes, {args.duracao:.0f}s, Gemini simulado: {args.distribuicao} "
+          f"{args.latencia_ms:.0f} ms, {args.taxa_erro:.0%} de erros")
+    print(f"{'cenário':<15} {'reqs':>6} {'erros':>6} {'req/s':>8} {'p50 (s)':>9} {'p95 (s)':>9} "
+          f"{'p99 (s)':>9} {'chamadas':>9}")
+    for nome, r in list(resultado['cenarios'].items()) + [('total', resultado['total'])]:
+        print(f"{nome:<15} {r['requisicoes']:>6} {r['erros']:>6} {r['rps']:>8.2f} {r['p50']:>9.3f} "
+              f"{r['p95']:>9.3f} {r['p99']:>9.3f} {r['chamadas_por_requisicao']:>9.2f}")
+    if resultado['erros_por_tipo']:
+        print(f"Erros: {resultado['erros_por_tipo']}")
+    for pid, mb in resultado['pico_rss_mb_por_worker'].items():
+        print(f"Pico de RSS do worker {pid}: {mb:.1f} MB")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
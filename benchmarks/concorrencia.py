@@ -0,0 +1,152 @@
+"""
+Benchmark de concorrência: compara os perfis do gunicorn (sync x gthread).
+
+Para cada perfil, sobe o gunicorn com gunicorn_config.py e o app com Gemini
+simulado (benchmarks/app_falso.py), dispara requisições a /analyze a partir de
+vários clientes simultâneos durante um tempo fixo e mostra requisições/s e as
+latências p50/p95.
+
+Uso (na raiz do projeto):
+    python benchmarks/concorrencia.py
+    python benchmarks/concorrencia.py --clientes 32 --duracao 20 --latencia-ms 500
+
+Os parâmetros são fixos por linha de comando, então duas execuções na mesma
+máquina são comparáveis.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.parse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ditado de 4 palavras: 4 análises por palavra + 1 síntese = 5 chamadas ao Gemini
+CORPO = urllib.parse.urlencode({
+    'palavras_ditadas': 'CAVALO, BOLA, SAPO, GATO',
+    'transcricao_previa': 'CVLO, BOA, SPO, GT',
+})
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def aguardar_servidor(porta: int, limite: float = 30.0):
+    fim = time.time() + limite
+    while time.time() < fim:
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=2)
+            conexao.request('GET', '/health')
+            if conexao.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"O servidor não respondeu na porta {porta}")
+
+
+def _cliente(porta: int, fim: float, latencias: list, erros: list):
+    """Envia requisições em sequência até o fim do teste, numa conexão própria."""
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+    while time.time() < fim:
+        inicio = time.perf_counter()
+        try:
+            conexao.request('POST', '/analyze', body=CORPO, headers={
+                'Content-Type': 'application/x-www-form-urlencoded'
+            })
+            resposta = conexao.getresponse()
+            resposta.read()
+            if resposta.status != 200:
+                erros.append(resposta.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            erros.append(type(e).__name__)
+            conexao.close()
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+            continue
+        latencias.append(time.perf_counter() - inicio)
+    conexao.close()
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def medir_perfil(perfil: str, args) -> dict:
+    """Sobe o gunicorn com o perfil indicado, aplica a carga e devolve as métricas."""
+    porta = porta_livre()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(porta),
+        'GUNICORN_PERFIL': perfil,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GEMINI_FALSO_LATENCIA_MS': str(args.latencia_ms),
+        'TAREFAS_WORKERS': '0',
+    })
+    if args.threads:
+        env['GUNICORN_THREADS'] = str(args.threads)
+
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+         '--access-logfile', '/dev/null', '--log-level', 'warning', 'benchmarks.app_falso:app'],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        aguardar_servidor(porta)
+        latencias, erros = [], []
+        fim = time.time() + args.duracao
+        clientes = [
+            threading.Thread(target=_cliente, args=(porta, fim, latencias, erros))
+            for _ in range(args.clientes)
+        ]
+        inicio = time.time()
+        for cliente in clientes:
+            cliente.start()
+        for cliente in clientes:
+            cliente.join()
+        decorrido = time.time() - inicio
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+    return {
+        'perfil': perfil,
+        'requisicoes': len(latencias),
+        'erros': len(erros),
+        'rps': len(latencias) / decorrido,
+        'p50': percentil(latencias, 50),
+        'p95': percentil(latencias, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--perfis', default='sync,gthread', help='Perfis a comparar (padrão: sync,gthread)')
+    parser.add_argument('--clientes', type=int, default=16, help='Clientes simultâneos (padrão: 16)')
+    parser.add_argument('--duracao', type=float, default=15, help='Segundos de carga por perfil (padrão: 15)')
+    parser.add_argument('--latencia-ms', type=float, default=300, help='Latência simulada do Gemini (padrão: 300)')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn (padrão: 2)')
+    parser.add_argument('--threads', type=int, default=0, help='Threads por worker no gthread (padrão: regra do config)')
+    args = parser.parse_args()
+
+    print(f"{args.clientes} clientes, {args.duracao:.0f}s por perfil, Gemini simulado com {args.latencia_ms:.0f} ms")
+    print(f"{'perfil':<10} {'reqs':>6} {'erros':>6} {'req/s':>8} {'p50 (s)':>9} {'p95 (s)':>9}")
+    for perfil in args.perfis.split(','):
+        r = medir_perfil(perfil.strip(), args)
+        print(f"{r['perfil']:<10} {r['requisicoes']:>6} {r['erros']:>6} {r['rps']:>8.2f} {r['p50']:>9.3f} {r['p95']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
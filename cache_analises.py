@@ -0,0 +1,315 @@
+"""
+Cache de resultados da análise de escrita.
+Evita chamar o Gemini novamente para pares (palavra ditada, escrita) já classificados.
+
+O cache tem dois níveis:
+1. Memória: LRU com tempo de expiração (TTL), próprio de cada processo
+2. Disco: banco SQLite compartilhado entre os workers do gunicorn
+
+A chave inclui o hash do prompt e o nome do modelo, então qualquer
+alteração no SYSTEM_PROMPT ou troca de modelo invalida as entradas antigas.
+
+O mesmo banco guarda as transcrições das fotos recentes (ver dedup_imagens),
+para que um reenvio encontre a foto mesmo quando cai em outro worker.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import metricas
+import registro
+
+logger = registro.obter_logger(__name__)
+
+# Configurações do cache
+CACHE_HABILITADO = os.environ.get('ANALISE_CACHE', '1') == '1'
+CACHE_MEMORIA_MAX_ITENS = int(os.environ.get('ANALISE_CACHE_MEMORIA_ITENS', '2048'))
+CACHE_TTL_SEGUNDOS = int(os.environ.get('ANALISE_CACHE_TTL', str(7 * 24 * 3600)))
+# A cada tantas gravações, as entradas vencidas são apagadas do disco
+CACHE_LIMPEZA_A_CADA = int(os.environ.get('ANALISE_CACHE_LIMPEZA_A_CADA', '500'))
+CACHE_DB_PATH = os.environ.get(
+    'ANALISE_CACHE_DB',
+    os.path.join(tempfile.gettempdir(), 'sondagem_cache.sqlite3')
+)
+
+# Nível 1: memória do processo (chave -> (expira_em, geracao, resultado))
+_memoria = OrderedDict()
+_memoria_lock = threading.Lock()
+
+# Geração do cache: incrementada a cada limpeza para invalidar a memória de todos os workers.
+# O valor gravado no disco é relido no máximo uma vez por segundo. Sem lock: duas threads
+# podem reler ao mesmo tempo, mas cada atribuição é atômica e ambas leem o mesmo valor.
+_geracao = {"valor": 0, "lido_em": 0.0}
+
+# Nível 2: uma conexão SQLite por thread
+_local = threading.local()
+
+# Contadores de acerto e falha
+_estatisticas = {"hits_memoria": 0, "hits_disco": 0, "misses": 0}
+_estatisticas_lock = threading.Lock()
+
+# Gravações em disco feitas por este processo desde a última remoção das entradas vencidas
+_gravacoes = {"desde_limpeza": 0}
+
+
+def gerar_chave(palavra_ditada: str, escrita_crianca: str, prompt: str, modelo: str) -> str:
+    """
+    Gera a chave do cache para um par (palavra ditada, escrita).
+
+    Args:
+        palavra_ditada: A palavra que foi ditada para a criança
+        escrita_crianca: O que a criança escreveu
+        prompt: O prompt de sistema usado na classificação
+        modelo: O backend e o modelo que responderam (ex.: "gemini/gemini-2.5-flash")
+
+    Returns:
+        str: Hash SHA-256 que identifica a análise
+    """
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    conteudo = json.dumps([
+        palavra_ditada.strip().upper(),
+        escrita_crianca.strip().upper(),
+        prompt_hash,
+        modelo
+    ], ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def _conexao():
+    """Retorna a conexão SQLite da thread atual, criando a tabela se necessário."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_DB_PATH, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analises (
+                chave TEXT PRIMARY KEY,
+                resultado TEXT NOT NULL,
+                expira_em REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_expira_em ON analises (expira_em)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcricoes (
+                hash_imagem TEXT PRIMARY KEY,
+                assinatura TEXT,
+                transcricao TEXT NOT NULL,
+                expira_em REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcricoes_expira_em ON transcricoes (expira_em)")
+        conn.execute("CREATE TABLE IF NOT EXISTS geracao (valor INTEGER NOT NULL)")
+        conn.execute("INSERT INTO geracao (valor) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM geracao)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _contar(campo: str):
+    with _estatisticas_lock:
+        _estatisticas[campo] += 1
+    metricas.contar('cache', resultado=campo)
+
+
+def _remover_expiradas(conn, agora: float) -> int:
+    """Apaga do disco as análises e transcrições vencidas (na leitura elas só eram ignoradas)."""
+    removidas = conn.execute("DELETE FROM analises WHERE expira_em <= ?", (agora,)).rowcount
+    removidas += conn.execute("DELETE FROM transcricoes WHERE expira_em <= ?", (agora,)).rowcount
+    return removidas
+
+
+def _gravou(conn, agora: float):
+    """Conta uma gravação em disco e, a cada CACHE_LIMPEZA_A_CADA, remove as entradas vencidas."""
+    with _estatisticas_lock:
+        _gravacoes["desde_limpeza"] += 1
+        if _gravacoes["desde_limpeza"] < CACHE_LIMPEZA_A_CADA:
+            return
+        _gravacoes["desde_limpeza"] = 0
+    removidas = _remover_expiradas(conn, agora)
+    conn.commit()
+    if removidas:
+        logger.info("Entradas vencidas removidas do cache em disco", extra={'removidas': removidas})
+
+
+def _geracao_atual(agora: float) -> int:
+    """Retorna a geração do cache, relendo o disco no máximo uma vez por segundo."""
+    if agora - _geracao["lido_em"] >= 1.0:
+        try:
+            _geracao["valor"] = _conexao().execute("SELECT valor FROM geracao").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Erro ao ler a geração do cache", extra={'erro': str(e)})
+        _geracao["lido_em"] = agora
+    return _geracao["valor"]
+
+
+def _guardar_memoria(chave: str, resultado: dict, expira_em: float, geracao: int):
+    with _memoria_lock:
+        _memoria[chave] = (expira_em, geracao, resultado)
+        _memoria.move_to_end(chave)
+        while len(_memoria) > CACHE_MEMORIA_MAX_ITENS:
+            _memoria.popitem(last=False)
+
+
+def obter(chave: str):
+    """
+    Busca um resultado no cache (primeiro na memória, depois no disco).
+
+    Returns:
+        dict: Cópia do resultado armazenado, ou None se não houver entrada válida
+    """
+    if not CACHE_HABILITADO:
+        return None
+
+    agora = time.time()
+    geracao = _geracao_atual(agora)
+
+    # Nível 1: memória
+    with _memoria_lock:
+        entrada = _memoria.get(chave)
+        if entrada is not None:
+            if entrada[0] > agora and entrada[1] == geracao:
+                _memoria.move_to_end(chave)
+                _contar("hits_memoria")
+                return dict(entrada[2])
+            del _memoria[chave]
+
+    # Nível 2: disco
+    try:
+        linha = _conexao().execute(
+            "SELECT resultado, expira_em FROM analises WHERE chave = ?", (chave,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("Erro ao ler o cache em disco", extra={'erro': str(e)})
+        linha = None
+
+    if linha is not None and linha[1] > agora:
+        resultado = json.loads(linha[0])
+        _guardar_memoria(chave, resultado, linha[1], geracao)
+        _contar("hits_disco")
+        return dict(resultado)
+
+    _contar("misses")
+    return None
+
+
+def guardar(chave: str, resultado: dict):
+    """Armazena um resultado nos dois níveis do cache."""
+    if not CACHE_HABILITADO:
+        return
+
+    agora = time.time()
+    expira_em = agora + CACHE_TTL_SEGUNDOS
+    _guardar_memoria(chave, dict(resultado), expira_em, _geracao_atual(agora))
+
+    try:
+        conn = _conexao()
+        conn.execute(
+            "INSERT OR REPLACE INTO analises (chave, resultado, expira_em) VALUES (?, ?, ?)",
+            (chave, json.dumps(resultado, ensure_ascii=False), expira_em)
+        )
+        conn.commit()
+        _gravou(conn, agora)
+    except sqlite3.Error as e:
+        logger.warning("Erro ao gravar o cache em disco", extra={'erro': str(e)})
+
+
+def obter_transcricao(hash_imagem: str):
+    """
+    Busca a transcrição guardada para a foto com este SHA-256.
+
+    Returns:
+        str: Transcrição, ou None se não houver entrada válida
+    """
+    try:
+        linha = _conexao().execute(
+            "SELECT transcricao FROM transcricoes WHERE hash_imagem = ? AND expira_em > ?",
+            (hash_imagem, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("Erro ao ler as transcrições em disco", extra={'erro': str(e)})
+        return None
+    return linha[0] if linha else None
+
+
+def transcricoes_recentes(limite: int) -> list:
+    """
+    Retorna as transcrições válidas mais recentes que têm assinatura perceptual.
+
+    Returns:
+        list: Pares (assinatura, transcrição), da mais recente para a mais antiga
+    """
+    try:
+        return _conexao().execute(
+            "SELECT assinatura, transcricao FROM transcricoes"
+            " WHERE expira_em > ? AND assinatura IS NOT NULL ORDER BY expira_em DESC LIMIT ?",
+            (time.time(), limite)
+        ).fetchall()
+    except sqlite3.Error as e:
+        logger.warning("Erro ao ler as transcrições em disco", extra={'erro': str(e)})
+        return []
+
+
+def guardar_transcricao(hash_imagem: str, assinatura, transcricao: str, ttl: float):
+    """Guarda a transcrição lida para a foto com este SHA-256 (e sua assinatura perceptual)."""
+    agora = time.time()
+    try:
+        conn = _conexao()
+        conn.execute(
+            "INSERT OR REPLACE INTO transcricoes (hash_imagem, assinatura, transcricao, expira_em)"
+            " VALUES (?, ?, ?, ?)",
+            (hash_imagem, assinatura, transcricao, agora + ttl)
+        )
+        conn.commit()
+        _gravou(conn, agora)
+    except sqlite3.Error as e:
+        logger.warning("Erro ao gravar a transcrição em disco", extra={'erro': str(e)})
+
+
+def limpar() -> int:
+    """
+    Esvazia os dois níveis do cache e zera os contadores. As transcrições
+    de fotos vencidas também são apagadas.
+
+    A geração gravada no disco é incrementada, então os outros workers
+    descartam suas entradas em memória em até um segundo.
+
+    Returns:
+        int: Número de entradas removidas do disco
+    """
+    with _memoria_lock:
+        _memoria.clear()
+
+    with _estatisticas_lock:
+        for campo in _estatisticas:
+            _estatisticas[campo] = 0
+
+    try:
+        conn = _conexao()
+        removidas = conn.execute("DELETE FROM analises").rowcount
+        _remover_expiradas(conn, time.time())
+        conn.execute("UPDATE geracao SET valor = valor + 1")
+        conn.commit()
+        _geracao["lido_em"] = 0.0
+        return removidas
+    except sqlite3.Error as e:
+        logger.warning("Erro ao limpar o cache em disco", extra={'erro': str(e)})
+        return 0
+
+
+def estatisticas() -> dict:
+    """Retorna os contadores de acerto e falha do cache neste processo."""
+    with _estatisticas_lock:
+        dados = dict(_estatisticas)
+    with _memoria_lock:
+        dados["itens_memoria"] = len(_memoria)
+
+    consultas = dados["hits_memoria"] + dados["hits_disco"] + dados["misses"]
+    dados["taxa_acerto"] = round((dados["hits_memoria"] + dados["hits_disco"]) / consultas, 4) if consultas else 0.0
+    dados["habilitado"] = CACHE_HABILITADO
+    return dados
@@ -0,0 +1,30 @@
+"""
+Configuração do pytest.
+O app_test.py é o servidor de demonstração (sem OCR), não um arquivo de testes;
+src/ e benchmarks/ têm scripts que não devem ser importados na coleta.
+"""
+
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import cache_analises
+
+collect_ignore = ['app_test.py', 'src', 'benchmarks']
+
+
+@pytest.fixture
+def cache_temporario(tmp_path, monkeypatch):
+    """Cache de análises vazio, com o banco em um diretório temporário."""
+    monkeypatch.setattr(cache_analises, 'CACHE_DB_PATH', str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(cache_analises, 'CACHE_HABILITADO', True)
+    monkeypatch.setattr(cache_analises, '_local', threading.local())
+    monkeypatch.setattr(cache_analises, '_memoria', OrderedDict())
+    monkeypatch.setattr(cache_analises, '_geracao', {"valor": 0, "lido_em": 0.0})
+    monkeypatch.setattr(cache_analises, '_estatisticas', {"hits_memoria": 0, "hits_disco": 0, "misses": 0})
+    monkeypatch.setattr(cache_analises, '_gravacoes', {"desde_limpeza": 0})
+    yield cache_analises
+    conn = getattr(cache_analises._local, 'conn', None)
+    if conn is not None:
+        conn.close()
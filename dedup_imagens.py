@@ -0,0 +1,161 @@
+"""
+Detecção de fotos repetidas da escrita.
+Professores costumam clicar em "Analisar" várias vezes na mesma foto, ou reenviar
+a foto depois de corrigir as palavras ditadas. Cada reenvio pagava uma nova
+chamada ao Gemini Vision só para ler de novo a mesma escrita.
+
+Cada foto lida pelo Gemini é guardada pelo SHA-256 dos bytes, junto com uma
+assinatura perceptual e a transcrição, no banco compartilhado do cache de análises
+(ver cache_analises): um reenvio encontra a foto mesmo quando cai em outro worker.
+A chave é só a foto; quem reaproveita a transcrição confere se o número de itens
+ainda casa com as palavras ditadas, e a classificação do texto é refeita.
+
+A assinatura perceptual divide a página numa grade DEDUP_REGIOES x DEDUP_REGIOES e
+calcula um dHash de 64 bits por região. Duas fotos são quase iguais quando nenhuma
+região difere em mais de DEDUP_DISTANCIA_MAXIMA bits. Um dHash da página inteira
+não serve: folhas de crianças diferentes no mesmo modelo de atividade ficam quase
+idênticas, e uma criança receberia a transcrição de outra. Por região, a escrita de
+outra criança muda pelo menos uma das regiões. DEDUP_DISTANCIA_MAXIMA=-1 desliga a
+busca por fotos parecidas e deixa só a foto idêntica.
+"""
+
+import io
+import os
+import hashlib
+import threading
+from PIL import Image, ImageOps
+import cache_analises
+import metricas
+import registro
+
+logger = registro.obter_logger(__name__)
+
+# Configurações da detecção de fotos repetidas
+DEDUP_HABILITADO = os.environ.get('DEDUP_HABILITADO', '1') == '1'
+DEDUP_REGIOES = int(os.environ.get('DEDUP_REGIOES', '4'))
+DEDUP_DISTANCIA_MAXIMA = int(os.environ.get('DEDUP_DISTANCIA_MAXIMA', '6'))
+DEDUP_MAX_IMAGENS = int(os.environ.get('DEDUP_MAX_IMAGENS', '512'))
+DEDUP_TTL_SEGUNDOS = int(os.environ.get('DEDUP_TTL', '3600'))
+
+_estatisticas = {"hits": 0, "hits_parecidas": 0, "misses": 0}
+_estatisticas_lock = threading.Lock()
+
+
+def calcular_hash(dados: bytes):
+    """
+    Calcula o hash do conteúdo da foto (SHA-256 dos bytes, em hexadecimal).
+
+    Returns:
+        str: Hash da foto, ou None se não houver dados
+    """
+    if not dados:
+        return None
+    return hashlib.sha256(dados).hexdigest()
+
+
+def calcular_assinatura(dados: bytes):
+    """
+    Calcula a assinatura perceptual da foto: um dHash de 64 bits (brilho de pixels
+    vizinhos numa miniatura 9x8 em tons de cinza) para cada região da grade.
+    Fotos da mesma folha geram assinaturas próximas mesmo com outra compressão,
+    tamanho ou pequenas variações de luz.
+
+    Returns:
+        str: Os hashes das regiões em hexadecimal (16 dígitos cada), ou None se a
+             imagem não puder ser lida
+    """
+    if not dados:
+        return None
+    regioes = max(1, DEDUP_REGIOES)
+    largura, altura = 9 * regioes, 8 * regioes
+    try:
+        img = Image.open(io.BytesIO(dados))
+        if img.format == 'JPEG':
+            img.draft('L', (largura * 4, altura * 4))
+        img = ImageOps.exif_transpose(img).convert('L').resize((largura, altura), Image.BILINEAR)
+    except Exception as e:
+        logger.warning("Não foi possível calcular a assinatura da imagem", extra={'erro': str(e)})
+        return None
+
+    pixels = img.load()
+    partes = []
+    for regiao_y in range(regioes):
+        for regiao_x in range(regioes):
+            valor = 0
+            for linha in range(8):
+                y = regiao_y * 8 + linha
+                for coluna in range(8):
+                    x = regiao_x * 9 + coluna
+                    valor = (valor << 1) | (1 if pixels[x, y] > pixels[x + 1, y] else 0)
+            partes.append(f'{valor:016x}')
+    return ''.join(partes)
+
+
+def distancia(assinatura_a: str, assinatura_b: str):
+    """
+    Maior distância de Hamming entre regiões correspondentes das duas assinaturas.
+
+    Returns:
+        int: Bits diferentes na região mais diferente, ou None se as grades não casam
+    """
+    if len(assinatura_a) != len(assinatura_b):
+        return None
+    return max(
+        (int(assinatura_a[i:i + 16], 16) ^ int(assinatura_b[i:i + 16], 16)).bit_count()
+        for i in range(0, len(assinatura_a), 16)
+    )
+
+
+def _contar(campo: str):
+    with _estatisticas_lock:
+        _estatisticas[campo] += 1
+    metricas.contar('imagens_repetidas', resultado=campo)
+
+
+def buscar(hash_imagem, assinatura=None):
+    """
+    Procura a mesma foto (ou uma quase igual) já lida pelo Gemini.
+
+    Args:
+        hash_imagem: SHA-256 da foto (ver calcular_hash)
+        assinatura: Assinatura perceptual da foto (ver calcular_assinatura), se houver
+
+    Returns:
+        str: Transcrição guardada, ou None
+    """
+    if not DEDUP_HABILITADO or hash_imagem is None:
+        return None
+
+    transcricao = cache_analises.obter_transcricao(hash_imagem)
+    if transcricao is not None:
+        _contar("hits")
+        return transcricao
+
+    if assinatura is not None and DEDUP_DISTANCIA_MAXIMA >= 0:
+        melhor = None
+        for assinatura_salva, transcricao_salva in cache_analises.transcricoes_recentes(DEDUP_MAX_IMAGENS):
+            bits = distancia(assinatura, assinatura_salva)
+            if bits is not None and bits <= DEDUP_DISTANCIA_MAXIMA and (melhor is None or bits < melhor[0]):
+                melhor = (bits, transcricao_salva)
+        if melhor is not None:
+            _contar("hits_parecidas")
+            return melhor[1]
+
+    _contar("misses")
+    return None
+
+
+def registrar(hash_imagem, assinatura, transcricao: str):
+    """Guarda a transcrição lida pelo Gemini para esta foto."""
+    if not DEDUP_HABILITADO or hash_imagem is None or not transcricao:
+        return
+    cache_analises.guardar_transcricao(hash_imagem, assinatura, transcricao, DEDUP_TTL_SEGUNDOS)
+
+
+def estatisticas() -> dict:
+    """Retorna os contadores de fotos repetidas neste processo."""
+    with _estatisticas_lock:
+        dados = dict(_estatisticas)
+    dados["habilitado"] = DEDUP_HABILITADO
+    dados["distancia_maxima"] = DEDUP_DISTANCIA_MAXIMA
+    return dados
@@ -1,26 +1,100 @@
 """Configuração do Gunicorn para produção"""
 
 import os
+import math
+import shutil
+import tempfile
 
 # Bind para aceitar conexões de qualquer origem
 bind = "0.0.0.0:" + str(os.environ.get("PORT", "5000"))
 
+# Perfil de execução:
+# - "gthread" (padrão): cada worker atende várias requisições em threads. Quase todo o
+#   tempo de uma análise é espera pela rede (Gemini), então threads escalam bem.
+# - "sync": um pedido por worker, como nas versões anteriores.
+# O gevent não é oferecido porque o cliente gRPC do Gemini não é compatível com o
+# monkey-patching sem configuração especial.
+PERFIL = os.environ.get("GUNICORN_PERFIL", "gthread")
+
 # Número de workers (processos)
-workers = 2
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
 
 # Tipo de worker
-worker_class = "sync"
+worker_class = "gthread" if PERFIL == "gthread" else "sync"
+
+# Threads por worker (apenas no perfil gthread)
+# Regra de dimensionamento (Lei de Little): requisições simultâneas = vazão × latência.
+# Com RPS_ALVO requisições/s e uma análise levando LATENCIA_P95 segundos (dominada pelo
+# Gemini), são necessárias RPS_ALVO × LATENCIA_P95 requisições em andamento, divididas
+# entre os workers. GUNICORN_THREADS, se definido, tem prioridade.
+# Cada requisição com várias palavras abre até ANALISE_MAX_CONCORRENCIA chamadas ao
+# Gemini ao mesmo tempo: o total em andamento é workers × threads × esse valor, o que
+# deve caber na cota da API.
+RPS_ALVO = float(os.environ.get("GUNICORN_RPS_ALVO", "2"))
+LATENCIA_P95 = float(os.environ.get("GUNICORN_LATENCIA_P95", "10"))
+
+
+def _threads_por_worker():
+    if "GUNICORN_THREADS" in os.environ:
+        return int(os.environ["GUNICORN_THREADS"])
+    simultaneas = RPS_ALVO * LATENCIA_P95
+    return max(4, min(32, math.ceil(simultaneas / workers)))
+
+
+threads = _threads_por_worker() if worker_class == "gthread" else 1
 
 # Timeout
 timeout = 120
 
+# Mantém a conexão aberta entre requisições do mesmo navegador (consultas a /jobs)
+keepalive = 5
+
 # Logs
 accesslog = "-"
 errorlog = "-"
 loglevel = "info"
 
+# Métricas do Prometheus (metricas.py): cada worker grava as suas neste diretório e a
+# rota /metrics soma todas. Precisa estar no ambiente antes de o app ser importado
+METRICAS_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "sondagem_metricas")
+)
+
 # Configurações de segurança
 limit_request_line = 4096
 limit_request_fields = 100
 limit_request_field_size = 8190
 
+
+def on_starting(server):
+    """Começa com o diretório de métricas vazio: arquivos de uma execução anterior somariam valores antigos."""
+    shutil.rmtree(METRICAS_DIR, ignore_errors=True)
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """
+    Cria os modelos do Gemini no processo do worker, recém-criado, e aquece a conexão
+    (GEMINI_AQUECER) antes de ele começar a aceitar requisições. O primeiro pedido
+    depois de um deploy ou da reciclagem do worker fica tão rápido quanto os seguintes.
+    """
+    import ai_analyzer
+    ai_analyzer.iniciar_modelos()
+
+
+def post_worker_init(worker):
+    """
+    Inicia os workers de tarefas assíncronas assim que o app é carregado.
+    Assim, tarefas que ficaram pendentes antes de um reinício voltam a ser processadas.
+    """
+    import app
+    app.iniciar_tarefas_em_segundo_plano()
+
+
+def child_exit(server, worker):
+    """Avisa o prometheus_client que o worker terminou (os contadores dele continuam somados)."""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
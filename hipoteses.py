@@ -0,0 +1,14 @@
+"""
+Hipóteses de escrita de Ferreiro e Teberosky usadas em todo o sistema.
+Módulo só de constantes, para que o armazenamento e a análise usem a mesma
+lista sem que um precise importar o outro.
+"""
+
+# Hipóteses válidas, da menos para a mais avançada
+HIPOTESES = [
+    "Pré-Silábico",
+    "Silábico sem valor sonoro",
+    "Silábico com valor sonoro",
+    "Silábico-Alfabético",
+    "Alfabético",
+]
@@ -0,0 +1,178 @@
+"""
+Limitador de vazão das chamadas ao Gemini, compartilhado entre os workers.
+Na manhã em que todas as turmas fazem a sondagem, os workers do gunicorn e as
+análises de turma chamavam o Gemini ao mesmo tempo e batiam na cota por minuto
+em rajadas, gerando erros 429.
+
+São dois baldes de fichas (token bucket), um de requisições por minuto e outro
+de tokens por minuto. O estado fica num arquivo pequeno protegido por flock,
+então todos os processos da máquina dividem o mesmo orçamento sem depender de
+Redis ou outro serviço. Quem chega sem saldo espera na fila até um prazo, em
+vez de falhar na hora.
+
+Os tokens de cada chamada só são conhecidos depois da resposta: a chamada
+reserva uma estimativa e a diferença é acertada com o uso real.
+"""
+
+import os
+import time
+import struct
+import tempfile
+import threading
+import metricas
+from resiliencia import GeminiIndisponivel
+
+try:
+    import fcntl
+    FCNTL_DISPONIVEL = True
+except ImportError:
+    # Sem fcntl (Windows), o limite vale apenas dentro de cada processo
+    fcntl = None
+    FCNTL_DISPONIVEL = False
+
+# Configurações do limitador (0 desativa o limite correspondente)
+LIMITE_RPM = int(os.environ.get('GEMINI_LIMITE_RPM', '1000'))
+LIMITE_TPM = int(os.environ.get('GEMINI_LIMITE_TPM', '1000000'))
+LIMITE_ESPERA_MAXIMA = float(os.environ.get('GEMINI_LIMITE_ESPERA', '30'))
+LIMITE_ARQUIVO = os.environ.get(
+    'GEMINI_LIMITE_ARQUIVO',
+    os.path.join(tempfile.gettempdir(), 'sondagem_limite_gemini.bin')
+)
+
+# Estado gravado no arquivo: fichas de requisição, fichas de token, instante da última atualização
+_FORMATO = struct.Struct('<ddd')
+
+_lock = threading.Lock()
+_arquivo = {"fd": None, "pid": None}
+
+_estatisticas = {"esperas": 0, "recusadas": 0}
+_estatisticas_lock = threading.Lock()
+
+
+def _contar(nome: str):
+    with _estatisticas_lock:
+        _estatisticas[nome] += 1
+
+
+class LimiteExcedido(GeminiIndisponivel):
+    """O orçamento de chamadas ao Gemini não liberou a tempo."""
+
+
+def habilitado() -> bool:
+    return LIMITE_RPM > 0 or LIMITE_TPM > 0
+
+
+def _descritor() -> int:
+    """Abre o arquivo de estado uma vez por processo (o flock não separa pai e filho após o fork)."""
+    if _arquivo["pid"] != os.getpid():
+        _arquivo["fd"] = os.open(LIMITE_ARQUIVO, os.O_RDWR | os.O_CREAT, 0o600)
+        _arquivo["pid"] = os.getpid()
+    return _arquivo["fd"]
+
+
+def _atualizar(operacao):
+    """
+    Lê o estado com os baldes reabastecidos até agora, aplica a operação e grava o
+    resultado, tudo sob o lock da thread e o flock do arquivo.
+
+    Args:
+        operacao: Função (fichas_requisicao, fichas_tokens) -> (novas fichas, retorno)
+    """
+    with _lock:
+        fd = _descritor()
+        if FCNTL_DISPONIVEL:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            agora = time.time()
+            dados = os.pread(fd, _FORMATO.size, 0)
+            if len(dados) == _FORMATO.size:
+                requisicoes, tokens, instante = _FORMATO.unpack(dados)
+                decorrido = max(0.0, agora - instante)
+                requisicoes = min(LIMITE_RPM, requisicoes + decorrido * LIMITE_RPM / 60)
+                tokens = min(LIMITE_TPM, tokens + decorrido * LIMITE_TPM / 60)
+            else:
+                requisicoes, tokens = float(LIMITE_RPM), float(LIMITE_TPM)
+
+            (requisicoes, tokens), retorno = operacao(requisicoes, tokens)
+            os.pwrite(fd, _FORMATO.pack(requisicoes, tokens, agora), 0)
+            return retorno
+        finally:
+            if FCNTL_DISPONIVEL:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def adquirir(tokens_estimados: int, espera_maxima: float = None):
+    """
+    Reserva uma requisição e os tokens estimados, esperando o reabastecimento se
+    necessário.
+
+    Raises:
+        LimiteExcedido: Se o saldo não liberar dentro de espera_maxima segundos
+    """
+    if not habilitado():
+        return
+
+    # Uma chamada maior que o balde inteiro nunca caberia: reserva no máximo o balde
+    tokens_estimados = min(tokens_estimados, LIMITE_TPM) if LIMITE_TPM > 0 else 0
+    prazo = time.time() + (LIMITE_ESPERA_MAXIMA if espera_maxima is None else espera_maxima)
+    esperou = False
+
+    def reservar(requisicoes, tokens):
+        falta_requisicoes = 1 - requisicoes if LIMITE_RPM > 0 else 0
+        falta_tokens = tokens_estimados - tokens if LIMITE_TPM > 0 else 0
+        if falta_requisicoes <= 0 and falta_tokens <= 0:
+            return (requisicoes - (1 if LIMITE_RPM > 0 else 0), tokens - tokens_estimados), 0.0
+        espera = max(
+            falta_requisicoes * 60 / LIMITE_RPM if falta_requisicoes > 0 else 0.0,
+            falta_tokens * 60 / LIMITE_TPM if falta_tokens > 0 else 0.0,
+        )
+        return (requisicoes, tokens), espera
+
+    while True:
+        espera = _atualizar(reservar)
+        if espera == 0.0:
+            return
+        if time.time() + espera > prazo:
+            _contar("recusadas")
+            metricas.contar('erros_gemini', tipo='cota_local')
+            raise LimiteExcedido(
+                f"Cota de chamadas ao Gemini esgotada; seriam necessários mais {espera:.0f}s de espera."
+            )
+        if not esperou:
+            _contar("esperas")
+            esperou = True
+        # Espera em passos curtos: outro processo pode ter devolvido fichas no acerto
+        time.sleep(min(espera, 1.0))
+
+
+def acertar(tokens_estimados: int, tokens_reais: int):
+    """Ajusta o balde de tokens com a diferença entre a estimativa e o uso real da chamada."""
+    if LIMITE_TPM <= 0 or not tokens_reais:
+        return
+    diferenca = min(tokens_estimados, LIMITE_TPM) - tokens_reais
+
+    def ajustar(requisicoes, tokens):
+        # O saldo pode ficar negativo: as próximas chamadas esperam até ele se recompor
+        return (requisicoes, min(LIMITE_TPM, tokens + diferenca)), None
+
+    _atualizar(ajustar)
+
+
+def estado() -> dict:
+    """Retorna o saldo atual e a ocupação dos baldes (0 = vazio, 1 = orçamento todo em uso)."""
+    if not habilitado():
+        return {"habilitado": False}
+
+    saldo = _atualizar(lambda requisicoes, tokens: ((requisicoes, tokens), (requisicoes, tokens)))
+    return {
+        "habilitado": True,
+        "compartilhado_entre_processos": FCNTL_DISPONIVEL,
+        "limite_rpm": LIMITE_RPM,
+        "limite_tpm": LIMITE_TPM,
+        "requisicoes_disponiveis": round(saldo[0], 1),
+        "tokens_disponiveis": round(saldo[1]),
+        "ocupacao_requisicoes": round(1 - saldo[0] / LIMITE_RPM, 3) if LIMITE_RPM > 0 else 0.0,
+        "ocupacao_tokens": round(1 - saldo[1] / LIMITE_TPM, 3) if LIMITE_TPM > 0 else 0.0,
+        "esperas": _estatisticas["esperas"],
+        "recusadas": _estatisticas["recusadas"],
+    }
@@ -0,0 +1,145 @@
+"""
+Métricas de desempenho no formato do Prometheus (rota /metrics).
+Até aqui a única telemetria eram os prints de depuração: não dava para saber
+se o tempo de uma análise ia para a leitura do upload, o Gemini Vision, a
+classificação de cada palavra, a síntese ou a leitura do JSON.
+
+Este módulo reúne:
+1. Histogramas de duração de cada etapa do /analyze, de cada função do
+   ai_analyzer e de cada chamada ao Gemini (ou outro backend de IA)
+2. Contadores de acertos de cache, triagem local, fallbacks, respostas
+   ilegíveis e erros do Gemini
+3. O número de chamadas ao Gemini por análise
+
+Com vários workers do gunicorn, cada processo grava suas métricas em arquivos
+no diretório PROMETHEUS_MULTIPROC_DIR (definido no gunicorn_config.py) e a
+rota /metrics soma os arquivos de todos os processos. Sem essa variável (ex.:
+python app.py), as métricas são apenas do processo atual.
+
+Se o prometheus_client não estiver instalado, as funções deste módulo não
+fazem nada e a rota /metrics responde 503.
+"""
+
+import os
+import time
+import functools
+from contextlib import contextmanager
+import registro
+
+logger = registro.obter_logger(__name__)
+
+try:
+    from prometheus_client import (
+        REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+    )
+    PROMETHEUS_DISPONIVEL = True
+except ImportError:
+    logger.warning("prometheus_client não instalado. A rota /metrics ficará desativada.")
+    PROMETHEUS_DISPONIVEL = False
+
+# Faixas dos histogramas de duração, em segundos (uma análise com várias palavras passa de 10s)
+_FAIXAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45, 90)
+
+_histogramas = {}
+_contadores = {}
+
+if PROMETHEUS_DISPONIVEL:
+    _histogramas = {
+        'etapa': Histogram(
+            'sondagem_etapa_duracao_segundos',
+            'Duração de cada etapa do pipeline de análise',
+            ['etapa'], buckets=_FAIXAS_SEGUNDOS
+        ),
+        'funcao': Histogram(
+            'sondagem_funcao_duracao_segundos',
+            'Duração das funções de análise do ai_analyzer',
+            ['funcao'], buckets=_FAIXAS_SEGUNDOS
+        ),
+        'ia': Histogram(
+            'sondagem_ia_duracao_segundos',
+            'Duração de cada chamada a um backend de IA, com novas tentativas',
+            ['backend', 'etapa', 'resultado'], buckets=_FAIXAS_SEGUNDOS
+        ),
+        'chamadas_por_analise': Histogram(
+            'sondagem_chamadas_gemini_por_analise',
+            'Número de chamadas ao Gemini feitas em cada análise',
+            buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34)
+        ),
+    }
+    _contadores = {
+        'cache': Counter(
+            'sondagem_cache_analises', 'Consultas ao cache de análises', ['resultado']
+        ),
+        'imagens_repetidas': Counter(
+            'sondagem_imagens_repetidas', 'Consultas ao índice de fotos repetidas', ['resultado']
+        ),
+        'triagem': Counter(
+            'sondagem_triagem', 'Escritas classificadas localmente ou encaminhadas ao Gemini', ['resultado']
+        ),
+        'fallbacks': Counter(
+            'sondagem_fallbacks', 'Análises que caíram numa resposta alternativa', ['tipo']
+        ),
+        'respostas_gemini': Counter(
+            'sondagem_respostas_gemini', 'Leitura do JSON das respostas do Gemini', ['tipo']
+        ),
+        'erros_gemini': Counter(
+            'sondagem_erros_gemini', 'Erros nas chamadas ao Gemini', ['tipo']
+        ),
+        'armazenamento': Counter(
+            'sondagem_armazenamento', 'Resultados enviados ao armazenamento das sondagens', ['resultado']
+        ),
+        'tokens_ia': Counter(
+            'sondagem_tokens_ia', 'Tokens consumidos nas chamadas aos backends de IA', ['backend', 'etapa', 'tipo']
+        ),
+    }
+
+
+def contar(nome: str, quantidade: float = 1, **rotulos):
+    """Incrementa um contador (ex.: contar('cache', resultado='misses'))."""
+    if PROMETHEUS_DISPONIVEL and quantidade:
+        _contadores[nome].labels(**rotulos).inc(quantidade)
+
+
+def observar(nome: str, valor: float, **rotulos):
+    """Registra um valor num histograma (ex.: observar('etapa', 1.2, etapa='leitura_upload'))."""
+    if PROMETHEUS_DISPONIVEL:
+        metrica = _histogramas[nome]
+        (metrica.labels(**rotulos) if rotulos else metrica).observe(valor)
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """Mede a duração do bloco como uma etapa do pipeline de análise."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar('etapa', time.perf_counter() - inicio, etapa=etapa)
+
+
+def medir_funcao(funcao):
+    """Decorador que mede a duração de cada execução da função."""
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            observar('funcao', time.perf_counter() - inicio, funcao=funcao.__name__)
+    return medida
+
+
+def exportar() -> tuple:
+    """
+    Gera o texto das métricas no formato do Prometheus.
+
+    Returns:
+        tuple: (conteúdo em bytes, content type)
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Soma os arquivos de todos os workers (inclusive os que já foram reciclados)
+        coletor = CollectorRegistry()
+        multiprocess.MultiProcessCollector(coletor)
+    else:
+        coletor = REGISTRY
+    return generate_latest(coletor), CONTENT_TYPE_LATEST
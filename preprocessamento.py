@@ -0,0 +1,193 @@
+"""
+Pré-processamento das fotos da escrita antes do envio ao Gemini Vision.
+Fotos de celular costumam ter vários MB; para ler algumas letras maiúsculas
+basta uma imagem bem menor, o que reduz o tempo de upload, o custo em tokens
+e a memória usada pelos workers.
+
+Etapas (todas configuráveis por variáveis de ambiente):
+1. Proteção contra "bombas de descompressão" (imagens com pixels demais)
+2. Decodificação JPEG em modo rascunho (draft), já em escala reduzida
+3. Correção da orientação EXIF
+4. Conversão para tons de cinza
+5. Redução até a aresta máxima
+6. Recorte das margens do papel
+7. Recodificação em JPEG com tamanho máximo em bytes
+
+Também gera as miniaturas das fotos guardadas com os resultados, usadas nos
+relatórios em PDF (gerar_miniatura).
+"""
+
+import io
+import os
+from PIL import Image, ImageOps
+
+# Configurações do pré-processamento
+IMAGEM_PREPROCESSAR = os.environ.get('IMAGEM_PREPROCESSAR', '1') == '1'
+IMAGEM_ARESTA_MAXIMA = int(os.environ.get('IMAGEM_ARESTA_MAXIMA', '1600'))
+IMAGEM_MAX_BYTES = int(os.environ.get('IMAGEM_MAX_BYTES', str(400 * 1024)))
+IMAGEM_QUALIDADE = int(os.environ.get('IMAGEM_QUALIDADE', '85'))
+IMAGEM_QUALIDADE_MINIMA = int(os.environ.get('IMAGEM_QUALIDADE_MINIMA', '40'))
+IMAGEM_TONS_DE_CINZA = os.environ.get('IMAGEM_TONS_DE_CINZA', '1') == '1'
+IMAGEM_RECORTAR_MARGENS = os.environ.get('IMAGEM_RECORTAR_MARGENS', '1') == '1'
+IMAGEM_MAX_PIXELS = int(os.environ.get('IMAGEM_MAX_PIXELS', str(50_000_000)))
+MINIATURA_ARESTA = int(os.environ.get('MINIATURA_ARESTA', '800'))
+MINIATURA_QUALIDADE = int(os.environ.get('MINIATURA_QUALIDADE', '70'))
+
+# O próprio Pillow também recusa imagens acima do dobro deste limite
+Image.MAX_IMAGE_PIXELS = IMAGEM_MAX_PIXELS
+
+
+def _ler_bytes(origem) -> bytes:
+    """Aceita caminho de arquivo, bytes ou objeto com read()."""
+    if isinstance(origem, (bytes, bytearray)):
+        return bytes(origem)
+    if hasattr(origem, 'read'):
+        return origem.read()
+    with open(origem, 'rb') as arquivo:
+        return arquivo.read()
+
+
+def _recortar_margens(img: Image.Image) -> Image.Image:
+    """
+    Recorta as bordas sem escrita, mantendo uma pequena folga.
+    Considera "tinta" os pixels bem mais escuros que o papel (a mediana da imagem).
+    """
+    cinza = img if img.mode == 'L' else img.convert('L')
+    histograma = cinza.histogram()
+    metade = sum(histograma) / 2
+    acumulado = 0
+    papel = 255
+    for nivel, quantidade in enumerate(histograma):
+        acumulado += quantidade
+        if acumulado >= metade:
+            papel = nivel
+            break
+
+    limiar = int(papel * 0.7)
+    tinta = cinza.point(lambda p: 255 if p < limiar else 0)
+    caixa = tinta.getbbox()
+    if not caixa:
+        return img
+
+    largura, altura = img.size
+    # Se a "tinta" ocupa quase nada, provavelmente é ruído: não recorta
+    if (caixa[2] - caixa[0]) * (caixa[3] - caixa[1]) < 0.01 * largura * altura:
+        return img
+
+    folga = int(0.03 * max(largura, altura))
+    caixa = (
+        max(0, caixa[0] - folga),
+        max(0, caixa[1] - folga),
+        min(largura, caixa[2] + folga),
+        min(altura, caixa[3] + folga),
+    )
+    return img.crop(caixa)
+
+
+def _codificar_jpeg(img: Image.Image) -> tuple:
+    """
+    Codifica em JPEG reduzindo a qualidade (e, se preciso, as dimensões)
+    até caber em IMAGEM_MAX_BYTES.
+
+    Returns:
+        tuple: (bytes, qualidade usada, imagem final)
+    """
+    qualidade = IMAGEM_QUALIDADE
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=qualidade, optimize=True)
+        dados = buffer.getvalue()
+        if len(dados) <= IMAGEM_MAX_BYTES:
+            return dados, qualidade, img
+        if qualidade > IMAGEM_QUALIDADE_MINIMA:
+            qualidade = max(IMAGEM_QUALIDADE_MINIMA, qualidade - 10)
+        elif min(img.size) > 200:
+            img = img.resize((int(img.width * 0.75), int(img.height * 0.75)), Image.LANCZOS)
+        else:
+            return dados, qualidade, img
+
+
+def preprocessar_imagem(origem) -> tuple:
+    """
+    Prepara a foto da escrita para o envio ao Gemini Vision.
+
+    Args:
+        origem: Caminho do arquivo, bytes ou objeto com read()
+
+    Returns:
+        tuple: (dados da imagem, mime type, relatório com as dimensões e bytes economizados)
+
+    Raises:
+        ValueError: Se a imagem não puder ser lida ou tiver pixels demais
+    """
+    dados_originais = _ler_bytes(origem)
+
+    try:
+        img = Image.open(io.BytesIO(dados_originais))
+    except Exception as e:
+        raise ValueError(f"Não foi possível abrir a imagem: {str(e)}")
+
+    largura, altura = img.size
+    if largura * altura > IMAGEM_MAX_PIXELS:
+        raise ValueError(
+            f"Imagem muito grande ({largura}x{altura} pixels). O limite é de {IMAGEM_MAX_PIXELS} pixels."
+        )
+
+    relatorio = {
+        'bytes_originais': len(dados_originais),
+        'dimensoes_originais': [largura, altura],
+    }
+
+    if not IMAGEM_PREPROCESSAR:
+        mime_type = Image.MIME.get(img.format, 'image/jpeg')
+        relatorio.update({
+            'bytes_finais': len(dados_originais),
+            'bytes_economizados': 0,
+            'dimensoes_finais': [largura, altura],
+        })
+        return dados_originais, mime_type, relatorio
+
+    # Em JPEG, decodifica direto em escala reduzida (1/2, 1/4 ou 1/8)
+    if img.format == 'JPEG':
+        img.draft('L' if IMAGEM_TONS_DE_CINZA else 'RGB', (IMAGEM_ARESTA_MAXIMA, IMAGEM_ARESTA_MAXIMA))
+
+    img = ImageOps.exif_transpose(img)
+    img = img.convert('L' if IMAGEM_TONS_DE_CINZA else 'RGB')
+    img.thumbnail((IMAGEM_ARESTA_MAXIMA, IMAGEM_ARESTA_MAXIMA), Image.LANCZOS)
+
+    if IMAGEM_RECORTAR_MARGENS:
+        img = _recortar_margens(img)
+
+    dados, qualidade, img = _codificar_jpeg(img)
+
+    relatorio.update({
+        'bytes_finais': len(dados),
+        'bytes_economizados': max(0, len(dados_originais) - len(dados)),
+        'dimensoes_finais': [img.width, img.height],
+        'qualidade': qualidade,
+    })
+    return dados, 'image/jpeg', relatorio
+
+
+def gerar_miniatura(dados: bytes):
+    """
+    Reduz a foto para os relatórios: aresta máxima MINIATURA_ARESTA, em JPEG.
+    Em JPEG, a decodificação já sai em escala reduzida, então custa pouco
+    mesmo para fotos de celular.
+
+    Returns:
+        bytes: A miniatura, ou None se a imagem não puder ser lida
+    """
+    try:
+        img = Image.open(io.BytesIO(dados))
+        if img.width * img.height > IMAGEM_MAX_PIXELS:
+            return None
+        if img.format == 'JPEG':
+            img.draft('RGB', (MINIATURA_ARESTA, MINIATURA_ARESTA))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        img.thumbnail((MINIATURA_ARESTA, MINIATURA_ARESTA), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=MINIATURA_QUALIDADE, optimize=True)
+        return buffer.getvalue()
+    except Exception:
+        return None
@@ -0,0 +1,155 @@
+"""
+Registro (logging) estruturado da aplicação.
+Antes, cada /analyze fazia vários print() na thread da requisição, inclusive
+com as palavras ditadas e as escritas das crianças. Sob carga, escrever no
+stdout custava tempo de resposta, e os dados dos alunos iam parar nos logs.
+
+Aqui:
+1. Cada linha é um objeto JSON (momento, nível, módulo, mensagem, campos extras)
+2. As threads das requisições só colocam o registro numa fila; uma thread
+   separada (QueueListener) escreve no stdout
+3. Cada requisição recebe um identificador (cabeçalho X-Request-ID), que
+   acompanha todas as linhas da análise, inclusive nas threads auxiliares
+4. O nível vem de LOG_LEVEL (padrão INFO): em produção, as mensagens de
+   depuração são descartadas antes de qualquer formatação
+5. Os dados das crianças, passados em campos como 'palavras' e 'escrita',
+   saem redigidos (só o tamanho); LOG_DADOS_ALUNOS=1 os mostra, para depuração local
+
+Uso:
+    logger = registro.obter_logger(__name__)
+    logger.debug("Dados recebidos", extra={'palavras': palavras_ditadas})
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_DADOS_ALUNOS = os.environ.get('LOG_DADOS_ALUNOS', '0') == '1'
+
+# Campos extras que contêm dados das crianças e são redigidos
+CAMPOS_SENSIVEIS = frozenset({
+    'aluno', 'palavra', 'palavras', 'palavras_ditadas', 'transcricao', 'transcricao_previa',
+    'escrita', 'escritas', 'resposta',
+})
+
+# Atributos que todo LogRecord tem; o que sobra são os campos passados em extra=
+_ATRIBUTOS_PADRAO = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'id_requisicao'}
+
+_id_requisicao = contextvars.ContextVar('id_requisicao', default=None)
+
+_fila = queue.Queue(-1)
+_ouvinte = {"objeto": None, "pid": None}
+_ouvinte_lock = threading.Lock()
+
+
+def novo_id_requisicao(informado: str = None) -> str:
+    """
+    Define o identificador da requisição atual (o informado pelo cliente ou
+    proxy, se for razoável, ou um novo) e o retorna.
+    """
+    if informado and len(informado) <= 64 and informado.isprintable():
+        id_requisicao = informado
+    else:
+        id_requisicao = uuid.uuid4().hex[:16]
+    _id_requisicao.set(id_requisicao)
+    return id_requisicao
+
+
+def definir_id_requisicao(id_requisicao: str):
+    """Associa as linhas seguintes, nesta thread, a um identificador já existente (ex.: o de uma tarefa)."""
+    _id_requisicao.set(id_requisicao)
+
+
+def id_requisicao_atual():
+    return _id_requisicao.get()
+
+
+def _redigir(valor) -> str:
+    if isinstance(valor, (list, tuple)):
+        return f"<{len(valor)} itens omitidos>"
+    return f"<{len(str(valor))} caracteres omitidos>"
+
+
+class FormatadorJSON(logging.Formatter):
+    """Formata o registro como uma linha JSON, redigindo os campos sensíveis."""
+
+    def format(self, record):
+        linha = {
+            'momento': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'modulo': record.name,
+            'mensagem': record.getMessage(),
+        }
+        if getattr(record, 'id_requisicao', None):
+            linha['id_requisicao'] = record.id_requisicao
+        for campo, valor in vars(record).items():
+            if campo in _ATRIBUTOS_PADRAO:
+                continue
+            if campo in CAMPOS_SENSIVEIS and not LOG_DADOS_ALUNOS:
+                valor = _redigir(valor)
+            linha[campo] = valor
+        if record.exc_info:
+            linha['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(linha, ensure_ascii=False, default=str)
+
+
+class _ManipuladorFila(QueueHandler):
+    """
+    Formata na thread de quem registrou (onde o id da requisição está
+    disponível) e só coloca o texto pronto na fila.
+    """
+
+    def prepare(self, record):
+        record.id_requisicao = _id_requisicao.get()
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        _iniciar_ouvinte()
+        super().enqueue(record)
+
+
+def _iniciar_ouvinte():
+    """Inicia a thread que escreve os registros (uma por processo; a do pai não sobrevive ao fork)."""
+    if _ouvinte["pid"] == os.getpid():
+        return
+    with _ouvinte_lock:
+        if _ouvinte["pid"] == os.getpid():
+            return
+        saida = logging.StreamHandler(sys.stdout)
+        saida.setFormatter(logging.Formatter('%(message)s'))
+        ouvinte = QueueListener(_fila, saida)
+        ouvinte.start()
+        _ouvinte.update(objeto=ouvinte, pid=os.getpid())
+
+
+def _parar_ouvinte():
+    """Escreve o que ainda estiver na fila antes de o processo terminar."""
+    if _ouvinte["pid"] == os.getpid():
+        _ouvinte["objeto"].stop()
+
+
+def _configurar():
+    raiz = logging.getLogger('sondagem')
+    raiz.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    raiz.propagate = False
+    manipulador = _ManipuladorFila(_fila)
+    manipulador.setFormatter(FormatadorJSON())
+    raiz.addHandler(manipulador)
+    atexit.register(_parar_ouvinte)
+
+
+_configurar()
+
+
+def obter_logger(nome: str) -> logging.Logger:
+    """Retorna o logger do módulo (ex.: obter_logger(__name__))."""
+    return logging.getLogger(f'sondagem.{nome}')
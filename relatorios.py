@@ -0,0 +1,289 @@
+"""
+Relatórios em PDF da turma, gerados no servidor (rota /relatorios).
+O generateReport() da página monta um relatório por vez no navegador, com a
+foto em resolução original embutida como data URL: imprimir a turma inteira
+eram 30 idas e vindas e páginas pesadas.
+
+Aqui os relatórios saem das sondagens gravadas (armazenamento.py):
+1. Os estilos e o leiaute da página são montados uma vez por processo e
+   reaproveitados em todos os relatórios
+2. As fotos são as miniaturas guardadas com os resultados, não os originais
+3. A renderização roda num pool de processos (RELATORIOS_PROCESSOS), fora
+   das threads que atendem as requisições
+4. No formato ZIP (um PDF por aluno), cada PDF é enviado assim que fica
+   pronto, com poucos alunos em andamento por vez: a memória do worker não
+   cresce com o tamanho da turma
+
+O caderno da turma (um único PDF) é montado inteiro por um processo do pool,
+porque o PDF só pode ser escrito depois de todas as páginas (o índice de
+objetos fica no fim do arquivo); por isso ele não é enviado aos poucos e tem
+um limite de alunos (RELATORIOS_CADERNO_MAX_ALUNOS). Para turmas maiores, use o ZIP.
+
+Se o reportlab não estiver instalado, a rota /relatorios responde 503.
+"""
+
+import io
+import os
+import re
+import time
+import zipfile
+import functools
+import threading
+import multiprocessing
+from collections import deque
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+import registro
+
+logger = registro.obter_logger(__name__)
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    PDF_DISPONIVEL = True
+except ImportError:
+    logger.warning("reportlab não instalado. A rota /relatorios ficará desativada.")
+    PDF_DISPONIVEL = False
+
+# Configurações dos relatórios
+RELATORIOS_PROCESSOS = int(os.environ.get('RELATORIOS_PROCESSOS', '2'))
+RELATORIOS_CADERNO_MAX_ALUNOS = int(os.environ.get('RELATORIOS_CADERNO_MAX_ALUNOS', '60'))
+
+# Cada processo do pool é trocado depois de tantos relatórios (libera a memória do reportlab)
+_RELATORIOS_POR_PROCESSO = 200
+
+_pool = {"executor": None, "pid": None}
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _modelo() -> dict:
+    """Estilos e leiaute dos relatórios, montados uma vez por processo."""
+    base = getSampleStyleSheet()
+    roxo = colors.HexColor('#667eea')
+    return {
+        'titulo': ParagraphStyle('Titulo', parent=base['Title'], fontSize=18, textColor=roxo, spaceAfter=4),
+        'subtitulo': ParagraphStyle('Subtitulo', parent=base['Normal'], fontSize=10, alignment=1,
+                                    textColor=colors.grey, spaceAfter=12),
+        'secao': ParagraphStyle('Secao', parent=base['Heading3'], textColor=roxo, spaceBefore=10, spaceAfter=4),
+        'texto': ParagraphStyle('Texto', parent=base['Normal'], fontSize=10, leading=14),
+        'hipotese': ParagraphStyle('Hipotese', parent=base['Normal'], fontSize=13, leading=17, textColor=roxo),
+        'tabela': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), roxo),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+        'identificacao': TableStyle([
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]),
+        'largura_util': A4[0] - 4 * cm,
+        'altura_foto': 9 * cm,
+    }
+
+
+def _rodape(canvas, documento):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.setFillColor(colors.grey)
+    canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, f"Sistema de Sondagem Pedagógica — página {documento.page}")
+    canvas.restoreState()
+
+
+def _data_br(data: str) -> str:
+    """AAAA-MM-DD -> DD/MM/AAAA."""
+    partes = (data or '').split('-')
+    return '/'.join(reversed(partes)) if len(partes) == 3 else (data or 'Não informada')
+
+
+def _paginas_do_aluno(sondagem: dict, miniatura: bytes) -> list:
+    """Monta os elementos (flowables) do relatório de um aluno."""
+    modelo = _modelo()
+    texto = modelo['texto']
+    elementos = [
+        Paragraph("Relatório de Sondagem Pedagógica", modelo['titulo']),
+        Paragraph(escape(', '.join(sondagem['palavras_ditadas']) or 'Palavras ditadas não informadas'),
+                  modelo['subtitulo']),
+    ]
+
+    rodada = f"{sondagem['rodada']}ª sondagem" if sondagem.get('rodada') else 'Não informada'
+    identificacao = [
+        ['<b>Aluno(a):</b>', escape(sondagem['aluno'] or 'Não informado'), '<b>Data:</b>', _data_br(sondagem['data'])],
+        ['<b>Turma:</b>', escape(sondagem['turma'] or 'Não informada'), '<b>Rodada:</b>', rodada],
+        ['<b>Escola:</b>', escape(sondagem['escola'] or 'Não informada'), '<b>Professor(a):</b>',
+         escape(sondagem['professor'] or 'Não informado')],
+    ]
+    largura = modelo['largura_util']
+    tabela = Table([[Paragraph(celula, texto) for celula in linha] for linha in identificacao],
+                   colWidths=[0.15 * largura, 0.35 * largura, 0.18 * largura, 0.32 * largura])
+    tabela.setStyle(modelo['identificacao'])
+    elementos.append(tabela)
+
+    if miniatura:
+        elementos.append(Paragraph("Registro da Escrita do Aluno(a)", modelo['secao']))
+        largura_foto, altura_foto = ImageReader(io.BytesIO(miniatura)).getSize()
+        escala = min(largura / largura_foto, modelo['altura_foto'] / altura_foto)
+        elementos.append(Image(io.BytesIO(miniatura), width=largura_foto * escala, height=altura_foto * escala))
+
+    hipotese = sondagem.get('hipotese_professor') or sondagem.get('hipotese') or 'N/A'
+    origem = ' (definida pelo professor)' if sondagem.get('hipotese_professor') else ''
+    elementos += [
+        Paragraph("Análise Pedagógica", modelo['secao']),
+        Paragraph(f"<b>Hipótese de Escrita:</b> {escape(hipotese)}{origem}", modelo['hipotese']),
+        Spacer(1, 4),
+        Paragraph(f"<b>Transcrição:</b> {escape(sondagem.get('transcricao') or 'N/A')}", texto),
+        Spacer(1, 4),
+        Paragraph(f"<b>Justificativa:</b> {escape(sondagem.get('justificativa') or 'N/A')}", texto),
+    ]
+
+    analises = sondagem.get('analises_individuais') or []
+    if analises:
+        elementos.append(Paragraph("Análise por Palavra", modelo['secao']))
+        linhas = [['Palavra', 'Escrita', 'Hipótese', 'Justificativa']] + [
+            [Paragraph(escape(str(analise.get(campo, ''))), texto)
+             for campo in ('palavra', 'escrita', 'hipotese', 'justificativa')]
+            for analise in analises
+        ]
+        tabela = Table(linhas, colWidths=[0.16 * largura, 0.16 * largura, 0.22 * largura, 0.46 * largura],
+                       repeatRows=1)
+        tabela.setStyle(modelo['tabela'])
+        elementos.append(tabela)
+    return elementos
+
+
+def _renderizar(alunos: list) -> bytes:
+    """
+    Gera o PDF com uma ou mais sondagens, uma por página (roda nos processos do pool).
+
+    Args:
+        alunos: Lista de tuplas (sondagem, miniatura)
+    """
+    buffer = io.BytesIO()
+    documento = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=1.8 * cm, bottomMargin=2 * cm,
+        title="Relatório de Sondagem Pedagógica",
+    )
+    elementos = []
+    for sondagem, miniatura in alunos:
+        if elementos:
+            elementos.append(PageBreak())
+        elementos += _paginas_do_aluno(sondagem, miniatura)
+    documento.build(elementos, onFirstPage=_rodape, onLaterPages=_rodape)
+    return buffer.getvalue()
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    """
+    Retorna o pool deste worker (criado na primeira vez). Os processos do pool
+    partem de um processo limpo (forkserver), não de uma cópia do worker com
+    suas threads e conexões abertas.
+    """
+    if _pool["pid"] == os.getpid():
+        return _pool["executor"]
+    with _pool_lock:
+        if _pool["pid"] != os.getpid():
+            metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool["executor"] = ProcessPoolExecutor(
+                max_workers=max(1, RELATORIOS_PROCESSOS),
+                mp_context=multiprocessing.get_context(metodo),
+                max_tasks_per_child=_RELATORIOS_POR_PROCESSO,
+            )
+            _pool["pid"] = os.getpid()
+        return _pool["executor"]
+
+
+def mais_recentes(sondagens: list) -> list:
+    """Mantém a sondagem mais recente de cada aluno (as reanálises substituem as anteriores)."""
+    por_aluno = {}
+    sem_nome = []
+    for sondagem in sondagens:
+        if sondagem['aluno']:
+            por_aluno[sondagem['aluno']] = sondagem
+        else:
+            sem_nome.append(sondagem)
+    return sorted(por_aluno.values(), key=lambda s: s['aluno'].casefold()) + sem_nome
+
+
+def nome_arquivo(texto: str) -> str:
+    """Nome seguro para arquivo (mantém acentos, troca separadores e símbolos)."""
+    return re.sub(r'[^\w\- ]+', '_', texto).strip() or 'sem_nome'
+
+
+def gerar_caderno(sondagens: list, obter_miniatura) -> bytes:
+    """
+    Gera o caderno da turma: um único PDF com um relatório por aluno.
+
+    Args:
+        sondagens: Sondagens na ordem das páginas
+        obter_miniatura: Função hash_imagem (SHA-256 da foto) -> bytes da miniatura (ou None)
+    """
+    alunos = [(sondagem, obter_miniatura(sondagem['hash_imagem'])) for sondagem in sondagens]
+    return _obter_pool().submit(_renderizar, alunos).result()
+
+
+class _SaidaZip:
+    """Arquivo só de escrita para o zipfile: acumula os bytes até o gerador entregá-los."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self) -> bytes:
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+
+def gerar_zip(sondagens: list, obter_miniatura):
+    """
+    Gera o ZIP com um PDF por aluno, em partes, na ordem da lista.
+
+    Só alguns alunos ficam em andamento ao mesmo tempo (o dobro de processos
+    do pool); cada PDF é entregue ao cliente e descartado antes de o próximo
+    aluno entrar na fila.
+
+    Yields:
+        bytes: Partes do arquivo ZIP
+    """
+    inicio = time.time()
+    pool = _obter_pool()
+    saida = _SaidaZip()
+    janela = deque()
+    pendentes = iter(enumerate(sondagens, start=1))
+    try:
+        # PDFs já são comprimidos: ZIP_STORED evita gastar CPU à toa
+        with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_STORED) as arquivo_zip:
+            while True:
+                while len(janela) < 2 * max(1, RELATORIOS_PROCESSOS):
+                    proximo = next(pendentes, None)
+                    if proximo is None:
+                        break
+                    indice, sondagem = proximo
+                    miniatura = obter_miniatura(sondagem['hash_imagem'])
+                    nome = f"{indice:02d} - {nome_arquivo(sondagem['aluno'] or 'Aluno sem nome')}.pdf"
+                    janela.append((nome, pool.submit(_renderizar, [(sondagem, miniatura)])))
+                if not janela:
+                    break
+                nome, futuro = janela.popleft()
+                arquivo_zip.writestr(nome, futuro.result())
+                yield saida.retirar()
+        yield saida.retirar()
+    finally:
+        # Se o cliente desconectar no meio, os alunos que nem começaram são descartados
+        for _, futuro in janela:
+            futuro.cancel()
+    logger.info("Relatórios da turma gerados", extra={
+        'total_alunos': len(sondagens), 'duracao_segundos': round(time.time() - inicio, 2),
+    })
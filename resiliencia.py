@@ -0,0 +1,253 @@
+"""
+Resiliência das chamadas ao Gemini.
+Um 429 (cota) ou 503 passageiro do Gemini virava direto "Erro na Análise" e
+o professor tentava de novo, dobrando a carga. Este módulo envolve cada
+chamada com:
+
+1. Novas tentativas limitadas, com espera exponencial e jitter, apenas para
+   erros passageiros (429, 500, 503, 504, falhas de conexão)
+2. Disjuntor (circuit breaker): depois de várias falhas seguidas, as chamadas
+   falham na hora durante um intervalo, em vez de esperar o tempo limite
+3. Requisições "hedged" (opcional): se a chamada passa do p95 de latência,
+   uma cópia é disparada e vale a primeira resposta
+
+O estado (disjuntor e latências) é de cada processo do gunicorn.
+"""
+
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from google.api_core import exceptions as google_exceptions
+import metricas
+import registro
+
+logger = registro.obter_logger(__name__)
+
+# Configurações das novas tentativas
+GEMINI_TENTATIVAS = int(os.environ.get('GEMINI_TENTATIVAS', '3'))
+GEMINI_ESPERA_BASE = float(os.environ.get('GEMINI_ESPERA_BASE', '0.5'))
+GEMINI_ESPERA_MAXIMA = float(os.environ.get('GEMINI_ESPERA_MAXIMA', '8'))
+GEMINI_PRAZO_TOTAL = float(os.environ.get('GEMINI_PRAZO_TOTAL', '90'))
+
+# Configurações do disjuntor
+CIRCUITO_LIMITE_FALHAS = int(os.environ.get('CIRCUITO_LIMITE_FALHAS', '5'))
+CIRCUITO_TEMPO_ABERTO = float(os.environ.get('CIRCUITO_TEMPO_ABERTO', '30'))
+
+# Configurações das requisições hedged
+GEMINI_HEDGE = os.environ.get('GEMINI_HEDGE', '0') == '1'
+GEMINI_HEDGE_MIN_AMOSTRAS = int(os.environ.get('GEMINI_HEDGE_MIN_AMOSTRAS', '20'))
+
+# Erros do Gemini que costumam passar sozinhos
+_ERROS_PASSAGEIROS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class GeminiIndisponivel(Exception):
+    """O Gemini está indisponível: disjuntor aberto ou tentativas esgotadas."""
+
+
+def erro_passageiro(erro: Exception) -> bool:
+    """Indica se vale a pena tentar a chamada de novo."""
+    # 'code' nos erros do Google, 'status_code' nos de clientes HTTP (ex.: openai)
+    codigo = getattr(erro, 'code', None) or getattr(erro, 'status_code', None)
+    return isinstance(erro, _ERROS_PASSAGEIROS) or codigo in (429, 500, 502, 503, 504)
+
+
+class Disjuntor:
+    """
+    Disjuntor com três estados:
+    - fechado: chamadas normais
+    - aberto: chamadas recusadas na hora, até passar CIRCUITO_TEMPO_ABERTO
+    - meio_aberto: uma chamada de teste; se funcionar, fecha; se falhar, abre de novo
+    """
+
+    def __init__(self, limite_falhas: int, tempo_aberto: float):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._falhas_seguidas < self.limite_falhas:
+                return True
+            if time.time() < self._aberto_ate or self._teste_em_andamento:
+                return False
+            self._teste_em_andamento = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas_seguidas = 0
+            self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas_seguidas += 1
+            self._teste_em_andamento = False
+            if self._falhas_seguidas >= self.limite_falhas:
+                self._aberto_ate = time.time() + self.tempo_aberto
+
+    def liberar_teste(self):
+        """Libera a vaga da chamada de teste sem contar sucesso nem falha (a chamada não chegou ao backend)."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def estado(self) -> str:
+        with self._lock:
+            if self._falhas_seguidas < self.limite_falhas:
+                return 'fechado'
+            return 'aberto' if time.time() < self._aberto_ate else 'meio_aberto'
+
+
+# Disjuntor das chamadas ao Gemini (os outros backends de backends.py têm o seu)
+disjuntor_gemini = Disjuntor(CIRCUITO_LIMITE_FALHAS, CIRCUITO_TEMPO_ABERTO)
+
+# Latências das últimas chamadas bem-sucedidas (para o p95 do hedge)
+_latencias = deque(maxlen=200)
+_latencias_lock = threading.Lock()
+
+# Threads das chamadas hedged (a original e a cópia rodam aqui)
+_executor_hedge = ThreadPoolExecutor(max_workers=16, thread_name_prefix='gemini-hedge')
+
+_estatisticas = {"novas_tentativas": 0, "recusadas_pelo_disjuntor": 0, "hedges_disparados": 0, "hedges_vencedores": 0}
+_estatisticas_lock = threading.Lock()
+
+
+def _contar(nome: str):
+    with _estatisticas_lock:
+        _estatisticas[nome] += 1
+
+
+def _registrar_latencia(segundos: float):
+    with _latencias_lock:
+        _latencias.append(segundos)
+
+
+def _p95():
+    """p95 das latências recentes, ou None se ainda houver poucas amostras."""
+    with _latencias_lock:
+        if len(_latencias) < GEMINI_HEDGE_MIN_AMOSTRAS:
+            return None
+        ordenadas = sorted(_latencias)
+    return ordenadas[int(0.95 * (len(ordenadas) - 1))]
+
+
+def _chamar_com_hedge(chamada):
+    """
+    Executa a chamada; se ela passar do p95, dispara uma cópia e devolve a
+    primeira resposta bem-sucedida. A chamada perdedora termina em segundo plano.
+    """
+    atraso = _p95()
+    if atraso is None:
+        return chamada()
+
+    original = _executor_hedge.submit(chamada)
+    concluidas, _ = wait([original], timeout=atraso)
+    if concluidas:
+        return original.result()
+
+    _contar("hedges_disparados")
+    copia = _executor_hedge.submit(chamada)
+    pendentes = {original, copia}
+    erro = None
+    while pendentes:
+        concluidas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+        for futuro in concluidas:
+            if futuro.exception() is None:
+                if futuro is copia:
+                    _contar("hedges_vencedores")
+                return futuro.result()
+            erro = futuro.exception()
+    raise erro
+
+
+def executar(chamada, descricao: str = 'gemini', disjuntor: Disjuntor = None, tentativas: int = None):
+    """
+    Executa uma chamada ao Gemini com novas tentativas, disjuntor e hedge.
+
+    Args:
+        chamada: Função sem argumentos que faz a chamada (ex.: generate_content)
+        descricao: Nome da etapa, para os logs
+        disjuntor: Disjuntor do backend chamado (padrão: o do Gemini)
+        tentativas: Número máximo de tentativas (padrão: GEMINI_TENTATIVAS)
+
+    Returns:
+        O retorno da chamada
+
+    Raises:
+        GeminiIndisponivel: Se o disjuntor estiver aberto ou as tentativas se esgotarem
+        Exception: Erros que não são passageiros (ex.: chave inválida) sobem sem nova tentativa
+    """
+    prazo = time.time() + GEMINI_PRAZO_TOTAL
+    disjuntor = disjuntor or disjuntor_gemini
+    tentativas = tentativas or GEMINI_TENTATIVAS
+
+    for tentativa in range(1, tentativas + 1):
+        if not disjuntor.permitir():
+            _contar("recusadas_pelo_disjuntor")
+            metricas.contar('erros_gemini', tipo='disjuntor_aberto')
+            raise GeminiIndisponivel("O Gemini está instável no momento; chamadas suspensas temporariamente.")
+
+        inicio = time.perf_counter()
+        try:
+            resposta = _chamar_com_hedge(chamada) if GEMINI_HEDGE else chamada()
+        except GeminiIndisponivel:
+            # Ex.: cota local esgotada (limitador); não é falha do Gemini, mas a vaga
+            # da chamada de teste (meio aberto) precisa voltar, senão o disjuntor nunca fecha
+            disjuntor.liberar_teste()
+            raise
+        except Exception as e:
+            if not erro_passageiro(e):
+                disjuntor.registrar_sucesso()  # O Gemini respondeu; o erro é da requisição
+                metricas.contar('erros_gemini', tipo='definitivo')
+                raise
+            disjuntor.registrar_falha()
+            metricas.contar('erros_gemini', tipo='passageiro')
+
+            espera = min(GEMINI_ESPERA_MAXIMA, GEMINI_ESPERA_BASE * (2 ** (tentativa - 1)))
+            espera = random.uniform(0, espera)  # Jitter completo: espalha as novas tentativas dos workers
+            if tentativa == tentativas or time.time() + espera > prazo:
+                raise GeminiIndisponivel(f"Gemini indisponível após {tentativa} tentativa(s): {str(e)[:200]}") from e
+
+            logger.warning("Erro passageiro no Gemini; nova tentativa agendada", extra={
+                'etapa': descricao,
+                'tentativa': tentativa,
+                'tentativas_max': tentativas,
+                'espera_segundos': round(espera, 1),
+                'erro': str(e)[:200],
+            })
+            _contar("novas_tentativas")
+            time.sleep(espera)
+            continue
+
+        disjuntor.registrar_sucesso()
+        _registrar_latencia(time.perf_counter() - inicio)
+        return resposta
+
+
+def estatisticas() -> dict:
+    """Retorna o estado do disjuntor e os contadores de resiliência deste processo."""
+    with _estatisticas_lock:
+        contadores = dict(_estatisticas)
+    p95 = _p95()
+    contadores.update({
+        "disjuntor": disjuntor_gemini.estado(),
+        "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        "hedge_habilitado": GEMINI_HEDGE,
+    })
+    return contadores
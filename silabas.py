@@ -0,0 +1,272 @@
+"""
+Divisão silábica e transcrição fonológica do português brasileiro.
+Fornece a estrutura silábica das palavras ditadas (quantas sílabas, quais letras
+têm valor sonoro) para enriquecer os prompts e para a triagem local.
+
+Trata os dígrafos (LH, NH, CH, RR, SS, QU, GU), vogais nasais, acentos,
+ditongos e hiatos. Os resultados são memorizados por palavra.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple
+
+VOGAIS = set('AEIOUÁÉÍÓÚÂÊÔÃÕÀY')
+SEMIVOGAIS = set('IU')
+VOGAIS_NASAIS = set('ÃÕ')
+
+# Consoantes que formam encontro inseparável com L ou R (BR, CL, PR, ...)
+_PRIMEIRA_DO_ENCONTRO = set('BCDFGKPTV')
+_ENCONTROS_SEPARAVEIS = {'TL', 'DL'}
+
+_VOGAL_FONEMA = {
+    'A': 'a', 'Á': 'a', 'À': 'a', 'Â': 'a', 'Ã': 'ã',
+    'E': 'e', 'É': 'ɛ', 'Ê': 'e',
+    'I': 'i', 'Í': 'i', 'Y': 'i',
+    'O': 'o', 'Ó': 'ɔ', 'Ô': 'o', 'Õ': 'õ',
+    'U': 'u', 'Ú': 'u',
+}
+_NASALIZADA = {'a': 'ã', 'e': 'ẽ', 'ɛ': 'ẽ', 'i': 'ĩ', 'o': 'õ', 'ɔ': 'õ', 'u': 'ũ'}
+_CONSOANTE_FONEMA = {
+    'B': 'b', 'D': 'd', 'F': 'f', 'J': 'ʒ', 'K': 'k', 'L': 'l', 'M': 'm', 'N': 'n',
+    'P': 'p', 'T': 't', 'V': 'v', 'W': 'w', 'X': 'ʃ', 'Z': 'z', 'Ç': 's',
+    'CH': 'ʃ', 'LH': 'ʎ', 'NH': 'ɲ',
+}
+_ANTERIORES = set('EIÉÊÍY')
+
+
+class EstruturaPalavra(NamedTuple):
+    """Estrutura silábica e fonológica de uma palavra."""
+    palavra: str
+    silabas: tuple
+    tonica: int
+    fonemas: tuple
+
+    @property
+    def num_silabas(self) -> int:
+        return len(self.silabas)
+
+    def descrever(self) -> str:
+        """Descrição curta usada nos prompts, ex.: 'CA-VA-LO (3 sílabas)'."""
+        rotulo = "sílaba" if self.num_silabas == 1 else "sílabas"
+        return f"{'-'.join(self.silabas)} ({self.num_silabas} {rotulo})"
+
+
+def _eh_vogal(unidade: str) -> bool:
+    return len(unidade) == 1 and unidade in VOGAIS
+
+
+def _unidades(palavra: str) -> list:
+    """Separa a palavra em unidades gráficas, agrupando os dígrafos consonantais."""
+    unidades = []
+    i = 0
+    while i < len(palavra):
+        par = palavra[i:i + 2]
+        seguinte = palavra[i + 2:i + 3]
+        if par in ('LH', 'NH', 'CH'):
+            unidades.append(par)
+            i += 2
+        elif par in ('QU', 'GU') and seguinte and seguinte in VOGAIS:
+            # O U de QU/GU antes de vogal pertence à consoante (QUEIJO, ÁGUA)
+            unidades.append(par)
+            i += 2
+        else:
+            unidades.append(palavra[i])
+            i += 1
+    return unidades
+
+
+def _forma_ditongo(atual: str, proxima: str, depois: list) -> bool:
+    """
+    Verifica se duas vogais seguidas ficam na mesma sílaba (ditongo) ou se
+    separam (hiato), com base nas regras de divisão silábica do português.
+    """
+    if atual in VOGAIS_NASAIS and proxima in 'EO':
+        return True
+    if proxima not in SEMIVOGAIS or proxima == atual:
+        return False
+    if depois and depois[0] == 'NH':
+        return False
+    # I/U seguido de consoante que fecha a sílaba (exceto S) forma hiato: SA-IR, JU-IZ, RU-IM
+    if depois and not _eh_vogal(depois[0]) and depois[0] != 'S':
+        if len(depois) == 1 or not _eh_vogal(depois[1]):
+            return False
+    return True
+
+
+def _separar(unidades: list) -> list:
+    """Divide as unidades gráficas em sílabas."""
+    # Localiza os núcleos vocálicos (cada núcleo é uma lista de índices)
+    nucleos = []
+    i = 0
+    while i < len(unidades):
+        if _eh_vogal(unidades[i]):
+            nucleo = [i]
+            if (i + 1 < len(unidades) and _eh_vogal(unidades[i + 1])
+                    and _forma_ditongo(unidades[i], unidades[i + 1], unidades[i + 2:])):
+                nucleo.append(i + 1)
+            nucleos.append(nucleo)
+            i = nucleo[-1] + 1
+        else:
+            i += 1
+
+    if not nucleos:
+        return [''.join(unidades)] if unidades else []
+
+    # Distribui as consoantes entre os núcleos
+    inicios = [0]
+    for anterior, proximo in zip(nucleos, nucleos[1:]):
+        consoantes = list(range(anterior[-1] + 1, proximo[0]))
+        if not consoantes:
+            inicios.append(proximo[0])
+            continue
+        ultimas = ''.join(unidades[j] for j in consoantes[-2:])
+        if (len(consoantes) >= 2 and len(ultimas) == 2 and ultimas[0] in _PRIMEIRA_DO_ENCONTRO
+                and ultimas[1] in 'LR' and ultimas not in _ENCONTROS_SEPARAVEIS):
+            inicios.append(consoantes[-2])
+        else:
+            inicios.append(consoantes[-1])
+
+    limites = inicios[1:] + [len(unidades)]
+    return [''.join(unidades[inicio:fim]) for inicio, fim in zip(inicios, limites)]
+
+
+def _silaba_tonica(silabas: list) -> int:
+    """Localiza a sílaba tônica pelo acento gráfico ou pelas regras de acentuação."""
+    for indice, silaba in enumerate(silabas):
+        if any(c in 'ÁÉÍÓÚÂÊÔ' for c in silaba):
+            return indice
+    for indice in range(len(silabas) - 1, -1, -1):
+        if any(c in 'ÃÕ' for c in silabas[indice]):
+            return indice
+
+    if len(silabas) == 1:
+        return 0
+
+    # Sem acento: oxítonas terminadas em R, L, Z, X, I, U, IM, UM...; paroxítonas nas demais
+    final = silabas[-1]
+    if re.search(r'([RLZXIUY]|[IU]S|[IU]M|[IU]NS|[IU]N)$', final) and not re.search(r'(QU|GU)[IE]S?$', final):
+        return len(silabas) - 1
+    return len(silabas) - 2
+
+
+def _fonemas(silabas: list, tonica: int) -> tuple:
+    """Transcreve cada sílaba em uma sequência aproximada de fonemas (pt-BR)."""
+    unidades_por_silaba = [_unidades(silaba) for silaba in silabas]
+    todas = [u for unidades in unidades_por_silaba for u in unidades]
+
+    resultado = []
+    posicao = 0
+    for indice, unidades in enumerate(unidades_por_silaba):
+        fonemas = []
+        ultima_silaba = indice == len(silabas) - 1
+        for k, unidade in enumerate(unidades):
+            anterior = todas[posicao - 1] if posicao > 0 else ''
+            seguinte = todas[posicao + 1] if posicao + 1 < len(todas) else ''
+            na_coda = any(_eh_vogal(u) for u in unidades[:k]) and not any(_eh_vogal(u) for u in unidades[k + 1:])
+            posicao += 1
+
+            if _eh_vogal(unidade):
+                som = _VOGAL_FONEMA[unidade]
+                # Vogal seguida de M/N na mesma sílaba é nasal: CAM-PO, BEN-TO
+                if k + 1 < len(unidades) and unidades[k + 1] in ('M', 'N') \
+                        and not any(_eh_vogal(u) for u in unidades[k + 2:]):
+                    som = _NASALIZADA.get(som, som)
+                # Vogal final átona é reduzida: CAVALO -> /u/, LEITE -> /i/
+                if ultima_silaba and indice != tonica and not any(_eh_vogal(u) for u in unidades[k + 1:]):
+                    som = {'o': 'u', 'e': 'i'}.get(som, som)
+                fonemas.append(som)
+            elif unidade in ('M', 'N') and na_coda:
+                continue  # Marca de nasalidade, já representada na vogal
+            elif unidade == 'H':
+                continue  # H não tem som
+            elif unidade == 'QU':
+                fonemas.append('k' if seguinte in _ANTERIORES else 'kw')
+            elif unidade == 'GU':
+                fonemas.append('g' if seguinte in _ANTERIORES else 'gw')
+            elif unidade == 'C':
+                fonemas.append('s' if seguinte in _ANTERIORES else 'k')
+            elif unidade == 'G':
+                fonemas.append('ʒ' if seguinte in _ANTERIORES else 'g')
+            elif unidade == 'R':
+                if seguinte == 'R':
+                    continue  # Primeiro R do dígrafo RR
+                if anterior in ('', 'R', 'N', 'L', 'S'):
+                    fonemas.append('ʁ')
+                elif na_coda:
+                    fonemas.append('ʁ')
+                else:
+                    fonemas.append('ɾ')
+            elif unidade == 'S':
+                if seguinte == 'S' or (seguinte == 'C' and posicao + 1 < len(todas) and todas[posicao + 1] in _ANTERIORES):
+                    continue  # Primeiro S de SS e S de SC antes de E/I
+                fonemas.append('z' if _eh_vogal(anterior) and _eh_vogal(seguinte) else 's')
+            elif unidade == 'L' and na_coda:
+                fonemas.append('w')
+            elif unidade == 'Z' and not seguinte:
+                fonemas.append('s')
+            else:
+                fonemas.append(_CONSOANTE_FONEMA.get(unidade, unidade.lower()))
+        resultado.append(tuple(fonemas))
+    return tuple(resultado)
+
+
+def normalizar(palavra: str) -> str:
+    """Converte para maiúsculas e remove tudo que não for letra (mantém acentos e Ç)."""
+    palavra = unicodedata.normalize('NFC', palavra.strip().upper())
+    return ''.join(c for c in palavra if c.isalpha())
+
+
+@lru_cache(maxsize=4096)
+def _analisar_normalizada(palavra: str) -> EstruturaPalavra:
+    silabas = _separar(_unidades(palavra))
+    tonica = _silaba_tonica(silabas) if silabas else 0
+    return EstruturaPalavra(palavra, tuple(silabas), tonica, _fonemas(silabas, tonica))
+
+
+def analisar_palavra(palavra: str) -> EstruturaPalavra:
+    """
+    Retorna a estrutura silábica e fonológica de uma palavra (memorizada).
+
+    Args:
+        palavra: A palavra, com ou sem acentos
+
+    Returns:
+        EstruturaPalavra: Sílabas, índice da sílaba tônica e fonemas por sílaba
+    """
+    return _analisar_normalizada(normalizar(palavra))
+
+
+def analisar_palavras(palavras: list) -> list:
+    """
+    Analisa uma lista inteira de palavras ditadas de uma vez.
+
+    Frases são divididas em palavras; cada item da lista retornada é uma tupla
+    com as estruturas das palavras do item correspondente.
+    """
+    return [tuple(analisar_palavra(p) for p in item.split() if normalizar(p)) for item in palavras]
+
+
+def separar_silabas(palavra: str) -> tuple:
+    """Retorna as sílabas da palavra, ex.: 'CAVALO' -> ('CA', 'VA', 'LO')."""
+    return analisar_palavra(palavra).silabas
+
+
+def forma_fonetica(palavra: str) -> str:
+    """
+    Reduz a palavra à sequência de sons, sem distinguir vogais abertas e fechadas.
+    Grafias diferentes com a mesma pronúncia (CAVALO, KAVALU) têm a mesma forma.
+    """
+    estrutura = analisar_palavra(palavra)
+    sons = ''.join(f for silaba in estrutura.fonemas for f in silaba)
+    return sons.replace('ɛ', 'e').replace('ɔ', 'o').replace('ʁ', 'r').replace('ɾ', 'r')
+
+
+def descrever_ditado(texto: str) -> str:
+    """
+    Descreve a divisão silábica de uma palavra ou frase para os prompts.
+    Ex.: 'O GATO' -> 'O (1 sílaba) / GA-TO (2 sílabas)'
+    """
+    estruturas = analisar_palavras([texto])[0]
+    return ' / '.join(e.descrever() for e in estruturas)
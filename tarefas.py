@@ -0,0 +1,251 @@
+"""
+Fila local de tarefas assíncronas para a rota /analyze.
+Com ?async=1 a análise é gravada nesta fila e a requisição termina na hora;
+workers em segundo plano (threads de cada processo do gunicorn) processam
+as tarefas e o navegador consulta o andamento em /jobs/<id>.
+
+A fila fica em SQLite, sem depender de um broker externo: tarefas pendentes
+sobrevivem ao reinício dos workers, e tarefas que ficaram presas em
+processamento (worker morto no meio) voltam para a fila depois de um tempo.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+import registro
+
+logger = registro.obter_logger(__name__)
+
+# Configurações da fila
+TAREFAS_DB_PATH = os.environ.get(
+    'TAREFAS_DB',
+    os.path.join(tempfile.gettempdir(), 'sondagem_tarefas.sqlite3')
+)
+TAREFAS_WORKERS = int(os.environ.get('TAREFAS_WORKERS', '2'))
+TAREFAS_MAX_TENTATIVAS = int(os.environ.get('TAREFAS_MAX_TENTATIVAS', '3'))
+TAREFAS_TEMPO_LIMITE = int(os.environ.get('TAREFAS_TEMPO_LIMITE', '300'))
+TAREFAS_RETENCAO_SEGUNDOS = int(os.environ.get('TAREFAS_RETENCAO', str(24 * 3600)))
+
+STATUS_PENDENTE = 'pendente'
+STATUS_PROCESSANDO = 'processando'
+STATUS_CONCLUIDA = 'concluida'
+STATUS_ERRO = 'erro'
+
+_local = threading.local()
+_nova_tarefa = threading.Event()
+_workers_lock = threading.Lock()
+_workers = {"pid": None, "threads": []}
+
+
+def _conexao():
+    """Retorna a conexão SQLite da thread atual, criando a tabela se necessário."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(TAREFAS_DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tarefas (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                criada_em REAL NOT NULL,
+                atualizada_em REAL NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                dados TEXT NOT NULL,
+                imagem BLOB,
+                parcial TEXT,
+                resultado TEXT,
+                status_http INTEGER
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_status ON tarefas (status, criada_em)")
+        _local.conn = conn
+    return conn
+
+
+def criar_tarefa(dados: dict, imagem: bytes = None) -> str:
+    """
+    Enfileira uma análise.
+
+    Args:
+        dados: Campos do formulário (palavras_ditadas, transcricao_previa, ...)
+        imagem: Bytes da imagem, se houver
+
+    Returns:
+        str: Identificador da tarefa
+    """
+    tarefa_id = uuid.uuid4().hex
+    agora = time.time()
+    _conexao().execute(
+        "INSERT INTO tarefas (id, status, criada_em, atualizada_em, dados, imagem) VALUES (?, ?, ?, ?, ?, ?)",
+        (tarefa_id, STATUS_PENDENTE, agora, agora, json.dumps(dados, ensure_ascii=False), imagem)
+    )
+    _nova_tarefa.set()
+    return tarefa_id
+
+
+def consultar_tarefa(tarefa_id: str):
+    """
+    Retorna o status da tarefa com o resultado parcial ou final.
+
+    Returns:
+        dict: Dados da tarefa, ou None se ela não existir
+    """
+    linha = _conexao().execute(
+        "SELECT status, criada_em, atualizada_em, parcial, resultado, status_http FROM tarefas WHERE id = ?",
+        (tarefa_id,)
+    ).fetchone()
+    if linha is None:
+        return None
+
+    status, criada_em, atualizada_em, parcial, resultado, status_http = linha
+    return {
+        'job_id': tarefa_id,
+        'status': status,
+        'criada_em': criada_em,
+        'atualizada_em': atualizada_em,
+        'parcial': json.loads(parcial) if parcial else None,
+        'resultado': json.loads(resultado) if resultado else None,
+        'status_http': status_http,
+    }
+
+
+def _reservar_proxima():
+    """
+    Reserva atomicamente a próxima tarefa pendente (ou abandonada em processamento).
+
+    Returns:
+        tuple: (id, dados, imagem), ou None se a fila estiver vazia
+    """
+    conn = _conexao()
+    agora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        linha = conn.execute(
+            """
+            SELECT id, dados, imagem, tentativas FROM tarefas
+            WHERE status = ? OR (status = ? AND atualizada_em < ?)
+            ORDER BY criada_em LIMIT 1
+            """,
+            (STATUS_PENDENTE, STATUS_PROCESSANDO, agora - TAREFAS_TEMPO_LIMITE)
+        ).fetchone()
+        if linha is None:
+            conn.execute("COMMIT")
+            return None
+
+        tarefa_id, dados, imagem, tentativas = linha
+        if tentativas >= TAREFAS_MAX_TENTATIVAS:
+            conn.execute(
+                "UPDATE tarefas SET status = ?, atualizada_em = ?, imagem = NULL, resultado = ?, status_http = 500 WHERE id = ?",
+                (STATUS_ERRO, agora, json.dumps({'error': 'A análise falhou após várias tentativas.'}), tarefa_id)
+            )
+            conn.execute("COMMIT")
+            return _reservar_proxima()
+
+        conn.execute(
+            "UPDATE tarefas SET status = ?, atualizada_em = ?, tentativas = tentativas + 1 WHERE id = ?",
+            (STATUS_PROCESSANDO, agora, tarefa_id)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    return tarefa_id, json.loads(dados), imagem
+
+
+def _salvar_parcial(tarefa_id: str, parcial: dict):
+    _conexao().execute(
+        "UPDATE tarefas SET parcial = ?, atualizada_em = ? WHERE id = ?",
+        (json.dumps(parcial, ensure_ascii=False), time.time(), tarefa_id)
+    )
+
+
+def _finalizar(tarefa_id: str, resultado: dict, status_http: int):
+    status = STATUS_CONCLUIDA if status_http < 500 else STATUS_ERRO
+    _conexao().execute(
+        "UPDATE tarefas SET status = ?, atualizada_em = ?, imagem = NULL, resultado = ?, status_http = ? WHERE id = ?",
+        (status, time.time(), json.dumps(resultado, ensure_ascii=False), status_http, tarefa_id)
+    )
+
+
+def _limpar_antigas():
+    """Remove tarefas finalizadas há mais tempo que a retenção configurada."""
+    _conexao().execute(
+        "DELETE FROM tarefas WHERE status IN (?, ?) AND atualizada_em < ?",
+        (STATUS_CONCLUIDA, STATUS_ERRO, time.time() - TAREFAS_RETENCAO_SEGUNDOS)
+    )
+
+
+def _processar_proxima(processador) -> bool:
+    """
+    Reserva a próxima tarefa, processa e grava o resultado.
+
+    Returns:
+        bool: False se a fila estava vazia
+    """
+    reservada = _reservar_proxima()
+    if reservada is None:
+        return False
+
+    tarefa_id, dados, imagem = reservada
+    try:
+        resultado, status_http = processador(
+            dados, imagem, lambda parcial: _salvar_parcial(tarefa_id, parcial)
+        )
+    except Exception as e:
+        logger.exception("Erro ao processar a tarefa", extra={'tarefa_id': tarefa_id})
+        resultado, status_http = {'error': f'Ocorreu um erro ao processar: {str(e)}'}, 500
+
+    try:
+        _finalizar(tarefa_id, resultado, status_http)
+    except sqlite3.Error as e:
+        logger.error("Erro ao gravar o resultado da tarefa", extra={'tarefa_id': tarefa_id, 'erro': str(e)})
+    return True
+
+
+def _loop_worker(processador):
+    """Laço de cada worker: processa tarefas enquanto houver, e aguarda quando a fila esvazia."""
+    ultima_limpeza = 0.0
+    while True:
+        try:
+            if time.time() - ultima_limpeza > 600:
+                _limpar_antigas()
+                ultima_limpeza = time.time()
+
+            processou = _processar_proxima(processador)
+        except sqlite3.Error as e:
+            logger.warning("Erro ao ler a fila de tarefas", extra={'erro': str(e)})
+            time.sleep(1)
+            continue
+
+        if not processou:
+            # Aguarda uma tarefa nova deste processo, ou confere a fila a cada segundo
+            _nova_tarefa.wait(1.0)
+            _nova_tarefa.clear()
+
+
+def iniciar_workers(processador):
+    """
+    Inicia os workers em segundo plano deste processo (apenas uma vez por processo).
+
+    Args:
+        processador: Função (dados, imagem, progresso) -> (resultado, status HTTP)
+    """
+    with _workers_lock:
+        # Após um fork, as threads do processo pai não existem no filho
+        if _workers["pid"] == os.getpid():
+            return
+        _workers["pid"] = os.getpid()
+        _workers["threads"] = []
+        for i in range(TAREFAS_WORKERS):
+            thread = threading.Thread(
+                target=_loop_worker, args=(processador,), name=f"tarefas-{i}", daemon=True
+            )
+            thread.start()
+            _workers["threads"].append(thread)
+        logger.info("Workers de tarefas iniciados", extra={'workers': TAREFAS_WORKERS, 'pid': os.getpid()})
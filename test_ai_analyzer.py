@@ -0,0 +1,267 @@
+import json
+import re
+
+import pytest
+
+import ai_analyzer
+import backends
+
+LOTE = {
+    "analises_individuais": [
+        {"item": 1, "hipotese": "Silábico com valor sonoro", "justificativa": "Uma letra por sílaba."},
+        {"item": 2, "hipotese": "Alfabético", "justificativa": "Todas as letras."},
+    ],
+    "hipotese": "Silábico-Alfabético",
+    "justificativa": "A criança está em transição entre as duas hipóteses.",
+}
+
+
+def test_json_valido():
+    texto = json.dumps({"hipotese": "Alfabético", "justificativa": "Todas as letras."})
+    assert ai_analyzer._extrair_json(texto)["hipotese"] == "Alfabético"
+
+
+@pytest.mark.parametrize('texto', [
+    '```json\n{"hipotese": "Alfabético", "justificativa": "ok"}\n```',
+    'Segue a análise: {"hipotese": "Alfabético", "justificativa": "ok"} Espero ter ajudado.',
+    '{“hipotese”: “Alfabético”, “justificativa”: “ok”}',
+    '{"hipotese": "Alfabético", "justificativa": "ok",}',
+    '{"hipotese": "Alfabético", "justificativa": "linha 1\nlinha 2"}',
+])
+def test_respostas_com_defeito_sao_reparadas(texto):
+    assert ai_analyzer._extrair_json(texto)["hipotese"] == "Alfabético"
+
+
+def test_hipotese_normalizada():
+    texto = '{"hipotese": "silabico alfabetico", "justificativa": "ok"}'
+    assert ai_analyzer._extrair_json(texto)["hipotese"] == "Silábico-Alfabético"
+
+
+def test_resposta_simples_cortada():
+    texto = '{"transcricao": "CVLO", "hipotese": "Silábico-Alfabético", "justificativa": "Escreveu {CA} como C e {VA'
+    resultado = ai_analyzer._extrair_json(texto)
+    assert resultado["hipotese"] == "Silábico-Alfabético"
+    assert resultado["justificativa"] == "Escreveu {CA} como C e {VA"
+
+
+def test_lote_cortado_na_justificativa_geral():
+    texto = json.dumps(LOTE, ensure_ascii=False)
+    cortado = texto[:texto.index('transição')]
+    resultado = ai_analyzer._extrair_json(cortado)
+    assert resultado["hipotese"] == "Silábico-Alfabético"
+    assert [item["hipotese"] for item in resultado["analises_individuais"]] == [
+        "Silábico com valor sonoro", "Alfabético"
+    ]
+
+
+def test_lote_cortado_depois_da_hipotese_geral():
+    texto = json.dumps(LOTE, ensure_ascii=False)
+    cortado = texto[:texto.rindex('"justificativa"')]
+    resultado = ai_analyzer._extrair_json(cortado)
+    assert resultado["hipotese"] == "Silábico-Alfabético"
+    assert len(resultado["analises_individuais"]) == 2
+
+
+def test_lote_cortado_antes_da_hipotese_geral_falha():
+    texto = json.dumps(LOTE, ensure_ascii=False)
+    cortado = texto[:texto.index('{"item": 2')]
+    with pytest.raises(ValueError):
+        ai_analyzer._extrair_json(cortado)
+
+
+def test_resposta_ilegivel():
+    with pytest.raises(ValueError):
+        ai_analyzer._extrair_json('Não consegui ler a imagem.')
+
+
+class BackendFalso(backends.Backend):
+    """Backend principal de teste: classifica tudo com a mesma hipótese e guarda os pedidos."""
+
+    nome = 'falso'
+    modelo_texto = 'falso-1'
+
+    def __init__(self, hipotese='Silábico-Alfabético'):
+        super().__init__()
+        self.hipotese = hipotese
+        self.falhar = False
+        self.resposta = None
+        self.pedidos = []
+        self.esquemas = []
+
+    def gerar(self, instrucoes, conteudo, esquema=None):
+        self.pedidos.append(conteudo)
+        self.esquemas.append(esquema)
+        if self.falhar:
+            raise ValueError("backend fora do ar")
+        if self.resposta is not None:
+            return backends.RespostaBackend(texto=self.resposta, modelo=self.modelo_texto)
+        itens = re.findall(r'^(\d+)\. Palavra ditada', conteudo, re.MULTILINE)
+        resultado = {"hipotese": self.hipotese, "justificativa": "falso"}
+        if itens:
+            resultado["analises_individuais"] = [
+                {"item": int(item), "hipotese": self.hipotese, "justificativa": "falso"} for item in itens
+            ]
+        return backends.RespostaBackend(texto=json.dumps(resultado), modelo=self.modelo_texto)
+
+
+@pytest.fixture
+def falso(monkeypatch, cache_temporario):
+    backend = BackendFalso()
+    monkeypatch.setattr(backends, '_backends', {})
+    monkeypatch.setattr(backends, 'ANALISE_BACKENDS', ['falso', 'local'])
+    monkeypatch.setattr(backends, 'ROTEADOR_EXPLORACAO', 0)
+    backends.registrar(backend)
+    backends.registrar(backends.BackendLocal(ai_analyzer.HIPOTESES))
+    return backend
+
+
+def test_classificacao_vai_para_o_cache(falso):
+    primeira = ai_analyzer.analisar_escrita('BOLA', 'BOA')
+    segunda = ai_analyzer.analisar_escrita('BOLA', 'BOA')
+    assert primeira["hipotese"] == segunda["hipotese"] == 'Silábico-Alfabético'
+    assert len(falso.pedidos) == 1
+
+
+def test_resposta_do_backend_de_reserva_nao_vai_para_o_cache(falso):
+    falso.falhar = True
+    assert ai_analyzer.analisar_escrita('BOLA', 'BOA')["justificativa"] != 'falso'
+
+    falso.falhar = False
+    assert ai_analyzer.analisar_escrita('BOLA', 'BOA')["justificativa"] == 'falso'
+    assert len(falso.pedidos) == 2
+
+
+def test_cache_separado_por_modelo(falso, monkeypatch):
+    ai_analyzer.analisar_escrita('BOLA', 'BOA')
+    monkeypatch.setattr(falso, 'modelo_texto', 'falso-2')
+    ai_analyzer.analisar_escrita('BOLA', 'BOA')
+    assert len(falso.pedidos) == 2
+
+
+def test_lote_envia_ao_modelo_so_o_que_a_triagem_e_o_cache_nao_resolvem(falso):
+    ai_analyzer.analisar_escrita('GATO', 'GTO')
+    concluidas = []
+
+    resultado = ai_analyzer.analisar_multiplas_palavras_em_lote(
+        ['CAVALO', 'BOLA', 'SAPO', 'GATO'], ['CVLO', 'BOLA', '', 'GTO'],
+        ao_concluir=lambda indice, analise: concluidas.append(indice),
+    )
+
+    assert len(falso.pedidos) == 2
+    assert 'CAVALO' in falso.pedidos[1] and 'GATO' not in falso.pedidos[1]
+    assert [a["hipotese"] for a in resultado["analises_individuais"]] == [
+        'Silábico-Alfabético', 'Alfabético', 'Pré-Silábico', 'Silábico-Alfabético'
+    ]
+    assert resultado["hipotese"] == 'Silábico-Alfabético'
+    assert sorted(concluidas) == [0, 1, 2, 3]
+
+    # Na segunda vez, tudo vem da triagem e do cache
+    ai_analyzer.analisar_multiplas_palavras_em_lote(['CAVALO', 'BOLA', 'SAPO', 'GATO'], ['CVLO', 'BOLA', '', 'GTO'])
+    assert len(falso.pedidos) == 2
+
+
+def test_resposta_reparada_sem_justificativa_mantem_a_hipotese(falso):
+    falso.resposta = '{"hipotese": "Silábico-Alfabético", "justif'
+    analise = ai_analyzer._analisar_par('BOLA', 'BOA')
+    assert analise["hipotese"] == 'Silábico-Alfabético'
+    assert analise["justificativa"] == ''
+
+
+def test_cada_chamada_pede_a_resposta_no_seu_esquema(falso):
+    ai_analyzer.analisar_escrita('CAVALO', 'CVLO')
+    ai_analyzer.analisar_multiplas_palavras_em_lote(['SAPATO', 'BOLA'], ['SPT', 'BOA'])
+    assert falso.esquemas == [ai_analyzer.ESQUEMA_CLASSIFICACAO, ai_analyzer.ESQUEMA_LOTE]
+    assert ai_analyzer.ESQUEMA_CLASSIFICACAO["properties"]["hipotese"]["enum"] == ai_analyzer.HIPOTESES
+
+
+def test_falha_de_leitura_contada(falso, monkeypatch):
+    monkeypatch.setattr(ai_analyzer, '_estatisticas_respostas', {"json_valido": 0, "json_reparado": 0, "falhas": 0})
+    falso.resposta = 'Não sei classificar.'
+    ai_analyzer._analisar_par('BOLA', 'BOA')
+    falso.resposta = '```json\n{"hipotese": "Alfabético", "justificativa": "ok"}\n```'
+    ai_analyzer._analisar_par('CAVALO', 'CVLO')
+
+    estatisticas = ai_analyzer.estatisticas_respostas()
+    assert estatisticas["falhas"] == 1
+    assert estatisticas["json_reparado"] == 1
+    assert estatisticas["taxa_falha"] == 0.5
+
+
+class ModeloFalso:
+    """GenerativeModel de teste: conta as criações e os aquecimentos."""
+
+    criados = []
+
+    def __init__(self, nome, system_instruction=None):
+        self.model_name = nome
+        self.system_instruction = system_instruction
+        self.aquecimentos = 0
+        ModeloFalso.criados.append(self)
+
+    def count_tokens(self, texto):
+        self.aquecimentos += 1
+
+    def generate_content(self, conteudo, **kwargs):
+        self.kwargs = kwargs
+        return type('Resposta', (), {'text': '{}', 'usage_metadata': None})()
+
+
+@pytest.fixture
+def registro_de_modelos(monkeypatch):
+    ModeloFalso.criados = []
+    monkeypatch.setattr(ai_analyzer.genai, 'GenerativeModel', ModeloFalso)
+    monkeypatch.setattr(ai_analyzer, 'GEMINI_CONTEXTO_CACHE', False)
+    monkeypatch.setattr(ai_analyzer, '_modelos', {})
+    monkeypatch.setattr(ai_analyzer, '_modelos_pid', {"pid": None})
+    return ModeloFalso.criados
+
+
+def test_modelo_criado_uma_vez_por_processo(registro_de_modelos):
+    modelo = ai_analyzer.obter_modelo('gemini-teste', 'instrucoes')
+    assert ai_analyzer.obter_modelo('gemini-teste', 'instrucoes') is modelo
+    assert ai_analyzer.obter_modelo('gemini-teste', 'outras') is not modelo
+    assert len(registro_de_modelos) == 2
+
+
+def test_modelo_recriado_apos_o_fork(registro_de_modelos, monkeypatch):
+    modelo = ai_analyzer.obter_modelo('gemini-teste', 'instrucoes')
+    pid_filho = ai_analyzer.os.getpid() + 1
+    monkeypatch.setattr(ai_analyzer.os, 'getpid', lambda: pid_filho)
+    assert ai_analyzer.obter_modelo('gemini-teste', 'instrucoes') is not modelo
+    assert len(registro_de_modelos) == 2
+
+
+def test_iniciar_modelos_aquece_cada_modelo(registro_de_modelos, monkeypatch):
+    monkeypatch.setattr(ai_analyzer, 'GEMINI_DISPONIVEL', True)
+    ai_analyzer.iniciar_modelos(aquecer=True)
+    criados = list(registro_de_modelos)
+    assert criados and all(modelo.aquecimentos == 1 for modelo in criados)
+
+    # Os pedidos seguintes usam os modelos já criados no post_fork
+    ai_analyzer.obter_modelo(ai_analyzer.MODELO_GEMINI_TEXTO, ai_analyzer.SYSTEM_PROMPT)
+    assert registro_de_modelos == criados
+
+
+def test_iniciar_modelos_sem_aquecer(registro_de_modelos, monkeypatch):
+    monkeypatch.setattr(ai_analyzer, 'GEMINI_DISPONIVEL', True)
+    ai_analyzer.iniciar_modelos(aquecer=False)
+    assert registro_de_modelos and all(modelo.aquecimentos == 0 for modelo in registro_de_modelos)
+
+
+@pytest.mark.parametrize('estruturada', [True, False])
+def test_gemini_recebe_o_esquema_da_resposta(registro_de_modelos, monkeypatch, estruturada):
+    monkeypatch.setattr(backends.limitador, 'adquirir', lambda tokens: None)
+    monkeypatch.setattr(backends.limitador, 'acertar', lambda estimados, usados: None)
+    gemini = backends.BackendGemini(
+        obter_modelo=ai_analyzer.obter_modelo, modelo_texto='gemini-teste', modelo_visao='gemini-teste',
+        chamadas_simultaneas=ai_analyzer._chamadas_gemini, tempo_limite=5, saida_estruturada=estruturada,
+        configurado=lambda: True,
+    )
+    gemini.gerar('instrucoes', 'tarefa', ai_analyzer.ESQUEMA_CLASSIFICACAO)
+
+    configuracao = registro_de_modelos[0].kwargs.get('generation_config')
+    if estruturada:
+        assert configuracao.response_mime_type == 'application/json'
+        assert configuracao.response_schema == ai_analyzer.ESQUEMA_CLASSIFICACAO
+    else:
+        assert configuracao is None
@@ -0,0 +1,102 @@
+import io
+import zipfile
+
+import pytest
+
+import analise_turma
+
+
+def zip_da_turma(arquivos: dict) -> io.BytesIO:
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, 'w') as arquivo_zip:
+        for nome, conteudo in arquivos.items():
+            arquivo_zip.writestr(nome, conteudo)
+    saida.seek(0)
+    return saida
+
+
+def processador_falso(palavras_ditadas, imagem_bytes, aluno):
+    return {'transcricao': imagem_bytes.decode(), 'palavras': palavras_ditadas}, 200
+
+
+def test_ler_manifesto_com_ponto_e_virgula_e_acentos():
+    manifesto = analise_turma.ler_manifesto(
+        'Criança;Foto;Palavras ditadas\nAna;ana.jpg;"CAVALO, BOLA"\n;;\nBeto;beto.jpg;PATO\n'.encode('utf-8-sig')
+    )
+    assert manifesto == [
+        {'aluno': 'Ana', 'arquivo': 'ana.jpg', 'palavras_ditadas': 'CAVALO, BOLA'},
+        {'aluno': 'Beto', 'arquivo': 'beto.jpg', 'palavras_ditadas': 'PATO'},
+    ]
+
+
+def test_ler_manifesto_com_virgula():
+    manifesto = analise_turma.ler_manifesto(b'arquivo,palavras\nana.jpg,"CAVALO, BOLA"\n')
+    assert manifesto == [{'arquivo': 'ana.jpg', 'palavras_ditadas': 'CAVALO, BOLA', 'aluno': ''}]
+
+
+def test_manifesto_sem_as_colunas_necessarias():
+    with pytest.raises(ValueError, match='palavras_ditadas'):
+        analise_turma.ler_manifesto(b'aluno;arquivo\nAna;ana.jpg\n')
+
+
+def test_arquivo_do_manifesto_ausente_no_zip_vira_linha_de_erro():
+    itens = analise_turma.itens_do_zip(zip_da_turma({
+        'turma/manifesto.csv': 'aluno;arquivo;palavras_ditadas\nAna;ana.jpg;CAVALO\nBeto;beto.jpg;BOLA\nCaio;caio.jpg;PATO\n',
+        'turma/ana.jpg': 'foto da Ana',
+        'turma/caio.jpg': 'foto do Caio',
+    }))
+    linhas = list(analise_turma.processar_turma(itens, processador_falso, workers=2))
+
+    resumo = linhas.pop()
+    por_aluno = {linha['aluno']: linha for linha in linhas}
+    assert por_aluno['Ana']['status'] == 'ok'
+    assert por_aluno['Ana']['resultado']['transcricao'] == 'foto da Ana'
+    assert por_aluno['Caio']['status'] == 'ok'
+    assert por_aluno['Beto']['status'] == 'erro'
+    assert por_aluno['Beto']['error'] == "Arquivo 'beto.jpg' citado no manifesto não foi enviado"
+    assert resumo['resumo']['total'] == 3
+    assert resumo['resumo']['concluidas'] == 2
+    assert resumo['resumo']['erros'] == 1
+
+
+def test_zip_sem_manifesto_usa_o_nome_do_arquivo_e_as_palavras_padrao():
+    itens = analise_turma.itens_do_zip(zip_da_turma({
+        'Beto.png': 'b', 'Ana.jpg': 'a', '__MACOSX/._Ana.jpg': 'x', 'leia-me.txt': 'x',
+    }), 'CAVALO, BOLA')
+    assert [(item.aluno, item.palavras_ditadas) for item in itens] == [
+        ('Ana', 'CAVALO, BOLA'), ('Beto', 'CAVALO, BOLA')
+    ]
+
+
+def test_zip_sem_manifesto_e_sem_palavras():
+    with pytest.raises(ValueError, match='manifesto'):
+        analise_turma.itens_do_zip(zip_da_turma({'ana.jpg': 'a'}))
+
+
+def test_zip_invalido():
+    with pytest.raises(ValueError, match='ZIP'):
+        analise_turma.itens_do_zip(io.BytesIO(b'nao e zip'))
+
+
+def test_limite_de_alunos(monkeypatch):
+    monkeypatch.setattr(analise_turma, 'TURMA_MAX_ALUNOS', 1)
+    with pytest.raises(ValueError, match='limite'):
+        analise_turma.itens_do_zip(zip_da_turma({'ana.jpg': 'a', 'beto.jpg': 'b'}), 'CAVALO')
+
+
+def test_foto_grande_demais_so_afeta_o_aluno():
+    itens = analise_turma.itens_do_zip(zip_da_turma({'ana.jpg': 'a', 'beto.jpg': 'b' * 100}), 'CAVALO', 10)
+    linhas = {linha.get('aluno'): linha for linha in analise_turma.processar_turma(itens, processador_falso)}
+    assert linhas['ana']['status'] == 'ok'
+    assert linhas['beto']['status'] == 'erro'
+    assert 'grande demais' in linhas['beto']['error']
+
+
+def test_resposta_com_erro_http_conta_como_erro():
+    itens = analise_turma.itens_dos_arquivos([('ana.jpg', io.BytesIO(b'a'))], palavras_padrao='CAVALO')
+    linhas = list(analise_turma.processar_turma(
+        itens, lambda palavras, imagem, aluno: ({'error': 'Não é imagem'}, 415)
+    ))
+    assert linhas[0]['status'] == 'erro'
+    assert linhas[0]['status_http'] == 415
+    assert linhas[-1]['resumo']['erros'] == 1
@@ -0,0 +1,359 @@
+import io
+import json
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import app as servidor
+import armazenamento
+import dedup_imagens
+import relatorios
+import tarefas
+
+
+def foto(cor=200, formato='PNG'):
+    saida = io.BytesIO()
+    Image.new('RGB', (64, 48), (cor, cor, cor)).save(saida, formato)
+    return saida.getvalue()
+
+
+@pytest.fixture
+def leituras(monkeypatch):
+    """Gemini Vision falso: transcreve cada palavra ditada tirando a última letra."""
+    chamadas = []
+
+    def ler(palavras_ditadas, imagem_bytes):
+        chamadas.append(palavras_ditadas)
+        escritas = [palavra[:-1] for palavra in servidor._separar_itens(palavras_ditadas)]
+        return {'transcricao': ', '.join(escritas), 'hipotese': 'Silábico-Alfabético', 'justificativa': 'lida'}
+
+    monkeypatch.setattr(servidor, 'analisar_escrita_com_imagem', ler)
+    return chamadas
+
+
+@pytest.fixture
+def cliente(cache_temporario, leituras, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_HABILITADO', False)
+    monkeypatch.setattr(dedup_imagens, 'DEDUP_HABILITADO', True)
+    monkeypatch.setattr(servidor, 'analisar_escrita', lambda palavra, escrita: {
+        'hipotese': 'Silábico com valor sonoro', 'justificativa': f'{palavra}: {escrita}'
+    })
+
+    def analisar_varias(palavras, escritas, ao_concluir=None):
+        analises = []
+        for indice, (palavra, escrita) in enumerate(zip(palavras, escritas)):
+            analises.append({'palavra': palavra, 'escrita': escrita, 'hipotese': 'Silábico com valor sonoro'})
+            ao_concluir(indice, analises[-1])
+        return {'hipotese': 'Silábico com valor sonoro', 'justificativa': 'geral', 'analises_individuais': analises}
+
+    monkeypatch.setattr(servidor, 'analisar_multiplas_palavras', analisar_varias)
+    monkeypatch.setattr(servidor, 'analisar_multiplas_palavras_em_lote', analisar_varias)
+    servidor.app.config['TESTING'] = True
+    return servidor.app.test_client()
+
+
+@pytest.fixture
+def banco(cliente, tmp_path, monkeypatch):
+    """Armazenamento num banco temporário, gravado pelo teste (gravar_fila) em vez da thread."""
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_HABILITADO', True)
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_DB_PATH', str(tmp_path / 'resultados.sqlite3'))
+    monkeypatch.setattr(armazenamento, '_local', threading.local())
+    monkeypatch.setattr(armazenamento, '_fila', queue.Queue())
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_CORRECAO_ESPERA', 0.2)
+    monkeypatch.setattr(armazenamento, '_iniciar_gravador', lambda: None)
+    yield armazenamento
+    armazenamento._local.conn.close()
+
+
+@pytest.fixture
+def fila_tarefas(tmp_path, monkeypatch):
+    """Fila de tarefas temporária; o teste processa as tarefas no lugar dos workers em segundo plano."""
+    processadores = []
+    monkeypatch.setattr(tarefas, 'TAREFAS_DB_PATH', str(tmp_path / 'tarefas.sqlite3'))
+    monkeypatch.setattr(tarefas, '_local', threading.local())
+    monkeypatch.setattr(tarefas, 'iniciar_workers', processadores.append)
+    yield processadores
+    tarefas._local.conn.close()
+
+
+def gravar_fila():
+    itens = []
+    while not armazenamento._fila.empty():
+        itens.append(armazenamento._fila.get_nowait())
+    armazenamento._gravar(itens)
+
+
+def analisar(cliente, palavras, imagem=None, query_string=None, **campos):
+    dados = dict(campos, palavras_ditadas=palavras, file=(io.BytesIO(imagem or foto()), 'foto.png'))
+    return cliente.post('/analyze', data=dados, content_type='multipart/form-data', query_string=query_string)
+
+
+def test_reenvio_com_palavras_corrigidas_reaproveita_a_transcricao(cliente, leituras):
+    primeira = analisar(cliente, 'CAVALLO, BOLA')
+    assert primeira.status_code == 200
+    assert primeira.get_json()['modo'] == 'gemini_vision'
+
+    segunda = analisar(cliente, 'CAVALO, BOLA')
+    assert segunda.status_code == 200
+    assert segunda.get_json()['modo'] == 'imagem_repetida'
+    assert segunda.get_json()['transcricao'] == 'CAVALL, BOL'
+    assert leituras == ['CAVALLO, BOLA']
+
+
+def test_reenvio_com_outro_numero_de_palavras_le_a_foto_de_novo(cliente, leituras):
+    analisar(cliente, 'CAVALO, BOLA')
+    resposta = analisar(cliente, 'CAVALO, BOLA, PATO')
+    assert resposta.get_json()['modo'] == 'gemini_vision'
+    assert len(leituras) == 2
+
+
+def test_serie_enviada_pelo_formulario(cliente, banco):
+    resposta = analisar(cliente, 'CAVALO', escola='EM Centro', serie='1º ano', turma='1B', aluno='Ana', rodada='1')
+    gravar_fila()
+    assert banco.obter(resposta.get_json()['sondagem_id'])['serie'] == '1º ano'
+
+    stats = cliente.get('/stats', query_string={'serie': '1º ano'}).get_json()
+    assert stats['serie'] == '1º ano'
+    assert stats['rodadas'][0]['total'] == 1
+
+
+def test_analise_assincrona_responde_202_e_o_resultado_sai_em_jobs(cliente, fila_tarefas):
+    resposta = analisar(cliente, 'CAVALO, BOLA', query_string={'async': '1'})
+    assert resposta.status_code == 202
+    tarefa = resposta.get_json()
+    assert tarefa['status'] == 'pendente'
+    assert tarefa['url'] == f"/jobs/{tarefa['job_id']}"
+
+    assert cliente.get(tarefa['url']).get_json()['status'] == 'pendente'
+
+    assert tarefas._processar_proxima(fila_tarefas[0])
+    consulta = cliente.get(tarefa['url'])
+    assert consulta.status_code == 200
+    concluida = consulta.get_json()
+    assert concluida['status'] == 'concluida'
+    assert concluida['status_http'] == 200
+    assert concluida['resultado']['transcricao'] == 'CAVAL, BOL'
+    assert concluida['parcial']['transcricao'] == 'CAVAL, BOL'
+
+
+def test_tarefa_inexistente(cliente, fila_tarefas):
+    resposta = cliente.get('/jobs/nao-existe')
+    assert resposta.status_code == 404
+
+
+def linhas_ndjson(resposta):
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+def test_turma_em_ndjson_com_resumo_no_final(cliente):
+    manifesto = 'aluno;arquivo;palavras_ditadas\nAna;ana.png;CAVALO, BOLA\nBeto;beto.png;PATO\nCaio;caio.png;SOL\n'
+    resposta = cliente.post('/analyze/batch', content_type='multipart/form-data', data={
+        'files': [(io.BytesIO(foto(100)), 'ana.png'), (io.BytesIO(b'nao e imagem'), 'beto.png')],
+        'manifesto': (io.BytesIO(manifesto.encode()), 'manifesto.csv'),
+        'escola': 'EM Centro',
+    })
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/x-ndjson'
+
+    linhas = linhas_ndjson(resposta)
+    assert linhas[-1]['resumo']['total'] == 3
+    assert linhas[-1]['resumo']['concluidas'] == 1
+    assert linhas[-1]['resumo']['erros'] == 2
+
+    por_aluno = {linha['aluno']: linha for linha in linhas[:-1]}
+    assert por_aluno['Ana']['status'] == 'ok'
+    assert por_aluno['Ana']['resultado']['transcricao'] == 'CAVAL, BOL'
+    assert por_aluno['Beto']['status_http'] == 415
+    assert 'não foi enviado' in por_aluno['Caio']['error']
+
+
+def test_turma_sem_fotos(cliente):
+    resposta = cliente.post('/analyze/batch', data={'palavras_ditadas': 'CAVALO'}, content_type='multipart/form-data')
+    assert resposta.status_code == 400
+
+
+def eventos_sse(resposta):
+    """Separa o corpo SSE em (evento, dados), conferindo o formato de cada bloco."""
+    eventos = []
+    for bloco in resposta.get_data(as_text=True).split('\n\n'):
+        if not bloco:
+            continue
+        linha_evento, linha_dados = bloco.split('\n')
+        assert linha_evento.startswith('event: ') and linha_dados.startswith('data: ')
+        eventos.append((linha_evento[len('event: '):], json.loads(linha_dados[len('data: '):])))
+    return eventos
+
+
+def test_stream_envia_transcricao_palavras_e_sintese(cliente):
+    resposta = cliente.post('/analyze/stream', content_type='multipart/form-data', data={
+        'palavras_ditadas': 'CAVALO, BOLA', 'transcricao_previa': 'CVL, BOA',
+    })
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'text/event-stream'
+    assert resposta.headers['Cache-Control'] == 'no-cache'
+    assert resposta.get_data(as_text=True).endswith('\n\n')
+
+    eventos = eventos_sse(resposta)
+    assert [nome for nome, _ in eventos] == ['transcricao', 'palavra', 'palavra', 'sintese']
+    assert eventos[0][1] == {'transcricao': 'CVL, BOA'}
+    assert [dados['indice'] for _, dados in eventos[1:3]] == [0, 1]
+    assert eventos[1][1]['total'] == 2
+    assert eventos[1][1]['analise']['escrita'] == 'CVL'
+    sintese = eventos[-1][1]
+    assert sintese['status_http'] == 200
+    assert sintese['hipotese'] == 'Silábico com valor sonoro'
+    assert len(sintese['analises_individuais']) == 2
+
+
+def test_stream_com_foto_lida_de_uma_vez(cliente):
+    resposta = cliente.post('/analyze/stream', content_type='multipart/form-data', data={
+        'palavras_ditadas': 'CAVALO, BOLA', 'file': (io.BytesIO(foto()), 'foto.png'),
+    })
+    eventos = eventos_sse(resposta)
+    assert [nome for nome, _ in eventos] == ['transcricao', 'sintese']
+    assert eventos[0][1] == {'transcricao': 'CAVAL, BOL'}
+    assert eventos[1][1]['modo'] == 'gemini_vision'
+
+
+def test_stream_termina_com_evento_de_erro(cliente, monkeypatch):
+    def falhar(palavras, escritas, ao_concluir=None):
+        raise RuntimeError('Gemini fora do ar')
+
+    monkeypatch.setattr(servidor, 'analisar_multiplas_palavras', falhar)
+    monkeypatch.setattr(servidor, 'analisar_multiplas_palavras_em_lote', falhar)
+    resposta = cliente.post('/analyze/stream', content_type='multipart/form-data', data={
+        'palavras_ditadas': 'CAVALO, BOLA', 'transcricao_previa': 'CAVL, BOL',
+    })
+    eventos = eventos_sse(resposta)
+    assert [nome for nome, _ in eventos] == ['transcricao', 'erro']
+    assert eventos[-1][1]['status_http'] == 500
+
+
+def test_stream_com_formulario_invalido_responde_json(cliente):
+    resposta = cliente.post('/analyze/stream', data={'transcricao_previa': 'CAVL'}, content_type='multipart/form-data')
+    assert resposta.status_code == 400
+    assert resposta.is_json
+
+
+def sondagem_da_turma(cliente, aluno, cor, turma='1A'):
+    resposta = analisar(cliente, 'CAVALO, BOLA', foto(cor), escola='EM Centro', serie='1º ano', turma=turma,
+                        aluno=aluno, rodada='1')
+    return resposta.get_json()['sondagem_id']
+
+
+def test_professor_corrige_a_hipotese(cliente, banco):
+    sondagem_id = sondagem_da_turma(cliente, 'Ana', 100)
+    gravar_fila()
+
+    resposta = cliente.post(f'/sondagens/{sondagem_id}/hipotese', json={'hipotese': 'Alfabético'})
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {'status': 'ok', 'sondagem_id': sondagem_id, 'hipotese': 'Alfabético'}
+
+    stats = cliente.get('/stats', query_string={'escola': 'EM Centro', 'turma': '1A'}).get_json()
+    assert stats['rodadas'][0]['hipoteses'] == {'Alfabético': {'quantidade': 1, 'percentual': 100.0}}
+
+
+def test_correcao_invalida_ou_de_sondagem_inexistente(cliente, banco):
+    sondagem_id = sondagem_da_turma(cliente, 'Ana', 100)
+    gravar_fila()
+
+    invalida = cliente.post(f'/sondagens/{sondagem_id}/hipotese', json={'hipotese': 'Silábica'})
+    assert invalida.status_code == 400
+    assert invalida.get_json()['hipoteses_validas'][0] == 'Pré-Silábico'
+    assert cliente.post('/sondagens/nao-existe/hipotese', json={'hipotese': 'Alfabético'}).status_code == 404
+
+
+def test_stats_da_escola_por_turma(cliente, banco):
+    sondagem_da_turma(cliente, 'Ana', 100, turma='1A')
+    sondagem_da_turma(cliente, 'Beto', 150, turma='1B')
+    gravar_fila()
+
+    stats = cliente.get('/stats', query_string={'escola': 'EM Centro'}).get_json()
+    assert stats['rodadas'][0]['total'] == 2
+    assert sorted(stats['turmas']) == ['1A', '1B']
+    assert cliente.get('/stats', query_string={'turma': '1A'}).status_code == 400
+
+
+@pytest.fixture
+def pool_na_thread(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(relatorios, '_obter_pool', lambda: executor)
+    yield
+    executor.shutdown()
+
+
+def test_relatorios_em_zip_com_um_pdf_por_aluno(cliente, banco, pool_na_thread):
+    sondagem_da_turma(cliente, 'Beto', 150)
+    sondagem_da_turma(cliente, 'Ana', 100)
+    gravar_fila()
+
+    resposta = cliente.get('/relatorios', query_string={'escola': 'EM Centro', 'turma': '1A'})
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/zip'
+    assert 'sondagem EM Centro 1A.zip' in resposta.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(resposta.get_data())) as arquivo_zip:
+        assert arquivo_zip.namelist() == ['01 - Ana.pdf', '02 - Beto.pdf']
+        assert all(arquivo_zip.read(nome).startswith(b'%PDF') for nome in arquivo_zip.namelist())
+
+
+def test_relatorios_em_caderno(cliente, banco, pool_na_thread):
+    sondagem_da_turma(cliente, 'Ana', 100)
+    gravar_fila()
+
+    resposta = cliente.get('/relatorios', query_string={'escola': 'EM Centro', 'turma': '1A', 'formato': 'caderno'})
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/pdf'
+    assert resposta.get_data().startswith(b'%PDF')
+
+
+def test_relatorios_pedidos_invalidos(cliente, banco):
+    assert cliente.get('/relatorios', query_string={'escola': 'EM Centro'}).status_code == 400
+    assert cliente.get('/relatorios', query_string={'turma': '1A', 'formato': 'docx'}).status_code == 400
+    assert cliente.get('/relatorios', query_string={'escola': 'EM Centro', 'turma': '9Z'}).status_code == 404
+
+
+def test_limites_de_upload(cliente):
+    resposta = cliente.get('/limites')
+    assert resposta.status_code == 200
+    assert resposta.headers['Cache-Control'] == 'public, max-age=300'
+    limites = resposta.get_json()
+    assert limites['upload_max_bytes'] == servidor.UPLOAD_MAX_BYTES
+    assert limites['turma_upload_max_bytes'] == servidor.TURMA_UPLOAD_MAX_BYTES
+    assert 'image/jpeg' in limites['tipos_imagem'] and 'image/webp' in limites['tipos_imagem']
+    assert limites['imagem']['aresta_maxima'] > 0
+
+
+def test_upload_grande_demais(cliente, monkeypatch, leituras):
+    monkeypatch.setitem(servidor.app.config, 'MAX_CONTENT_LENGTH', 2048)
+    resposta = analisar(cliente, 'CAVALO', foto() + b'\0' * 4096)
+    assert resposta.status_code == 413
+    assert 'grande demais' in resposta.get_json()['error']
+    assert leituras == []
+
+
+def test_turma_grande_demais(cliente, monkeypatch):
+    monkeypatch.setattr(servidor, 'TURMA_UPLOAD_MAX_BYTES', 2048)
+    resposta = cliente.post('/analyze/batch', content_type='multipart/form-data', data={
+        'palavras_ditadas': 'CAVALO', 'files': [(io.BytesIO(foto() + b'\0' * 4096), 'ana.png')],
+    })
+    assert resposta.status_code == 413
+
+
+def test_arquivo_declarado_como_outro_tipo(cliente, leituras):
+    resposta = cliente.post('/analyze', content_type='multipart/form-data', data={
+        'palavras_ditadas': 'CAVALO', 'file': (io.BytesIO(b'%PDF-1.4'), 'sondagem.pdf', 'application/pdf'),
+    })
+    assert resposta.status_code == 415
+    assert resposta.is_json
+    assert leituras == []
+
+
+def test_arquivo_com_extensao_de_imagem_mas_outro_conteudo(cliente, leituras):
+    resposta = analisar(cliente, 'CAVALO', b'%PDF-1.4 nao e imagem')
+    assert resposta.status_code == 415
+    assert 'JPEG, PNG' in resposta.get_json()['error']
+    assert leituras == []
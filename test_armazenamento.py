@@ -0,0 +1,217 @@
+import queue
+import threading
+
+import pytest
+
+import armazenamento
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Armazenamento num banco temporário; a fila é gravada pelo teste (gravar_fila), sem a thread."""
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_HABILITADO', True)
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_DB_PATH', str(tmp_path / 'resultados.sqlite3'))
+    monkeypatch.setattr(armazenamento, '_local', threading.local())
+    monkeypatch.setattr(armazenamento, '_fila', queue.Queue())
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO_CORRECAO_ESPERA', 0.2)
+    monkeypatch.setattr(armazenamento, '_iniciar_gravador', lambda: None)
+    # Relógio que sempre avança: cada sondagem registrada é mais recente que a anterior
+    instantes = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(armazenamento.time, 'time', lambda: float(next(instantes)))
+    yield armazenamento
+    armazenamento._local.conn.close()
+
+
+def gravar_fila():
+    itens = []
+    while not armazenamento._fila.empty():
+        itens.append(armazenamento._fila.get_nowait())
+    armazenamento._gravar(itens)
+
+
+def registrar(aluno='Ana', hipotese='Silábico com valor sonoro', turma='1A', rodada=1, **identificacao):
+    return armazenamento.registrar(
+        dict(identificacao, escola='EM Centro', turma=turma, rodada=rodada, aluno=aluno, data='2026-03-10'),
+        ['CAVALO', 'BOLA'],
+        {'transcricao': 'AAO, BA', 'hipotese': hipotese, 'justificativa': 'ok', 'modo': 'gemini_vision'},
+    )
+
+
+def test_registrar_e_obter(banco):
+    sondagem_id = registrar()
+    assert banco.obter(sondagem_id) is None
+    assert banco.estatisticas()["pendentes"] == 1
+
+    gravar_fila()
+    sondagem = banco.obter(sondagem_id)
+    assert sondagem["aluno"] == 'Ana'
+    assert sondagem["palavras_ditadas"] == ['CAVALO', 'BOLA']
+    assert sondagem["rodada"] == 1
+    assert banco.estatisticas()["pendentes"] == 0
+
+
+def test_corrigir_sondagem_gravada(banco):
+    sondagem_id = registrar()
+    gravar_fila()
+    assert banco.corrigir_hipotese(sondagem_id, 'Silábico-Alfabético')
+    sondagem = banco.obter(sondagem_id)
+    assert sondagem["hipotese_professor"] == 'Silábico-Alfabético'
+    assert sondagem["corrigido_em"] is not None
+
+
+def test_corrigir_sondagem_ainda_na_fila(banco, monkeypatch):
+    monkeypatch.setattr(banco, 'ARMAZENAMENTO_CORRECAO_ESPERA', 5)
+    sondagem_id = registrar()
+    # O lote é gravado por outra thread (ou outro worker) enquanto a correção espera
+    gravador = threading.Timer(0.1, gravar_fila)
+    gravador.start()
+    assert banco.corrigir_hipotese(sondagem_id, 'Alfabético')
+    gravador.join()
+    assert banco.obter(sondagem_id)["hipotese_professor"] == 'Alfabético'
+
+
+def test_corrigir_sondagem_inexistente(banco):
+    assert not banco.corrigir_hipotese('nao-existe', 'Alfabético')
+
+
+def test_listar(banco):
+    registrar(aluno='Ana')
+    registrar(aluno='Bruno', turma='1B')
+    gravar_fila()
+    assert [s["aluno"] for s in banco.listar(escola='EM Centro', turma='1A')] == ['Ana']
+    assert len(banco.listar(escola='EM Centro')) == 2
+
+
+def contagem(**filtros):
+    """Hipóteses por rodada na distribuição: {rodada: {hipotese: quantidade}}."""
+    return {
+        rodada['rodada']: {h: dados['quantidade'] for h, dados in rodada['hipoteses'].items()}
+        for rodada in armazenamento.distribuicao(**filtros)['rodadas']
+    }
+
+
+def test_distribuicao_por_rodada(banco):
+    registrar(aluno='Ana', hipotese='Pré-Silábico', rodada=1)
+    registrar(aluno='Bruno', hipotese='Alfabético', rodada=1)
+    registrar(aluno='Ana', hipotese='Silábico com valor sonoro', rodada=2)
+    gravar_fila()
+    assert contagem(escola='EM Centro', turma='1A') == {
+        1: {'Pré-Silábico': 1, 'Alfabético': 1},
+        2: {'Silábico com valor sonoro': 1},
+    }
+    variacao = banco.distribuicao(escola='EM Centro', turma='1A')['rodadas'][1]['variacao']
+    assert variacao['Silábico com valor sonoro'] == 100.0
+
+
+def test_reanalise_do_mesmo_aluno_conta_uma_vez(banco):
+    primeira = registrar(aluno='Ana', hipotese='Pré-Silábico')
+    gravar_fila()
+    segunda = registrar(aluno='Ana', hipotese='Silábico com valor sonoro')
+    gravar_fila()
+    assert contagem(escola='EM Centro', turma='1A') == {1: {'Silábico com valor sonoro': 1}}
+    assert (banco.obter(primeira)['atual'], banco.obter(segunda)['atual']) == (0, 1)
+
+
+def test_reanalise_no_mesmo_lote(banco):
+    registrar(aluno='Ana', hipotese='Pré-Silábico')
+    registrar(aluno='Ana', hipotese='Alfabético')
+    gravar_fila()
+    assert contagem(escola='EM Centro') == {1: {'Alfabético': 1}}
+
+
+def test_sondagem_antiga_gravada_depois_nao_conta(banco):
+    antiga = registrar(aluno='Ana', hipotese='Pré-Silábico')
+    itens_antigos = [banco._fila.get_nowait()]
+    registrar(aluno='Ana', hipotese='Alfabético')
+    gravar_fila()
+    banco._gravar(itens_antigos)
+    assert contagem(escola='EM Centro') == {1: {'Alfabético': 1}}
+    assert banco.obter(antiga)['atual'] == 0
+
+
+def test_sondagens_sem_nome_contam_uma_a_uma(banco):
+    registrar(aluno='', hipotese='Alfabético')
+    registrar(aluno='', hipotese='Alfabético')
+    gravar_fila()
+    assert contagem(escola='EM Centro') == {1: {'Alfabético': 2}}
+
+
+def test_hipoteses_invalidas_nao_entram(banco):
+    registrar(aluno='Ana', hipotese='Erro na Análise')
+    registrar(aluno='Bruno', hipotese=None)
+    registrar(aluno='Carla', hipotese='Alfabético')
+    gravar_fila()
+    assert contagem() == {1: {'Alfabético': 1}}
+
+
+def test_correcao_do_professor_move_o_aluno(banco):
+    sondagem_id = registrar(aluno='Ana', hipotese='Silábico com valor sonoro')
+    registrar(aluno='Bruno', hipotese='Silábico com valor sonoro')
+    gravar_fila()
+    banco.corrigir_hipotese(sondagem_id, 'Silábico-Alfabético')
+    assert contagem(escola='EM Centro', turma='1A') == {
+        1: {'Silábico com valor sonoro': 1, 'Silábico-Alfabético': 1}
+    }
+
+
+def test_correcao_de_sondagem_substituida_nao_muda_a_contagem(banco):
+    antiga = registrar(aluno='Ana', hipotese='Pré-Silábico')
+    registrar(aluno='Ana', hipotese='Alfabético')
+    gravar_fila()
+    banco.corrigir_hipotese(antiga, 'Silábico sem valor sonoro')
+    assert contagem(escola='EM Centro') == {1: {'Alfabético': 1}}
+
+
+def test_correcao_de_analise_com_erro_passa_a_contar(banco):
+    sondagem_id = registrar(aluno='Ana', hipotese='Erro na Análise')
+    gravar_fila()
+    banco.corrigir_hipotese(sondagem_id, 'Alfabético')
+    assert contagem() == {1: {'Alfabético': 1}}
+
+
+def test_excluir_a_sondagem_atual_volta_a_anterior(banco):
+    registrar(aluno='Ana', hipotese='Pré-Silábico')
+    atual = registrar(aluno='Ana', hipotese='Alfabético')
+    gravar_fila()
+    conn = banco._conexao()
+    with conn:
+        conn.execute("DELETE FROM sondagens WHERE id = ?", (atual,))
+    assert contagem() == {1: {'Pré-Silábico': 1}}
+
+
+def test_serie_lida_da_turma(banco):
+    registrar(aluno='Ana', turma='1º Ano A', hipotese='Alfabético')
+    registrar(aluno='Bruno', turma='1º Ano B', hipotese='Pré-Silábico')
+    registrar(aluno='Carla', turma='2º Ano A', hipotese='Alfabético')
+    registrar(aluno='Davi', turma='Pré', serie='Infantil 5', hipotese='Pré-Silábico')
+    gravar_fila()
+
+    resumo = banco.distribuicao(escola='EM Centro')
+    assert sorted(resumo['series']) == ['1º ano', '2º ano', 'Infantil 5']
+    assert sorted(resumo['turmas']) == ['1º Ano A', '1º Ano B', '2º Ano A', 'Pré']
+    assert contagem(serie='1º ano') == {1: {'Alfabético': 1, 'Pré-Silábico': 1}}
+    assert [s['aluno'] for s in banco.listar(escola='EM Centro', serie='2º ano')] == ['Carla']
+
+
+@pytest.mark.parametrize('turma, serie', [
+    ('1º Ano B', '1º ano'), ('3o ano', '3º ano'), ('2ª série A', '2ª série'), ('2a serie', '2ª série'), ('Pré', ''),
+])
+def test_serie_da_turma(turma, serie):
+    assert armazenamento._serie_da_turma(turma) == serie
+
+
+def test_miniatura_por_foto(banco):
+    hash_ana, hash_bruno = 'a' * 64, 'b' * 64
+    assert banco.precisa_miniatura(hash_ana)
+    for aluno, hash_imagem in (('Ana', hash_ana), ('Bruno', hash_bruno)):
+        banco.registrar(
+            {'escola': 'EM Centro', 'turma': '1A', 'rodada': 1, 'aluno': aluno},
+            ['BOLA'], {'transcricao': 'BA', 'hipotese': 'Silábico com valor sonoro'},
+            hash_imagem=hash_imagem, miniatura=aluno.encode(),
+        )
+    gravar_fila()
+
+    assert banco.obter_miniatura(hash_ana) == b'Ana'
+    assert banco.obter_miniatura(hash_bruno) == b'Bruno'
+    assert not banco.precisa_miniatura(hash_ana)
+
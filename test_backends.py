@@ -0,0 +1,97 @@
+import pytest
+
+import backends
+import resiliencia
+
+
+class BackendRoteiro(backends.Backend):
+    """Backend de teste: responde com o próprio nome, ou falha, e anota cada chamada."""
+
+    def __init__(self, nome, chamadas, falhar=False, reserva=False, aceita_imagem=True):
+        super().__init__(resiliencia.Disjuntor(2, 60))
+        self.nome = nome
+        self.modelo_texto = f'{nome}-1'
+        self.chamadas = chamadas
+        self.falhar = falhar
+        self.reserva = reserva
+        self.aceita_imagem = aceita_imagem
+
+    def gerar(self, instrucoes, conteudo, esquema=None):
+        self.chamadas.append(self.nome)
+        if self.falhar:
+            raise ValueError(f'{self.nome} fora do ar')
+        return backends.RespostaBackend(texto=self.nome, modelo=self.modelo_texto)
+
+
+@pytest.fixture
+def chamadas(monkeypatch):
+    monkeypatch.setattr(backends, '_backends', {})
+    monkeypatch.setattr(backends, 'ROTEADOR_EXPLORACAO', 0)
+    monkeypatch.setattr(backends, 'ROTEADOR_MIN_AMOSTRAS', 1)
+    monkeypatch.setattr(resiliencia, 'GEMINI_HEDGE', False)
+    return []
+
+
+def configurar(monkeypatch, chamadas, *especificacoes):
+    for nome, opcoes in especificacoes:
+        backends.registrar(BackendRoteiro(nome, chamadas, **opcoes))
+    monkeypatch.setattr(backends, 'ANALISE_BACKENDS', [nome for nome, _ in especificacoes])
+
+
+def test_usa_o_primeiro_da_lista(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('gemini', {}), ('openai', {}))
+    nome, resposta = backends.gerar('instrucoes', 'tarefa', 'classificacao')
+    assert (nome, resposta.texto, resposta.modelo) == ('gemini', 'gemini', 'gemini-1')
+    assert chamadas == ['gemini']
+
+
+def test_falha_passa_para_o_proximo(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('gemini', {'falhar': True}), ('openai', {}), ('local', {'reserva': True}))
+    nome, resposta = backends.gerar('instrucoes', 'tarefa', 'classificacao')
+    assert nome == 'openai'
+    assert resposta.texto == 'openai'
+    assert chamadas == ['gemini', 'openai']
+
+
+def test_reserva_so_depois_de_todos_os_principais(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas,
+               ('local', {'reserva': True}), ('gemini', {'falhar': True}), ('openai', {'falhar': True}))
+    assert backends.gerar('instrucoes', 'tarefa', 'classificacao')[0] == 'local'
+    assert chamadas == ['gemini', 'openai', 'local']
+
+
+def test_todos_falham_sobe_o_erro_do_ultimo(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('gemini', {'falhar': True}), ('openai', {'falhar': True}))
+    with pytest.raises(ValueError, match='openai fora do ar'):
+        backends.gerar('instrucoes', 'tarefa', 'classificacao')
+    assert chamadas == ['gemini', 'openai']
+
+
+def test_disjuntor_aberto_vai_para_o_fim_da_fila(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('gemini', {}), ('openai', {}))
+    for _ in range(2):
+        backends.obter('gemini').disjuntor.registrar_falha()
+    assert backends.obter('gemini').disjuntor.estado() == 'aberto'
+
+    assert backends.gerar('instrucoes', 'tarefa', 'classificacao')[0] == 'openai'
+    assert chamadas == ['openai']
+
+
+def test_mais_rapido_vai_na_frente(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('gemini', {}), ('openai', {}))
+    backends.obter('gemini').registrar(3.0, True)
+    backends.obter('openai').registrar(0.5, True)
+    assert [b.nome for b in backends._ordenar(backends.ativos())] == ['openai', 'gemini']
+
+
+def test_chamada_com_imagem_pula_quem_nao_le_imagens(monkeypatch, chamadas):
+    configurar(monkeypatch, chamadas, ('texto', {'aceita_imagem': False}), ('gemini', {}))
+    conteudo = ['leia a escrita', {'mime_type': 'image/jpeg', 'data': b'foto'}]
+    assert backends.gerar('instrucoes', conteudo, 'visao')[0] == 'gemini'
+    assert chamadas == ['gemini']
+
+
+def test_nenhum_backend_configurado(monkeypatch, chamadas):
+    monkeypatch.setattr(backends, 'ANALISE_BACKENDS', ['gemini'])
+    with pytest.raises(resiliencia.GeminiIndisponivel):
+        backends.gerar('instrucoes', 'tarefa', 'classificacao')
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import cache_analises
+
+RESULTADO = {"hipotese": "Silábico com valor sonoro", "justificativa": "Uma letra por sílaba."}
+
+
+def _chave(escrita='AAO', modelo='gemini-2.5-flash'):
+    return cache_analises.gerar_chave('cavalo', escrita, 'prompt', modelo)
+
+
+def test_gerar_chave():
+    assert _chave() == cache_analises.gerar_chave(' CAVALO ', 'aao', 'prompt', 'gemini-2.5-flash')
+    assert _chave() != _chave(escrita='AO')
+    assert _chave() != _chave(modelo='gpt-4.1-mini')
+    assert _chave() != cache_analises.gerar_chave('cavalo', 'AAO', 'outro prompt', 'gemini-2.5-flash')
+
+
+def test_miss_e_hit_na_memoria(cache_temporario):
+    assert cache_temporario.obter(_chave()) is None
+    cache_temporario.guardar(_chave(), RESULTADO)
+    assert cache_temporario.obter(_chave()) == RESULTADO
+
+    dados = cache_temporario.estatisticas()
+    assert (dados["misses"], dados["hits_memoria"], dados["hits_disco"]) == (1, 1, 0)
+    assert dados["taxa_acerto"] == 0.5
+
+
+def test_resultado_devolvido_e_uma_copia(cache_temporario):
+    cache_temporario.guardar(_chave(), RESULTADO)
+    cache_temporario.obter(_chave())["hipotese"] = "Alfabético"
+    assert cache_temporario.obter(_chave()) == RESULTADO
+
+
+def test_disco_compartilhado_entre_processos(cache_temporario):
+    cache_temporario.guardar(_chave(), RESULTADO)
+
+    # Memória vazia, como em outro worker do gunicorn: a leitura vem do disco e sobe para a memória
+    cache_temporario._memoria.clear()
+    assert cache_temporario.obter(_chave()) == RESULTADO
+    assert cache_temporario.obter(_chave()) == RESULTADO
+    dados = cache_temporario.estatisticas()
+    assert (dados["hits_disco"], dados["hits_memoria"]) == (1, 1)
+
+
+def test_disco_visto_por_outra_thread(cache_temporario):
+    cache_temporario.guardar(_chave(), RESULTADO)
+    cache_temporario._memoria.clear()
+
+    lidos = []
+    thread = threading.Thread(target=lambda: lidos.append(cache_temporario.obter(_chave())))
+    thread.start()
+    thread.join()
+    assert lidos == [RESULTADO]
+
+
+def test_entradas_expiram(cache_temporario, monkeypatch):
+    cache_temporario.guardar(_chave(), RESULTADO)
+    agora = time.time()
+    monkeypatch.setattr(cache_analises.time, 'time', lambda: agora + cache_analises.CACHE_TTL_SEGUNDOS + 1)
+    assert cache_temporario.obter(_chave()) is None
+    assert _chave() not in cache_temporario._memoria
+
+
+def _linhas_no_disco(cache):
+    conn = cache._conexao()
+    return conn.execute("SELECT (SELECT COUNT(*) FROM analises) + (SELECT COUNT(*) FROM transcricoes)").fetchone()[0]
+
+
+def test_entradas_vencidas_apagadas_do_disco(cache_temporario, monkeypatch):
+    monkeypatch.setattr(cache_analises, 'CACHE_LIMPEZA_A_CADA', 3)
+    cache_temporario.guardar(_chave('A'), RESULTADO)
+    cache_temporario.guardar_transcricao('a' * 64, None, 'AAO', ttl=60)
+    agora = time.time()
+    monkeypatch.setattr(cache_analises.time, 'time', lambda: agora + cache_analises.CACHE_TTL_SEGUNDOS + 1)
+
+    # A terceira gravação apaga as duas entradas vencidas e fica só ela
+    cache_temporario.guardar(_chave('AO'), RESULTADO)
+    assert _linhas_no_disco(cache_temporario) == 1
+
+
+def test_limpar_apaga_as_transcricoes_vencidas(cache_temporario, monkeypatch):
+    cache_temporario.guardar_transcricao('a' * 64, None, 'AAO', ttl=60)
+    cache_temporario.guardar_transcricao('b' * 64, None, 'BOA', ttl=3600)
+    agora = time.time()
+    monkeypatch.setattr(cache_analises.time, 'time', lambda: agora + 120)
+    cache_temporario.limpar()
+    assert cache_temporario.obter_transcricao('b' * 64) == 'BOA'
+    assert _linhas_no_disco(cache_temporario) == 1
+
+
+def test_lru_descarta_a_entrada_mais_antiga(cache_temporario, monkeypatch):
+    monkeypatch.setattr(cache_analises, 'CACHE_MEMORIA_MAX_ITENS', 2)
+    for escrita in ('A', 'AO', 'AAO'):
+        cache_temporario.guardar(_chave(escrita), RESULTADO)
+    assert list(cache_temporario._memoria) == [_chave('AO'), _chave('AAO')]
+
+
+def test_limpar_invalida_a_memoria_dos_outros_workers(cache_temporario, monkeypatch):
+    cache_temporario.guardar(_chave(), RESULTADO)
+    entrada = cache_temporario._memoria[_chave()]
+
+    assert cache_temporario.limpar() == 1
+
+    # Outro worker ainda tem a entrada na memória, da geração anterior
+    cache_temporario._memoria[_chave()] = entrada
+    assert cache_temporario.obter(_chave()) is None
+    assert cache_temporario._geracao["valor"] == 1
+
+
+def test_cache_desabilitado(cache_temporario, monkeypatch):
+    monkeypatch.setattr(cache_analises, 'CACHE_HABILITADO', False)
+    cache_temporario.guardar(_chave(), RESULTADO)
+    assert cache_temporario.obter(_chave()) is None
+    assert not cache_temporario._memoria
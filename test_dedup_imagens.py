@@ -0,0 +1,103 @@
+import io
+import random
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+import dedup_imagens
+
+
+@pytest.fixture(autouse=True)
+def indice_vazio(cache_temporario, monkeypatch):
+    monkeypatch.setattr(dedup_imagens, 'DEDUP_HABILITADO', True)
+    monkeypatch.setattr(dedup_imagens, '_estatisticas', {"hits": 0, "hits_parecidas": 0, "misses": 0})
+
+
+def folha(semente, tamanho=(800, 1000), qualidade=90):
+    """Foto de uma folha pautada do mesmo modelo, com a escrita de uma criança (semente)."""
+    img = Image.new('L', (800, 1000), 235)
+    desenho = ImageDraw.Draw(img)
+    desenho.rectangle([40, 20, 760, 90], outline=60, width=4)
+    for y in range(120, 1000, 120):
+        desenho.line([(40, y), (760, y)], fill=120, width=3)
+    aleatorio = random.Random(semente)
+    for linha in range(6):
+        for letra in range(aleatorio.randint(3, 7)):
+            x, y = 80 + letra * 70, 150 + linha * 120
+            desenho.line([(x + aleatorio.randint(0, 50), y + aleatorio.randint(0, 60)) for _ in range(5)],
+                         fill=20, width=6)
+    saida = io.BytesIO()
+    img.resize(tamanho).convert('RGB').save(saida, 'JPEG', quality=qualidade)
+    return saida.getvalue()
+
+
+def registrar(dados, transcricao):
+    dedup_imagens.registrar(
+        dedup_imagens.calcular_hash(dados), dedup_imagens.calcular_assinatura(dados), transcricao
+    )
+
+
+def buscar(dados):
+    return dedup_imagens.buscar(dedup_imagens.calcular_hash(dados), dedup_imagens.calcular_assinatura(dados))
+
+
+def test_calcular_hash():
+    assert dedup_imagens.calcular_hash(b'foto') == dedup_imagens.calcular_hash(b'foto')
+    assert dedup_imagens.calcular_hash(b'foto') != dedup_imagens.calcular_hash(b'foto2')
+    assert len(dedup_imagens.calcular_hash(b'foto')) == 64
+    assert dedup_imagens.calcular_hash(b'') is None
+
+
+def test_calcular_assinatura():
+    assinatura = dedup_imagens.calcular_assinatura(folha(1))
+    assert len(assinatura) == 16 * dedup_imagens.DEDUP_REGIOES ** 2
+    assert dedup_imagens.distancia(assinatura, assinatura) == 0
+    assert dedup_imagens.calcular_assinatura(b'nao e imagem') is None
+
+
+def test_mesma_foto_reaproveita_a_transcricao():
+    registrar(folha(1), 'CVLO, BOA')
+    assert buscar(folha(1)) == 'CVLO, BOA'
+    assert dedup_imagens.estatisticas()['hits'] == 1
+
+
+def test_foto_quase_igual_reaproveita_a_transcricao():
+    registrar(folha(1), 'CVLO, BOA')
+    assert buscar(folha(1, tamanho=(600, 750), qualidade=60)) == 'CVLO, BOA'
+    assert dedup_imagens.estatisticas()['hits_parecidas'] == 1
+
+
+def test_outra_crianca_no_mesmo_modelo_de_folha_nao_reaproveita():
+    registrar(folha(1), 'CVLO, BOA')
+    for semente in range(2, 8):
+        assert buscar(folha(semente)) is None
+
+
+def test_distancia_maxima_negativa_aceita_so_a_foto_identica(monkeypatch):
+    monkeypatch.setattr(dedup_imagens, 'DEDUP_DISTANCIA_MAXIMA', -1)
+    registrar(folha(1), 'CVLO, BOA')
+    assert buscar(folha(1, qualidade=60)) is None
+    assert buscar(folha(1)) == 'CVLO, BOA'
+
+
+def test_transcricao_vista_por_outro_worker(cache_temporario, monkeypatch):
+    registrar(folha(1), 'CVLO, BOA')
+    cache_temporario._local.conn.close()
+    # Outro worker: conexão nova com o mesmo banco
+    monkeypatch.setattr(cache_temporario, '_local', threading.local())
+    assert buscar(folha(1)) == 'CVLO, BOA'
+
+
+def test_entradas_expiram(monkeypatch):
+    registrar(folha(1), 'CVLO')
+    agora = dedup_imagens.cache_analises.time.time()
+    monkeypatch.setattr(dedup_imagens.cache_analises.time, 'time',
+                        lambda: agora + dedup_imagens.DEDUP_TTL_SEGUNDOS + 1)
+    assert buscar(folha(1)) is None
+
+
+def test_desabilitado(monkeypatch):
+    registrar(folha(1), 'CVLO')
+    monkeypatch.setattr(dedup_imagens, 'DEDUP_HABILITADO', False)
+    assert buscar(folha(1)) is None
@@ -0,0 +1,76 @@
+import pytest
+
+import limitador
+
+
+@pytest.fixture
+def limite(tmp_path, monkeypatch):
+    """Limitador com arquivo de estado próprio e relógio controlado pelo teste."""
+    agora = {"valor": 1000.0}
+    esperas = []
+
+    def dormir(segundos):
+        esperas.append(segundos)
+        agora["valor"] += segundos
+
+    monkeypatch.setattr(limitador, 'LIMITE_ARQUIVO', str(tmp_path / 'limite.bin'))
+    monkeypatch.setattr(limitador, '_arquivo', {"fd": None, "pid": None})
+    monkeypatch.setattr(limitador, 'LIMITE_RPM', 60)
+    monkeypatch.setattr(limitador, 'LIMITE_TPM', 6000)
+    monkeypatch.setattr(limitador, 'LIMITE_ESPERA_MAXIMA', 30)
+    monkeypatch.setattr(limitador.time, 'time', lambda: agora["valor"])
+    monkeypatch.setattr(limitador.time, 'sleep', dormir)
+    yield esperas
+    if limitador._arquivo["fd"] is not None:
+        limitador.os.close(limitador._arquivo["fd"])
+
+
+def test_balde_cheio_nao_espera(limite):
+    limitador.adquirir(100)
+    assert limite == []
+    estado = limitador.estado()
+    assert estado["requisicoes_disponiveis"] == 59
+    assert estado["tokens_disponiveis"] == 5900
+
+
+def test_sem_fichas_de_requisicao_espera_o_reabastecimento(limite):
+    for _ in range(60):
+        limitador.adquirir(1)
+    limitador.adquirir(1)
+    # 60 RPM: uma ficha por segundo
+    assert sum(limite) == pytest.approx(1.0)
+
+
+def test_sem_fichas_de_token_espera_o_reabastecimento(limite):
+    limitador.adquirir(6000)
+    limitador.adquirir(300)
+    # 6000 TPM: 100 tokens por segundo
+    assert sum(limite) == pytest.approx(3.0)
+
+
+def test_espera_maior_que_o_prazo_recusa(limite):
+    limitador.adquirir(6000)
+    with pytest.raises(limitador.LimiteExcedido):
+        limitador.adquirir(6000, espera_maxima=5)
+    assert limite == []
+
+
+def test_chamada_maior_que_o_balde_reserva_o_balde(limite):
+    limitador.adquirir(10 ** 6)
+    assert limitador.estado()["tokens_disponiveis"] == 0
+
+
+def test_acertar_devolve_a_diferenca(limite):
+    limitador.adquirir(1000)
+    limitador.acertar(1000, 400)
+    assert limitador.estado()["tokens_disponiveis"] == 5600
+
+    limitador.acertar(400, 1400)
+    assert limitador.estado()["tokens_disponiveis"] == 4600
+
+
+def test_desabilitado(limite, monkeypatch):
+    monkeypatch.setattr(limitador, 'LIMITE_RPM', 0)
+    monkeypatch.setattr(limitador, 'LIMITE_TPM', 0)
+    limitador.adquirir(10 ** 9)
+    assert limitador.estado() == {"habilitado": False}
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+from PIL import Image
+
+import preprocessamento
+
+
+@pytest.fixture(autouse=True)
+def sem_recorte(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_PREPROCESSAR', True)
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_RECORTAR_MARGENS', False)
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_TONS_DE_CINZA', True)
+
+
+def jpeg(largura, altura, orientacao=None):
+    """Foto com uma faixa escura na borda esquerda (como foi gravada pelo sensor)."""
+    img = Image.new('RGB', (largura, altura), (240, 240, 240))
+    img.paste((20, 20, 20), (0, 0, largura // 4, altura))
+    exif = Image.Exif()
+    if orientacao:
+        exif[274] = orientacao
+    saida = io.BytesIO()
+    img.save(saida, 'JPEG', quality=90, exif=exif)
+    return saida.getvalue()
+
+
+def abrir(dados):
+    return Image.open(io.BytesIO(dados))
+
+
+def test_reduz_ate_a_aresta_maxima(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_ARESTA_MAXIMA', 400)
+    dados, mime_type, relatorio = preprocessamento.preprocessar_imagem(jpeg(1600, 1200))
+    assert mime_type == 'image/jpeg'
+    assert abrir(dados).size == (400, 300)
+    assert abrir(dados).mode == 'L'
+    assert relatorio['dimensoes_originais'] == [1600, 1200]
+    assert relatorio['dimensoes_finais'] == [400, 300]
+    assert relatorio['bytes_economizados'] == relatorio['bytes_originais'] - relatorio['bytes_finais'] > 0
+
+
+def test_imagem_pequena_nao_e_ampliada(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_ARESTA_MAXIMA', 400)
+    dados, _, _ = preprocessamento.preprocessar_imagem(jpeg(300, 200))
+    assert abrir(dados).size == (300, 200)
+
+
+def test_aplica_a_orientacao_exif():
+    # Orientação 6: a foto foi tirada com o celular em pé e precisa girar 90° no sentido horário
+    dados, _, relatorio = preprocessamento.preprocessar_imagem(jpeg(400, 200, orientacao=6))
+    img = abrir(dados)
+    assert img.size == (200, 400)
+    assert relatorio['dimensoes_finais'] == [200, 400]
+    # A faixa da borda esquerda passa para o topo
+    assert img.getpixel((100, 20)) < 80
+    assert img.getpixel((100, 380)) > 180
+    assert 274 not in img.getexif()
+
+
+def test_recorta_as_margens_do_papel(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_RECORTAR_MARGENS', True)
+    img = Image.new('L', (1000, 800), 235)
+    img.paste(20, (400, 300, 600, 500))
+    saida = io.BytesIO()
+    img.save(saida, 'PNG')
+    dados, _, relatorio = preprocessamento.preprocessar_imagem(saida.getvalue())
+    largura, altura = relatorio['dimensoes_finais']
+    assert 200 <= largura < 300 and 200 <= altura < 300
+
+
+def test_limite_de_bytes_reduz_a_qualidade(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_MAX_BYTES', 1)
+    _, _, relatorio = preprocessamento.preprocessar_imagem(jpeg(400, 300))
+    assert relatorio['qualidade'] == preprocessamento.IMAGEM_QUALIDADE_MINIMA
+
+
+def test_pixels_demais(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_MAX_PIXELS', 100 * 100)
+    with pytest.raises(ValueError, match='muito grande'):
+        preprocessamento.preprocessar_imagem(jpeg(200, 100))
+
+
+def test_arquivo_que_nao_e_imagem():
+    with pytest.raises(ValueError, match='Não foi possível abrir'):
+        preprocessamento.preprocessar_imagem(b'nao e imagem')
+
+
+def test_desabilitado_devolve_a_foto_original(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'IMAGEM_PREPROCESSAR', False)
+    original = jpeg(400, 300)
+    dados, mime_type, relatorio = preprocessamento.preprocessar_imagem(original)
+    assert dados == original
+    assert mime_type == 'image/jpeg'
+    assert relatorio['bytes_economizados'] == 0
+
+
+def test_miniatura_respeita_a_aresta_e_a_orientacao(monkeypatch):
+    monkeypatch.setattr(preprocessamento, 'MINIATURA_ARESTA', 100)
+    miniatura = abrir(preprocessamento.gerar_miniatura(jpeg(400, 200, orientacao=6)))
+    assert miniatura.format == 'JPEG'
+    assert miniatura.size == (50, 100)
+    assert preprocessamento.gerar_miniatura(b'nao e imagem') is None
@@ -0,0 +1,80 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import relatorios
+
+pytestmark = pytest.mark.skipif(not relatorios.PDF_DISPONIVEL, reason="reportlab não instalado")
+
+
+def sondagem(aluno, hipotese='Silábico com valor sonoro', **campos):
+    return dict({
+        'aluno': aluno, 'escola': 'EM Centro', 'turma': '1A', 'rodada': 1, 'professor': 'Rita',
+        'data': '2026-03-10', 'palavras_ditadas': ['CAVALO', 'BOLA'], 'transcricao': 'AO, BA',
+        'hipotese': hipotese, 'hipotese_professor': None, 'justificativa': 'Uma letra por sílaba.',
+        'analises_individuais': [{'palavra': 'CAVALO', 'escrita': 'AO', 'hipotese': hipotese, 'justificativa': 'ok'}],
+        'hash_imagem': f'hash-{aluno}',
+    }, **campos)
+
+
+def miniatura(hash_imagem):
+    saida = io.BytesIO()
+    Image.new('RGB', (80, 60), (200, 200, 200)).save(saida, 'JPEG')
+    return saida.getvalue()
+
+
+@pytest.fixture
+def pool_na_thread(monkeypatch):
+    """Renderiza numa thread deste processo, sem subir o pool de processos."""
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(relatorios, '_obter_pool', lambda: executor)
+    yield
+    executor.shutdown()
+
+
+def test_zip_com_um_pdf_por_aluno(pool_na_thread):
+    sondagens = [sondagem('Ana'), sondagem('Beto'), sondagem('')]
+    pedidas = []
+
+    def obter_miniatura(hash_imagem):
+        pedidas.append(hash_imagem)
+        return miniatura(hash_imagem)
+
+    dados = b''.join(relatorios.gerar_zip(sondagens, obter_miniatura))
+    with zipfile.ZipFile(io.BytesIO(dados)) as arquivo_zip:
+        assert arquivo_zip.namelist() == ['01 - Ana.pdf', '02 - Beto.pdf', '03 - Aluno sem nome.pdf']
+        for nome in arquivo_zip.namelist():
+            assert arquivo_zip.read(nome).startswith(b'%PDF')
+    assert pedidas == ['hash-Ana', 'hash-Beto', 'hash-']
+
+
+def test_caderno_com_uma_pagina_por_aluno(pool_na_thread):
+    pdf = relatorios.gerar_caderno([sondagem('Ana'), sondagem('Beto')], lambda hash_imagem: None)
+    assert pdf.startswith(b'%PDF')
+    assert pdf.count(b'/Type /Page\n') == 2
+
+
+def test_renderizar_no_pool_de_processos():
+    pdf = relatorios.gerar_caderno([sondagem('Ana', hipotese_professor='Alfabético')], miniatura)
+    assert pdf.startswith(b'%PDF')
+
+
+def test_renderizar_escapa_o_texto_do_aluno():
+    pdf = relatorios._renderizar([(sondagem('Ana <b>&', justificativa='A < B'), None)])
+    assert pdf.startswith(b'%PDF')
+
+
+def test_mais_recentes_fica_com_a_ultima_de_cada_aluno():
+    antiga, nova = sondagem('ana', hipotese='Pré-Silábico'), sondagem('ana', hipotese='Alfabético')
+    resultado = relatorios.mais_recentes([antiga, sondagem('Beto'), nova, sondagem('')])
+    assert [s['aluno'] for s in resultado] == ['ana', 'Beto', '']
+    assert resultado[0] is nova
+
+
+def test_nome_arquivo():
+    assert relatorios.nome_arquivo('João/Maria: 1º ano') == 'João_Maria_ 1º ano'
+    assert relatorios.nome_arquivo('///') == '_'
+    assert relatorios.nome_arquivo('') == 'sem_nome'
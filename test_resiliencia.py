@@ -0,0 +1,134 @@
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import limitador
+import resiliencia
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio controlado pelo teste (time.time do módulo)."""
+    agora = {"valor": 1000.0}
+    monkeypatch.setattr(resiliencia.time, 'time', lambda: agora["valor"])
+    return agora
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(resiliencia.time, 'sleep', lambda segundos: None)
+    monkeypatch.setattr(resiliencia, 'GEMINI_HEDGE', False)
+
+
+def _abrir(disjuntor):
+    for _ in range(disjuntor.limite_falhas):
+        disjuntor.registrar_falha()
+
+
+def _falhar(erro):
+    def chamada():
+        raise erro
+    return chamada
+
+
+def test_disjuntor_abre_depois_do_limite_de_falhas(relogio):
+    disjuntor = resiliencia.Disjuntor(3, 30)
+    disjuntor.registrar_falha()
+    disjuntor.registrar_falha()
+    assert disjuntor.estado() == 'fechado' and disjuntor.permitir()
+
+    disjuntor.registrar_falha()
+    assert disjuntor.estado() == 'aberto'
+    assert not disjuntor.permitir()
+
+
+def test_sucesso_zera_as_falhas_seguidas(relogio):
+    disjuntor = resiliencia.Disjuntor(2, 30)
+    disjuntor.registrar_falha()
+    disjuntor.registrar_sucesso()
+    disjuntor.registrar_falha()
+    assert disjuntor.estado() == 'fechado'
+
+
+def test_meio_aberto_permite_uma_chamada_de_teste(relogio):
+    disjuntor = resiliencia.Disjuntor(2, 30)
+    _abrir(disjuntor)
+    relogio["valor"] += 31
+    assert disjuntor.estado() == 'meio_aberto'
+    assert disjuntor.permitir()
+    assert not disjuntor.permitir()
+
+    disjuntor.registrar_sucesso()
+    assert disjuntor.estado() == 'fechado'
+
+
+def test_falha_no_teste_reabre(relogio):
+    disjuntor = resiliencia.Disjuntor(2, 30)
+    _abrir(disjuntor)
+    relogio["valor"] += 31
+    assert disjuntor.permitir()
+    disjuntor.registrar_falha()
+    assert disjuntor.estado() == 'aberto'
+    assert not disjuntor.permitir()
+
+
+def test_executar_tenta_de_novo_erros_passageiros():
+    disjuntor = resiliencia.Disjuntor(5, 30)
+    respostas = [google_exceptions.ServiceUnavailable('503'), 'ok']
+
+    def chamada():
+        resposta = respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    assert resiliencia.executar(chamada, disjuntor=disjuntor, tentativas=3) == 'ok'
+    assert disjuntor.estado() == 'fechado'
+
+
+def test_executar_esgota_as_tentativas():
+    disjuntor = resiliencia.Disjuntor(5, 30)
+    with pytest.raises(resiliencia.GeminiIndisponivel):
+        resiliencia.executar(_falhar(google_exceptions.TooManyRequests('429')), disjuntor=disjuntor, tentativas=2)
+
+
+def test_erro_definitivo_sobe_sem_nova_tentativa():
+    disjuntor = resiliencia.Disjuntor(1, 30)
+    chamadas = []
+
+    def chamada():
+        chamadas.append(1)
+        raise google_exceptions.InvalidArgument('chave inválida')
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        resiliencia.executar(chamada, disjuntor=disjuntor, tentativas=3)
+    assert len(chamadas) == 1
+    assert disjuntor.estado() == 'fechado'
+
+
+def test_disjuntor_aberto_recusa_na_hora(relogio):
+    disjuntor = resiliencia.Disjuntor(1, 30)
+    disjuntor.registrar_falha()
+    with pytest.raises(resiliencia.GeminiIndisponivel):
+        resiliencia.executar(lambda: 'ok', disjuntor=disjuntor)
+
+
+def test_cota_local_esgotada_no_teste_libera_o_disjuntor(relogio):
+    disjuntor = resiliencia.Disjuntor(2, 30)
+    _abrir(disjuntor)
+    relogio["valor"] += 31
+
+    with pytest.raises(limitador.LimiteExcedido):
+        resiliencia.executar(_falhar(limitador.LimiteExcedido('cota')), disjuntor=disjuntor)
+
+    # A chamada de teste não chegou ao Gemini: a próxima pode testar de novo
+    assert disjuntor.estado() == 'meio_aberto'
+    assert resiliencia.executar(lambda: 'ok', disjuntor=disjuntor) == 'ok'
+    assert disjuntor.estado() == 'fechado'
+
+
+def test_erro_passageiro_reconhecido_pelo_codigo():
+    class ErroHttp(Exception):
+        status_code = 503
+
+    assert resiliencia.erro_passageiro(ErroHttp())
+    assert not resiliencia.erro_passageiro(ValueError())
@@ -0,0 +1,43 @@
+import pytest
+
+import silabas
+
+
+@pytest.mark.parametrize('palavra, esperado', [
+    ('CAVALO', ('CA', 'VA', 'LO')),
+    ('galinha', ('GA', 'LI', 'NHA')),
+    ('CARRO', ('CAR', 'RO')),
+    ('PASSARINHO', ('PAS', 'SA', 'RI', 'NHO')),
+    ('QUEIJO', ('QUEI', 'JO')),
+    ('BICICLETA', ('BI', 'CI', 'CLE', 'TA')),
+    ('SAÚDE', ('SA', 'Ú', 'DE')),
+    ('MÃO', ('MÃO',)),
+])
+def test_separar_silabas(palavra, esperado):
+    assert silabas.separar_silabas(palavra) == esperado
+
+
+def test_silaba_tonica():
+    assert silabas.analisar_palavra('CAVALO').tonica == 1
+    assert silabas.analisar_palavra('PÁSSARO').tonica == 0
+    assert silabas.analisar_palavra('BORBOLETA').tonica == 2
+
+
+def test_forma_fonetica_ignora_diferencas_ortograficas():
+    assert silabas.forma_fonetica('CAVALO') == silabas.forma_fonetica('KAVALU')
+    assert silabas.forma_fonetica('CAVALO') != silabas.forma_fonetica('CAVALA')
+
+
+def test_normalizar_remove_o_que_nao_e_letra():
+    assert silabas.normalizar(' bola1! ') == 'BOLA'
+
+
+def test_descrever():
+    assert silabas.analisar_palavra('CAVALO').descrever() == 'CA-VA-LO (3 sílabas)'
+    assert silabas.descrever_ditado('O GATO') == 'O (1 sílaba) / GA-TO (2 sílabas)'
+
+
+def test_analisar_palavras_divide_frases():
+    estruturas = silabas.analisar_palavras(['BOLA', 'O GATO'])
+    assert [len(item) for item in estruturas] == [1, 2]
+    assert estruturas[1][1].num_silabas == 2
@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import tarefas
+
+
+@pytest.fixture
+def fila(tmp_path, monkeypatch):
+    """Fila de tarefas num banco temporário, com relógio controlado pelo teste."""
+    agora = {"valor": 1000.0}
+    monkeypatch.setattr(tarefas, 'TAREFAS_DB_PATH', str(tmp_path / 'tarefas.sqlite3'))
+    monkeypatch.setattr(tarefas, '_local', threading.local())
+    monkeypatch.setattr(tarefas.time, 'time', lambda: agora["valor"])
+    yield agora
+    conn = getattr(tarefas._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+
+
+def imagem_guardada(tarefa_id):
+    return tarefas._conexao().execute("SELECT imagem FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()[0]
+
+
+def test_tarefa_concluida(fila):
+    tarefa_id = tarefas.criar_tarefa({'palavras_ditadas': 'CAVALO'}, b'foto')
+    assert tarefas.consultar_tarefa(tarefa_id)['status'] == tarefas.STATUS_PENDENTE
+    vistos = []
+
+    def processar(dados, imagem, progresso):
+        vistos.append((dados, imagem))
+        progresso({'transcricao': 'CAVLO', 'etapa': 'transcricao'})
+        tarefa = tarefas.consultar_tarefa(tarefa_id)
+        assert tarefa['status'] == tarefas.STATUS_PROCESSANDO
+        assert tarefa['parcial'] == {'transcricao': 'CAVLO', 'etapa': 'transcricao'}
+        return {'hipotese': 'Alfabético'}, 200
+
+    assert tarefas._processar_proxima(processar)
+    assert vistos == [({'palavras_ditadas': 'CAVALO'}, b'foto')]
+
+    tarefa = tarefas.consultar_tarefa(tarefa_id)
+    assert tarefa['status'] == tarefas.STATUS_CONCLUIDA
+    assert tarefa['resultado'] == {'hipotese': 'Alfabético'}
+    assert tarefa['status_http'] == 200
+    assert imagem_guardada(tarefa_id) is None
+    assert not tarefas._processar_proxima(processar)
+
+
+def test_tarefas_processadas_na_ordem_de_chegada(fila):
+    primeira = tarefas.criar_tarefa({'n': 1})
+    fila["valor"] += 1
+    segunda = tarefas.criar_tarefa({'n': 2})
+    ordem = []
+
+    def processar(dados, imagem, progresso):
+        ordem.append(dados['n'])
+        return {}, 200
+
+    while tarefas._processar_proxima(processar):
+        pass
+    assert ordem == [1, 2]
+    assert tarefas.consultar_tarefa(primeira)['status'] == tarefas.consultar_tarefa(segunda)['status'] == 'concluida'
+
+
+def test_erro_do_cliente_conclui_a_tarefa(fila):
+    tarefa_id = tarefas.criar_tarefa({})
+    tarefas._processar_proxima(lambda dados, imagem, progresso: ({'error': 'Nenhuma palavra'}, 400))
+    tarefa = tarefas.consultar_tarefa(tarefa_id)
+    assert tarefa['status'] == tarefas.STATUS_CONCLUIDA
+    assert tarefa['status_http'] == 400
+
+
+def test_excecao_no_processamento_registra_o_erro(fila):
+    tarefa_id = tarefas.criar_tarefa({}, b'foto')
+
+    def processar(dados, imagem, progresso):
+        raise RuntimeError('Gemini fora do ar')
+
+    assert tarefas._processar_proxima(processar)
+    tarefa = tarefas.consultar_tarefa(tarefa_id)
+    assert tarefa['status'] == tarefas.STATUS_ERRO
+    assert tarefa['status_http'] == 500
+    assert 'Gemini fora do ar' in tarefa['resultado']['error']
+    assert imagem_guardada(tarefa_id) is None
+
+
+def test_tarefa_abandonada_volta_para_a_fila(fila):
+    tarefa_id = tarefas.criar_tarefa({})
+    assert tarefas._reservar_proxima()[0] == tarefa_id
+    # Worker morreu no meio: ainda dentro do tempo limite, ninguém pega a tarefa
+    assert tarefas._reservar_proxima() is None
+
+    fila["valor"] += tarefas.TAREFAS_TEMPO_LIMITE + 1
+    assert tarefas._reservar_proxima()[0] == tarefa_id
+    tentativas = tarefas._conexao().execute("SELECT tentativas FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()[0]
+    assert tentativas == 2
+
+
+def test_tarefa_desiste_apos_o_maximo_de_tentativas(fila, monkeypatch):
+    monkeypatch.setattr(tarefas, 'TAREFAS_MAX_TENTATIVAS', 2)
+    tarefa_id = tarefas.criar_tarefa({}, b'foto')
+    for _ in range(2):
+        assert tarefas._reservar_proxima()[0] == tarefa_id
+        fila["valor"] += tarefas.TAREFAS_TEMPO_LIMITE + 1
+
+    assert tarefas._reservar_proxima() is None
+    tarefa = tarefas.consultar_tarefa(tarefa_id)
+    assert tarefa['status'] == tarefas.STATUS_ERRO
+    assert tarefa['status_http'] == 500
+    assert tarefa['resultado'] == {'error': 'A análise falhou após várias tentativas.'}
+    assert imagem_guardada(tarefa_id) is None
+
+
+def test_limpar_antigas_mantem_as_pendentes(fila):
+    concluida = tarefas.criar_tarefa({})
+    tarefas._processar_proxima(lambda dados, imagem, progresso: ({}, 200))
+    pendente = tarefas.criar_tarefa({})
+
+    fila["valor"] += tarefas.TAREFAS_RETENCAO_SEGUNDOS + 1
+    tarefas._limpar_antigas()
+    assert tarefas.consultar_tarefa(concluida) is None
+    assert tarefas.consultar_tarefa(pendente)['status'] == tarefas.STATUS_PENDENTE
+
+
+def test_consultar_tarefa_inexistente(fila):
+    assert tarefas.consultar_tarefa('nao-existe') is None
@@ -0,0 +1,65 @@
+import pytest
+
+import triagem
+
+
+def _classificar(palavra, escrita):
+    resultado = triagem.classificar_localmente(palavra, escrita)
+    return resultado['hipotese'], resultado['confianca']
+
+
+@pytest.mark.parametrize('palavra, escrita, hipotese', [
+    ('CAVALO', 'CAVALO', 'Alfabético'),
+    ('CAVALO', 'cavalo', 'Alfabético'),
+    ('CAVALO', 'KAVALU', 'Alfabético'),
+    ('CAVALO', 'AAO', 'Silábico com valor sonoro'),
+    ('CAVALO', 'AO', 'Silábico com valor sonoro'),
+    ('CAVALO', 'CAO', 'Silábico com valor sonoro'),
+    ('CAVALO', 'CVO', 'Silábico com valor sonoro'),
+    ('CAVALO', 'XPT', 'Silábico sem valor sonoro'),
+    ('CAVALO', 'AAAA', 'Pré-Silábico'),
+    ('CAVALO', '???', 'Pré-Silábico'),
+    ('CAVALO', '123', 'Pré-Silábico'),
+    ('CAVALO', '', 'Pré-Silábico'),
+])
+def test_casos_evidentes_sao_decididos_localmente(palavra, escrita, hipotese):
+    assert triagem.triar(palavra, escrita)['hipotese'] == hipotese
+
+
+@pytest.mark.parametrize('palavra, escrita', [
+    ('BOLA', 'BOLA1'),
+    ('BOLA', '1BOLA'),
+    ('CAVALO', 'AO1'),
+    ('O GATO', 'OGATO'),
+])
+def test_letras_com_numeros_e_frases_ficam_para_a_ia(palavra, escrita):
+    assert _classificar(palavra, escrita) == (None, 0.0)
+    assert triagem.triar(palavra, escrita) is None
+
+
+@pytest.mark.parametrize('palavra, escrita', [
+    ('BOLA', 'B'),
+    ('SOL', 'S'),
+])
+def test_uma_letra_so_fica_abaixo_do_limiar(palavra, escrita):
+    hipotese, confianca = _classificar(palavra, escrita)
+    assert hipotese == 'Silábico com valor sonoro'
+    assert confianca < triagem.TRIAGEM_LIMIAR_CONFIANCA
+    assert triagem.triar(palavra, escrita) is None
+
+
+def test_silabico_decidido_so_com_uma_letra_por_silaba():
+    for palavra, escrita in [('CAVALO', 'AAO'), ('CAVALO', 'XPT'), ('BOLA', 'OA')]:
+        resultado = triagem.classificar_localmente(palavra, escrita)
+        if resultado['hipotese'].startswith('Silábico') and resultado['confianca'] >= triagem.TRIAGEM_LIMIAR_CONFIANCA:
+            assert len(escrita) == len(triagem.silabas_ptbr.separar_silabas(palavra))
+
+
+def test_transicao_fica_para_a_ia():
+    assert triagem.classificar_localmente('CAVALO', 'CVLO')['hipotese'] == 'Silábico-Alfabético'
+    assert triagem.triar('CAVALO', 'CVLO') is None
+
+
+def test_triagem_desabilitada(monkeypatch):
+    monkeypatch.setattr(triagem, 'TRIAGEM_HABILITADA', False)
+    assert triagem.triar('CAVALO', 'CAVALO') is None
@@ -0,0 +1,176 @@
+"""
+Triagem local das hipóteses de escrita.
+Classificador determinístico, baseado nos mesmos critérios de Ferreiro e Teberosky
+descritos no SYSTEM_PROMPT, que resolve os casos evidentes sem chamar o Gemini.
+
+Cada classificação vem com uma confiança entre 0 e 1. Só os casos com confiança
+abaixo de TRIAGEM_LIMIAR_CONFIANCA são encaminhados para a IA.
+"""
+
+import os
+import re
+import unicodedata
+
+import metricas
+import silabas as silabas_ptbr
+
+# Configurações da triagem
+TRIAGEM_HABILITADA = os.environ.get('TRIAGEM_HABILITADA', '1') == '1'
+TRIAGEM_LIMIAR_CONFIANCA = float(os.environ.get('TRIAGEM_LIMIAR_CONFIANCA', '0.9'))
+
+# Equivalências sonoras aceitas ao comparar uma letra com a sílaba (ex.: K no lugar de C)
+_EQUIVALENCIAS = {
+    'K': 'CQ', 'C': 'KQS', 'Q': 'CK', 'S': 'CZ', 'Z': 'S',
+    'U': 'OL', 'O': 'U', 'I': 'EY', 'E': 'I', 'Y': 'I', 'W': 'VU', 'V': 'W',
+}
+
+
+def _normalizar(texto: str) -> str:
+    """Converte para maiúsculas e remove acentos (o Ç vira C)."""
+    texto = unicodedata.normalize('NFD', texto.strip().upper())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _letra_na_silaba(letra: str, silaba: str) -> bool:
+    """Verifica se a letra representa algum som da sílaba."""
+    return letra in silaba or any(eq in silaba for eq in _EQUIVALENCIAS.get(letra, ''))
+
+
+def _alinhamento_silabico(escrita: str, silabas: list) -> bool:
+    """
+    Verifica se cada letra da escrita corresponde a uma sílaba diferente da palavra,
+    na ordem em que as sílabas aparecem (uma letra por sílaba, com valor sonoro).
+    """
+    posicao = 0
+    for letra in escrita:
+        while posicao < len(silabas) and not _letra_na_silaba(letra, silabas[posicao]):
+            posicao += 1
+        if posicao == len(silabas):
+            return False
+        posicao += 1
+    return True
+
+
+def _subsequencia(escrita: str, palavra: str) -> bool:
+    """Verifica se as letras da escrita aparecem na palavra, na mesma ordem."""
+    restante = iter(palavra)
+    return all(letra in restante for letra in escrita)
+
+
+def _resultado(hipotese, justificativa: str, confianca: float) -> dict:
+    return {"hipotese": hipotese, "justificativa": justificativa, "confianca": confianca}
+
+
+def classificar_localmente(palavra_ditada: str, escrita_crianca: str) -> dict:
+    """
+    Classifica a escrita com regras determinísticas.
+
+    Args:
+        palavra_ditada: A palavra que foi ditada para a criança
+        escrita_crianca: O que a criança escreveu (já transcrito)
+
+    Returns:
+        dict: Dicionário com 'hipotese' (ou None), 'justificativa' e 'confianca' (0 a 1)
+    """
+    palavra = re.sub(r'[^A-Z]', '', _normalizar(palavra_ditada))
+    escrita_original = _normalizar(escrita_crianca)
+    escrita = re.sub(r'[^A-Z]', '', escrita_original)
+
+    # Frases ficam para a IA
+    if ' ' in palavra_ditada.strip():
+        return _resultado(None, "", 0.0)
+
+    # Sem nenhuma letra: só números, símbolos ou nada escrito
+    if not escrita:
+        return _resultado(
+            "Pré-Silábico",
+            "A criança usou números ou sinais no lugar de letras, sem relação com os sons da palavra.",
+            0.95
+        )
+
+    # Letras e números misturados (BOLA1) ficam para a IA
+    if any(c.isdigit() for c in escrita_original):
+        return _resultado(None, "", 0.0)
+
+    # Escrita idêntica à palavra ditada (ignorando acentos)
+    if escrita == palavra:
+        return _resultado(
+            "Alfabético",
+            f"A criança escreveu {palavra_ditada.strip().upper()} com todas as letras, representando cada som da palavra.",
+            1.0
+        )
+
+    # Mesmos sons com outra grafia (KAVALO, CAVALU): erro ortográfico, não de hipótese
+    if silabas_ptbr.forma_fonetica(escrita_crianca) == silabas_ptbr.forma_fonetica(palavra_ditada):
+        return _resultado(
+            "Alfabético",
+            "A criança representou todos os sons da palavra. As diferenças são apenas ortográficas, esperadas nesta fase.",
+            0.95
+        )
+
+    silabas = [_normalizar(silaba) for silaba in silabas_ptbr.separar_silabas(palavra_ditada)]
+    num_silabas = len(silabas)
+
+    # Nenhuma letra da escrita aparece na palavra
+    if not any(_letra_na_silaba(letra, palavra) for letra in escrita):
+        if len(escrita) == num_silabas and num_silabas > 1:
+            return _resultado(
+                "Silábico sem valor sonoro",
+                f"A criança usou uma letra para cada uma das {num_silabas} sílabas, mas as letras não têm relação com os sons da palavra.",
+                0.9
+            )
+        return _resultado(
+            "Pré-Silábico",
+            "As letras usadas não têm relação com os sons da palavra nem com o número de sílabas.",
+            0.9
+        )
+
+    # A mesma letra repetida, sem correspondência com as sílabas (ex.: AAAA)
+    if len(set(escrita)) == 1 and len(escrita) >= 3 and len(escrita) != num_silabas:
+        return _resultado(
+            "Pré-Silábico",
+            "A criança repetiu a mesma letra, sem relação com os sons ou com as sílabas da palavra.",
+            0.9
+        )
+
+    # Uma letra por sílaba, com valor sonoro (ex.: AO ou CAO para CAVALO)
+    if num_silabas - 1 <= len(escrita) <= num_silabas and _alinhamento_silabico(escrita, silabas):
+        confianca = 0.95 if len(escrita) == num_silabas else 0.9
+        if len(escrita) == 1:
+            # Uma letra só (B para BOLA, S para SOL) pode ser apenas uma omissão: fica para a IA
+            confianca = 0.75 if num_silabas > 1 else 0.6
+        return _resultado(
+            "Silábico com valor sonoro",
+            f"A criança usou no máximo uma letra por sílaba ({'-'.join(silabas)}), escolhendo letras que fazem parte dos sons da palavra.",
+            confianca
+        )
+
+    # Mais letras que sílabas, mas ainda faltando sons (ex.: CVLO para CAVALO)
+    if num_silabas < len(escrita) < len(palavra) and _subsequencia(escrita, palavra):
+        return _resultado(
+            "Silábico-Alfabético",
+            "A criança escreveu algumas sílabas completas e outras com apenas uma letra, em transição para a escrita alfabética.",
+            0.75
+        )
+
+    return _resultado(None, "", 0.0)
+
+
+def triar(palavra_ditada: str, escrita_crianca: str):
+    """
+    Retorna a classificação local quando ela é confiável o bastante.
+
+    Returns:
+        dict: Dicionário com 'hipotese' e 'justificativa', ou None se o caso
+              deve ser encaminhado para a IA
+    """
+    if not TRIAGEM_HABILITADA:
+        return None
+
+    resultado = classificar_localmente(palavra_ditada, escrita_crianca)
+    if resultado["hipotese"] is None or resultado["confianca"] < TRIAGEM_LIMIAR_CONFIANCA:
+        metricas.contar('triagem', resultado='encaminhada')
+        return None
+
+    metricas.contar('triagem', resultado='local')
+    return {"hipotese": resultado["hipotese"], "justificativa": resultado["justificativa"]}